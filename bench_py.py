@@ -0,0 +1,640 @@
+"""
+Офлайн-бенчмарки TelegramBot без Google и Telegram.
+
+Google Sheets заменяется FakeWorksheet, Bot API — FakeBot. У обоих
+настраивается задержка ответа, у FakeBot ещё доля ответов 429 (flood
+control), у листа — число строк. Сценарии вызывают настоящие обработчики
+TelegramBot с настоящими объектами Update и печатают перцентили времени.
+
+Примеры:
+
+    python bench_py.py
+    python bench_py.py --scenario load_schedule --rows 50000
+    python bench_py.py --scenario view_events wizard --events 5000 --sheets-latency 0.2
+    python bench_py.py --scenario publish --bot-latency 0.05 --rate-limit-share 0.05
+    python bench_py.py --scenario updates --updates 20000 --update-chats 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+# Лог бота не должен попадать в замеры; уровень можно вернуть через BOT_LOG_LEVEL
+os.environ.setdefault('BOT_LOG_LEVEL', 'ERROR')
+
+import pytz
+from telegram import (
+    Chat, ChatMemberAdministrator, ForumTopicClosed, ForumTopicCreated, ForumTopicEdited, ForumTopicReopened,
+    Message, Update, User,
+)
+from telegram.error import RetryAfter
+from telegram.ext import Application
+from telegram.warnings import PTBUserWarning
+
+import bot_py
+from bot_py import (
+    DEAD_LETTER_HEADERS, EVENT_HEADERS, TOPIC_HEADERS, MAIN_MENU, SELECT_CHAT, SELECT_TOPIC, ENTER_NAME,
+    SELECT_PERIOD, ENTER_START_DATE, ENTER_END_DATE, ENTER_TIME, ENTER_TEXT, CONFIRM_EVENT,
+    ScheduleState, SheetsBackend, TelegramBot,
+)
+
+# Предупреждение о per_message у ConversationHandler в замерах не нужно
+warnings.filterwarnings('ignore', category=PTBUserWarning)
+
+SCENARIOS = ('load_schedule', 'view_events', 'wizard', 'publish', 'updates')
+BENCH_USER_ID = 1000
+PERIODS = ('daily', 'weekly', 'monthly', 'every_3_days', 'weekdays_0,2,4')
+
+
+class FakeCell:
+    def __init__(self, row: int, col: int, value: str):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class FakeSpreadsheet:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.worksheets: List['FakeWorksheet'] = []
+
+    def batch_update(self, body: Dict):
+        time.sleep(self.latency)
+        for request in body.get('requests', []):
+            target = request.get('deleteDimension', {}).get('range')
+            if target is None:
+                continue
+            for worksheet in self.worksheets:
+                if worksheet.id == target['sheetId']:
+                    del worksheet.rows[target['startIndex'] - 1:target['endIndex'] - 1]
+
+
+class FakeWorksheet:
+    """
+    Лист gspread в памяти.
+
+    Каждый вызов API блокирует поток на latency секунд, как HTTP-запрос
+    настоящего gspread, и учитывается в calls.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, spreadsheet: FakeSpreadsheet, headers: List[str], rows: List[List] = None):
+        self.id = next(self._ids)
+        self.spreadsheet = spreadsheet
+        self.headers = list(headers)
+        self.rows: List[List] = [list(row) for row in rows or []]
+        self.calls: Dict[str, int] = {}
+        spreadsheet.worksheets.append(self)
+
+    def _api_call(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        time.sleep(self.spreadsheet.latency)
+
+    def get_all_records(self) -> List[Dict]:
+        self._api_call('get_all_records')
+        return [dict(zip(self.headers, row)) for row in self.rows]
+
+    def get_all_values(self) -> List[List]:
+        self._api_call('get_all_values')
+        return [list(self.headers)] + [[str(value) for value in row] for row in self.rows]
+
+    def row_values(self, row: int, **kwargs) -> List:
+        self._api_call('row_values')
+        return list(self.headers) if row == 1 else list(self.rows[row - 2])
+
+    def find(self, value: str, in_column: int = None) -> Optional[FakeCell]:
+        self._api_call('find')
+        for row_index, row in enumerate(self.rows, start=2):
+            for col_index, cell in enumerate(row, start=1):
+                if (in_column is None or col_index == in_column) and str(cell) == str(value):
+                    return FakeCell(row_index, col_index, str(cell))
+        return None
+
+    def append_row(self, row_data: List, **kwargs):
+        self.append_rows([row_data])
+
+    def append_rows(self, rows: List[List], **kwargs):
+        self._api_call('append_rows')
+        self.rows.extend(list(row) for row in rows)
+
+    def _set(self, row: int, col: int, value):
+        while len(self.rows) < row - 1:
+            self.rows.append([''] * len(self.headers))
+        target = self.rows[row - 2]
+        while len(target) < col:
+            target.append('')
+        target[col - 1] = value
+
+    def update_cell(self, row: int, col: int, value):
+        self._api_call('update_cell')
+        self._set(row, col, value)
+
+    def batch_update(self, data: List[Dict], **kwargs):
+        self._api_call('batch_update')
+        for change in data:
+            row, col = bot_py.gspread.utils.a1_to_rowcol(change['range'])
+            self._set(row, col, change['values'][0][0])
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+class FakeBot:
+    """
+    Bot API в памяти: отвечает через latency секунд, а доля rate_limit_share
+    отправок в группы (то есть публикаций) получает RetryAfter, как при
+    срабатывании flood control. Ответы в личном чате не ограничиваются,
+    чтобы сценарии диалога проходили до конца.
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limit_share: float = 0.0, retry_after: float = 1.0,
+                 forums: bool = True):
+        self.latency = latency
+        self.rate_limit_share = rate_limit_share
+        self.retry_after = retry_after
+        self.forums = forums
+        self.calls: Dict[str, int] = {}
+        self.sent: List[Dict] = []
+        self._message_ids = itertools.count(1)
+        self._random = random.Random(42)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def _api_call(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id, text: str = None, reply_markup=None, **kwargs):
+        await self._api_call('sendMessage')
+        if self.rate_limit_share and int(chat_id) < 0 and self._random.random() < self.rate_limit_share:
+            self.calls['429'] = self.calls.get('429', 0) + 1
+            raise RetryAfter(self.retry_after)
+        self.sent.append({'chat_id': chat_id, 'text': text, 'reply_markup': reply_markup, **kwargs})
+        return SimpleNamespace(message_id=next(self._message_ids), chat_id=chat_id)
+
+    async def get_chat(self, chat_id):
+        await self._api_call('getChat')
+        chat_type = Chat.SUPERGROUP if int(chat_id) < 0 else Chat.PRIVATE
+        return Chat(int(chat_id), chat_type, title=f"Чат {chat_id}", is_forum=self.forums and int(chat_id) < 0)
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._api_call('getChatMember')
+        return ChatMemberAdministrator(
+            User(int(user_id), 'Bench', False), can_be_edited=False, is_anonymous=False,
+            can_manage_chat=True, can_delete_messages=True, can_manage_video_chats=True,
+            can_restrict_members=True, can_promote_members=True, can_change_info=True,
+            can_invite_users=True,
+        )
+
+    def last_keyboard(self, chat_id) -> List[str]:
+        """Тексты кнопок последней клавиатуры, отправленной в чат"""
+        for message in reversed(self.sent):
+            if message['chat_id'] == chat_id and getattr(message['reply_markup'], 'keyboard', None):
+                return [button.text if hasattr(button, 'text') else str(button)
+                        for row in message['reply_markup'].keyboard for button in row]
+        return []
+
+    def total_calls(self) -> int:
+        return sum(count for method, count in self.calls.items() if method != '429')
+
+
+class BenchTelegramBot(TelegramBot):
+    """TelegramBot без файлов с токеном и ключом сервисного аккаунта"""
+
+    def _load_token(self) -> str:
+        return '0:bench'
+
+    def _load_service_account(self) -> Dict:
+        return {}
+
+
+def chat_id_for(index: int) -> int:
+    return -1001000000000 - index
+
+
+def make_event_rows(count: int, chats: int, topics: int, seed: int = 1) -> List[List]:
+    """Строки листа BotEvents: активные события с разной периодичностью по всем чатам"""
+    rng = random.Random(seed)
+    today = datetime.now().date()
+    rows = []
+    for index in range(count):
+        chat_index = index % chats
+        if topics and rng.random() < 0.5:
+            chat_ref = f"topic:{chat_index * 1000 + rng.randrange(topics) + 1}"
+        else:
+            chat_ref = str(chat_id_for(chat_index))
+        start = today - timedelta(days=rng.randrange(60))
+        end = 'FOREVER' if rng.random() < 0.7 else (today + timedelta(days=rng.randrange(1, 365))).isoformat()
+        rows.append([
+            f"ev{index:07d}", chat_ref, f"Событие {index}", start.isoformat(), end,
+            f"{rng.randrange(24):02d}:{rng.randrange(60):02d}", rng.choice(PERIODS),
+            f"Текст публикации {index}", 'active',
+        ])
+    return rows
+
+
+def make_topic_rows(chats: int, topics: int) -> List[List]:
+    """Строки листа Topics: по строке на чат и по строке на каждый топик"""
+    added = datetime.now().isoformat()
+    rows = []
+    for chat_index in range(chats):
+        chat_id = str(chat_id_for(chat_index))
+        rows.append([chat_id, f"Чат {chat_index}", 'SUPERGROUP', '', '', '', added])
+        for topic in range(topics):
+            rows.append([chat_id, f"Чат {chat_index}", 'SUPERGROUP', f"Топик {topic + 1}",
+                         str(chat_index * 1000 + topic + 1), 'Open', added])
+    return rows
+
+
+class BenchEnvironment:
+    """TelegramBot, подключённый к фейковым листам и FakeBot"""
+
+    def __init__(self, args, event_rows: List[List], state_path: str):
+        self.args = args
+        spreadsheet = FakeSpreadsheet(args.sheets_latency)
+        self.events_sheet = FakeWorksheet(spreadsheet, EVENT_HEADERS, event_rows)
+        self.topics_sheet = FakeWorksheet(spreadsheet, TOPIC_HEADERS, make_topic_rows(args.chats, args.topics))
+        self.dead_letters_sheet = FakeWorksheet(spreadsheet, DEAD_LETTER_HEADERS)
+        self.fake_bot = FakeBot(args.bot_latency, args.rate_limit_share, args.retry_after, forums=args.topics > 0)
+        self.bot = BenchTelegramBot()
+        self.bot.timezone = pytz.timezone('Europe/Moscow')
+        self.bot.schedule_state = ScheduleState(state_path)
+        self.bot.application = SimpleNamespace(bot=self.fake_bot)
+        self.bot.storage = SheetsBackend(self.events_sheet, self.topics_sheet, self.bot.sheets,
+                                         self.bot.sheets_writer, self.dead_letters_sheet)
+        self.bot.events = bot_py.EventStore(self.bot.storage)
+        self.bot.chats = bot_py.ChatRegistry(self.bot.storage)
+        self.bot.dead_letters = bot_py.DeadLetterQueue(self.bot.storage)
+        self.context = SimpleNamespace(bot=self.fake_bot)
+        self._update_ids = itertools.count(1)
+
+    async def start(self):
+        """То же, что post_init, но без polling и фоновой инициализации чатов"""
+        self.bot.publisher.start()
+        self.bot.dispatcher.start()
+        await self.bot.schedule_state.start()
+        await self.bot.storage.start()
+        await self.bot.chats.load()
+        await self.bot.events.load()
+        await self.bot.dead_letters.load()
+        await self.bot._load_and_schedule_existing_events()
+
+    async def stop(self):
+        await self.bot.publisher.stop()
+        await self.bot.dispatcher.stop()
+        await self.bot.schedule_state.close()
+        await self.bot.storage.close()
+        self.bot.sheets.shutdown()
+
+    def sheets_calls(self) -> int:
+        return sum(sheet.total_calls() for sheet in (self.events_sheet, self.topics_sheet, self.dead_letters_sheet))
+
+    def private_update(self, text: str, user_id: int = BENCH_USER_ID) -> Update:
+        user = User(user_id, 'Bench', False)
+        message = Message(next(self._update_ids), datetime.now(pytz.utc), Chat(user_id, Chat.PRIVATE),
+                          from_user=user, text=text)
+        message.set_bot(self.fake_bot)
+        return Update(next(self._update_ids), message=message)
+
+
+def summarize(name: str, samples: List[float], extra: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Перцентили (миллисекунды) по методу ближайшего ранга"""
+    ordered = sorted(samples)
+
+    def percentile(share: float) -> float:
+        return ordered[max(0, min(len(ordered) - 1, int(round(share * len(ordered) + 0.5)) - 1))] * 1000
+
+    result = {
+        'scenario': name,
+        'runs': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+    result.update(extra or {})
+    return result
+
+
+async def timed(action: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    await action()
+    return time.perf_counter() - started
+
+
+async def bench_load_schedule(args, state_dir: str) -> List[Dict[str, Any]]:
+    """Запуск бота: загрузка листов и планирование всех событий — холодный и тёплый (с сохранённым состоянием)"""
+    rows = make_event_rows(args.rows, args.chats, args.topics)
+    results = []
+    for warm in (False, True):
+        samples, sheets_calls = [], 0
+        for run in range(args.repeat):
+            state_path = os.path.join(state_dir, f"load_{run}.db")
+            if not warm and os.path.exists(state_path):
+                os.remove(state_path)
+            env = BenchEnvironment(args, rows, state_path)
+            samples.append(await timed(env.start))
+            sheets_calls += env.sheets_calls()
+            await env.stop()
+        name = 'load_schedule_warm' if warm else 'load_schedule_cold'
+        results.append(summarize(name, samples, {'rows': args.rows, 'sheets_calls_per_run': sheets_calls / args.repeat}))
+    return results
+
+
+async def bench_view_events(args, state_dir: str) -> List[Dict[str, Any]]:
+    """Список событий в личном чате при args.events событиях"""
+    env = BenchEnvironment(args, make_event_rows(args.events, args.chats, args.topics),
+                           os.path.join(state_dir, 'view.db'))
+    await env.start()
+    sheets_before, bot_before = env.sheets_calls(), env.fake_bot.total_calls()
+    samples = []
+    for _ in range(args.iterations):
+        update = env.private_update('📋 Просмотр событий')
+        samples.append(await timed(lambda: env.bot.view_events(update, env.context)))
+    extra = {
+        'events': args.events,
+        'sheets_calls_per_run': (env.sheets_calls() - sheets_before) / args.iterations,
+        'bot_calls_per_run': (env.fake_bot.total_calls() - bot_before) / args.iterations,
+    }
+    await env.stop()
+    return [summarize('view_events', samples, extra)]
+
+
+async def run_wizard(env: BenchEnvironment, step_samples: Dict[str, List[float]]):
+    """Полный диалог создания ежедневного события; проверяет состояние после каждого шага"""
+    bot, chat_id = env.bot, BENCH_USER_ID
+
+    async def step(handler, text: str, expected: int):
+        update = env.private_update(text)
+        started = time.perf_counter()
+        state = await handler(update, env.context)
+        step_samples.setdefault(handler.__name__, []).append(time.perf_counter() - started)
+        if state != expected:
+            raise RuntimeError(f"{handler.__name__}({text!r}) вернул состояние {state}, ожидалось {expected}")
+
+    await step(bot.main_menu, '📝 Создать событие', SELECT_CHAT)
+    chat_button = env.fake_bot.last_keyboard(chat_id)[0]
+    if env.args.topics:
+        await step(bot.select_chat, chat_button, SELECT_TOPIC)
+        # Первая кнопка — общий чат, вторая — первый топик форума
+        await step(bot.select_topic, env.fake_bot.last_keyboard(chat_id)[1], ENTER_NAME)
+    else:
+        await step(bot.select_chat, chat_button, ENTER_NAME)
+    await step(bot.enter_name, 'Событие из бенчмарка', SELECT_PERIOD)
+    await step(bot.select_period, '📅 Ежедневно', ENTER_START_DATE)
+    await step(bot.enter_start_date, 'сегодня', ENTER_END_DATE)
+    await step(bot.enter_end_date, '♾️ Вечное (без окончания)', ENTER_TIME)
+    await step(bot.enter_time, '09:30', ENTER_TEXT)
+    await step(bot.enter_text, 'Текст публикации из бенчмарка', CONFIRM_EVENT)
+    await step(bot.handle_confirm_event, '✅ Создать событие', MAIN_MENU)
+
+
+async def bench_wizard(args, state_dir: str) -> List[Dict[str, Any]]:
+    """Мастер создания события от главного меню до подтверждения"""
+    env = BenchEnvironment(args, make_event_rows(args.events, args.chats, args.topics),
+                           os.path.join(state_dir, 'wizard.db'))
+    await env.start()
+    sheets_before, bot_before = env.sheets_calls(), env.fake_bot.total_calls()
+    samples, step_samples = [], {}
+    for _ in range(args.iterations):
+        samples.append(await timed(lambda: run_wizard(env, step_samples)))
+    await env.bot.storage.flush()
+    extra = {
+        'chats': args.chats,
+        'sheets_calls_per_run': (env.sheets_calls() - sheets_before) / args.iterations,
+        'bot_calls_per_run': (env.fake_bot.total_calls() - bot_before) / args.iterations,
+    }
+    await env.stop()
+    results = [summarize('wizard', samples, extra)]
+    results.extend(summarize(f"wizard.{name}", values) for name, values in step_samples.items())
+    return results
+
+
+async def bench_publish(args, state_dir: str) -> List[Dict[str, Any]]:
+    """Публикация args.publications событий через очередь отправки с лимитами Telegram и повторами"""
+    rows = make_event_rows(args.publications, args.chats, 0)
+    env = BenchEnvironment(args, rows, os.path.join(state_dir, 'publish.db'))
+    await env.start()
+    events = [env.bot.events.get(row[0]) for row in rows]
+    samples = []
+
+    async def publish(event):
+        started = time.perf_counter()
+        await env.bot._publish_message_async(event)
+        samples.append(time.perf_counter() - started)
+
+    wall = await timed(lambda: asyncio.gather(*(publish(event) for event in events)))
+    extra = {
+        'publications': len(events),
+        'sent': len(env.fake_bot.sent),
+        'rate_limited': env.fake_bot.calls.get('429', 0),
+        'dead_letters': len(env.bot.dead_letters),
+        'throughput_per_s': len(events) / wall if wall else 0.0,
+    }
+    await env.stop()
+    return [summarize('publish', samples, extra)]
+
+
+def count_storage_calls(backend) -> Dict[str, int]:
+    """Считает вызовы методов хранилища (в том числе тех, что только ставят запись в очередь)"""
+    calls: Dict[str, int] = {}
+    for name in dir(bot_py.StorageBackend):
+        if name.startswith('_') or name in ('start', 'close', 'flush'):
+            continue
+        method = getattr(backend, name)
+
+        def counting(*args, _method=method, _name=name, **kwargs):
+            calls[_name] = calls.get(_name, 0) + 1
+            return _method(*args, **kwargs)
+
+        setattr(backend, name, counting)
+    return calls
+
+
+class UpdateStream:
+    """
+    Синтетический поток апдейтов групп: обычные сообщения в общем чате и в
+    топиках, а также создание, переименование, закрытие и открытие топиков
+    в args.update_chats форумах.
+    """
+
+    KINDS = ('message', 'topic_message', 'topic_created', 'topic_edited', 'topic_closed', 'topic_reopened')
+
+    def __init__(self, args, fake_bot: FakeBot, seed: int = 7):
+        self.args = args
+        self.fake_bot = fake_bot
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._users = [User(2000 + index, f"User {index}", False) for index in range(100)]
+        # Доля служебных событий форума — остальное обычные сообщения
+        service = args.service_share / 4
+        self._weights = (1 - args.service_share) / 2, (1 - args.service_share) / 2, service, service, service, service
+
+    def _message(self, chat: Chat, thread_id: Optional[int], **fields) -> Update:
+        message = Message(next(self._ids), datetime.now(pytz.utc), chat, from_user=self._rng.choice(self._users),
+                          message_thread_id=thread_id, is_topic_message=thread_id is not None or None, **fields)
+        message.set_bot(self.fake_bot)
+        update = Update(next(self._ids), message=message)
+        update.set_bot(self.fake_bot)
+        return update
+
+    def make(self) -> Update:
+        chat_index = self._rng.randrange(self.args.update_chats)
+        chat = Chat(chat_id_for(chat_index), Chat.SUPERGROUP, title=f"Чат {chat_index}", is_forum=True)
+        topic_id = chat_index * 1000 + self._rng.randrange(max(self.args.topics, 1) * 2) + 1
+        kind = self._rng.choices(self.KINDS, self._weights)[0]
+        if kind == 'message':
+            return self._message(chat, None, text="Обычное сообщение")
+        if kind == 'topic_message':
+            return self._message(chat, topic_id, text="Сообщение в топике")
+        if kind == 'topic_created':
+            return self._message(chat, topic_id, forum_topic_created=ForumTopicCreated(f"Топик {topic_id}", 0x6FB9F0))
+        if kind == 'topic_edited':
+            return self._message(chat, topic_id, forum_topic_edited=ForumTopicEdited(name=f"Топик {topic_id}*"))
+        if kind == 'topic_closed':
+            return self._message(chat, topic_id, forum_topic_closed=ForumTopicClosed())
+        return self._message(chat, topic_id, forum_topic_reopened=ForumTopicReopened())
+
+
+async def sample_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01):
+    """Задержка event loop: насколько позже срока просыпается sleep(interval)"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def bench_updates(args, state_dir: str) -> List[Dict[str, Any]]:
+    """
+    Генератор нагрузки: args.updates синтетических апдейтов групп проходят
+    через Application.process_update с настоящим графом обработчиков.
+    --concurrency соответствует concurrent_updates у Application.
+    """
+    env = BenchEnvironment(args, make_event_rows(args.events, args.chats, args.topics),
+                           os.path.join(state_dir, 'updates.db'))
+    await env.start()
+    application = Application.builder().bot(env.fake_bot).build()
+    env.bot._register_handlers(application)
+    await application.initialize()
+    storage_calls = count_storage_calls(env.bot.storage)
+    stream = UpdateStream(args, env.fake_bot)
+    updates = [stream.make() for _ in range(args.updates)]
+    sheets_before, bot_before = env.sheets_calls(), env.fake_bot.total_calls()
+
+    latencies: List[float] = []
+    pending = iter(updates)
+
+    async def worker():
+        for update in pending:
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+            # Между апдейтами цикл событий получает управление, как при приёме из сети
+            await asyncio.sleep(0)
+
+    lag: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(sample_loop_lag(lag, stop))
+    wall = await timed(lambda: asyncio.gather(*(worker() for _ in range(args.concurrency))))
+    stop.set()
+    await lag_task
+    # Отложенные записи тоже считаются: их породили апдейты
+    await env.bot.storage.flush()
+    await application.shutdown()
+
+    extra = {
+        'updates': len(updates),
+        'concurrency': args.concurrency,
+        'throughput_per_s': len(updates) / wall if wall else 0.0,
+        'loop_lag_mean_ms': statistics.fmean(lag) * 1000 if lag else 0.0,
+        'loop_lag_max_ms': max(lag) * 1000 if lag else 0.0,
+        'storage_calls_per_update': sum(storage_calls.values()) / len(updates),
+        'sheets_calls_per_update': (env.sheets_calls() - sheets_before) / len(updates),
+        'bot_calls_per_update': (env.fake_bot.total_calls() - bot_before) / len(updates),
+    }
+    await env.stop()
+    return [summarize('updates', latencies, extra)]
+
+
+BENCHMARKS = {
+    'load_schedule': bench_load_schedule,
+    'view_events': bench_view_events,
+    'wizard': bench_wizard,
+    'publish': bench_publish,
+    'updates': bench_updates,
+}
+
+
+def print_results(results: List[Dict[str, Any]]):
+    columns = ('runs', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+    print(f"{'scenario':<28}" + ''.join(f"{column:>10}" for column in columns))
+    for result in results:
+        line = f"{result['scenario']:<28}" + f"{result['runs']:>10}"
+        line += ''.join(f"{result[column]:>10.2f}" for column in columns[1:])
+        extra = {key: value for key, value in result.items() if key not in columns and key != 'scenario'}
+        if extra:
+            line += '  ' + ' '.join(f"{key}={value:g}" if isinstance(value, (int, float)) else f"{key}={value}"
+                                    for key, value in extra.items())
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки TelegramBot с фейковыми Google Sheets и Bot API")
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS + ('all',), default=['all'])
+    parser.add_argument('--rows', type=int, default=50000, help="строк BotEvents в load_schedule")
+    parser.add_argument('--events', type=int, default=5000, help="событий в view_events и wizard")
+    parser.add_argument('--publications', type=int, default=100, help="публикаций в publish")
+    parser.add_argument('--chats', type=int, default=50, help="известных чатов")
+    parser.add_argument('--topics', type=int, default=3, help="топиков в каждом чате (0 — обычные группы)")
+    parser.add_argument('--repeat', type=int, default=3, help="повторов load_schedule")
+    parser.add_argument('--iterations', type=int, default=20, help="повторов view_events и wizard")
+    parser.add_argument('--updates', type=int, default=5000, help="апдейтов в updates")
+    parser.add_argument('--update-chats', type=int, default=200, help="чатов, из которых приходят апдейты")
+    parser.add_argument('--service-share', type=float, default=0.1,
+                        help="доля служебных событий форума среди апдейтов")
+    parser.add_argument('--concurrency', type=int, default=1, help="апдейтов, обрабатываемых одновременно")
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help="задержка вызова Sheets API, с")
+    parser.add_argument('--bot-latency', type=float, default=0.0, help="задержка вызова Bot API, с")
+    parser.add_argument('--rate-limit-share', type=float, default=0.0, help="доля отправок в группы с ответом 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="retry_after в ответе 429, с")
+    parser.add_argument('--json', action='store_true', help="вывести результаты в JSON")
+    return parser.parse_args(argv)
+
+
+async def run_benchmarks(args) -> List[Dict[str, Any]]:
+    scenarios = SCENARIOS if 'all' in args.scenario else args.scenario
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bot_bench_') as state_dir:
+        for scenario in scenarios:
+            results.extend(await BENCHMARKS[scenario](args, state_dir))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmarks(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
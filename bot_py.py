@@ -1,13 +1,28 @@
 import json
 import logging
+import logging.handlers
 import asyncio
+import atexit
+import calendar
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import math
 import re
+import sqlite3
 import uuid
+import zlib
 import os
+import queue
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, time, date
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple
 import pytz
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from oauth2client.service_account import ServiceAccountCredentials
 from telegram import (
@@ -19,14 +34,67 @@ from telegram.ext import (
     Application, ContextTypes, ConversationHandler, CommandHandler,
     MessageHandler, CallbackQueryHandler, JobQueue, filters
 )
-from telegram.error import TelegramError
+from telegram.error import TelegramError, RetryAfter, NetworkError, BadRequest, TimedOut
+from telegram.request import HTTPXRequest
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
 from telegram.constants import ChatMemberStatus, ChatType
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Настройка логирования.
+# BOT_LOG_MODE=text — обычный текстовый вывод; production — JSON-строки, а запись
+# в поток идёт в отдельном потоке через очередь и не блокирует event loop.
+LOG_MODE = os.getenv('BOT_LOG_MODE', 'text').lower()
+LOG_LEVEL = os.getenv('BOT_LOG_LEVEL', 'INFO').upper()
+# Доля сообщений, помеченных extra={'sampled': True}, которая попадает в лог
+LOG_SAMPLE_RATE = float(os.getenv('BOT_LOG_SAMPLE_RATE', '1'))
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Одна запись лога — один JSON-объект в строке"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        # Структурированные поля: logger.warning(..., extra={'fields': {...}})
+        entry.update(getattr(record, 'fields', None) or {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampledLogFilter(logging.Filter):
+    """Пропускает только долю rate записей, помеченных как sampled"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, 'sampled', False) or random.random() < self.rate
+
+
+def configure_logging():
+    stream_handler = logging.StreamHandler()
+    if LOG_MODE == 'production':
+        stream_handler.setFormatter(JsonLogFormatter())
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = logging.handlers.QueueHandler(log_queue)
+        # В очередь уходит уже подставленный текст сообщения (вместе с трассировкой)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handler = stream_handler
+    handler.addFilter(SampledLogFilter(LOG_SAMPLE_RATE))
+    logging.basicConfig(level=LOG_LEVEL, handlers=[handler])
+
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Константы для состояний диалога
@@ -56,6 +124,2068 @@ WEEKDAYS = {
     6: '📅 Воскресенье'
 }
 
+# Параметры доступа к Google Sheets
+SHEETS_MAX_WORKERS = int(os.getenv('BOT_SHEETS_WORKERS', '4'))
+SHEETS_CALL_TIMEOUT = float(os.getenv('BOT_SHEETS_TIMEOUT', '30'))
+SHEETS_FLUSH_INTERVAL = float(os.getenv('BOT_SHEETS_FLUSH_INTERVAL', '2'))
+
+# HTTP-эндпоинт метрик в формате Prometheus (порт 0 — отключён)
+METRICS_HOST = os.getenv('BOT_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', '0'))
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricsRegistry:
+    """
+    Счётчики, гистограммы и вычисляемые показатели в памяти процесса.
+
+    Метрика — имя и набор значений по кортежам меток; render() выдаёт всё
+    в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        self._help: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def _register(self, name: str, kind: str, description: str, labels: Tuple[str, ...]):
+        if name not in self._help:
+            self._help[name] = (kind, description, labels)
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self._register(name, 'counter', description, labels)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self._register(name, 'histogram', description, labels)
+        self._histograms.setdefault(name, {})
+
+    def gauge(self, name: str, description: str, read: Callable[[], float]):
+        """Показатель, который вычисляется в момент запроса метрик"""
+        self._register(name, 'gauge', description, ())
+        self._gauges[name] = read
+
+    def inc(self, name: str, *label_values, amount: float = 1):
+        values = self._counters[name]
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def observe(self, name: str, value: float, *label_values):
+        # Значения: счётчики по корзинам METRICS_BUCKETS, затем сумма и количество
+        values = self._histograms[name].get(label_values)
+        if values is None:
+            values = self._histograms[name][label_values] = [0.0] * (len(METRICS_BUCKETS) + 2)
+        for index, bound in enumerate(METRICS_BUCKETS):
+            if value <= bound:
+                values[index] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    @staticmethod
+    def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+        pairs = []
+        for name, value in zip(names, values):
+            escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{name}="{escaped}"')
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, description, labels) in self._help.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for label_values, value in self._counters[name].items():
+                    lines.append(f"{name}{self._labels(labels, label_values)} {value:g}")
+            elif kind == 'histogram':
+                for label_values, values in self._histograms[name].items():
+                    bounds = [f'{bound:g}' for bound in METRICS_BUCKETS] + ['+Inf']
+                    for bound, count in zip(bounds, values[:-2] + values[-1:]):
+                        bucket_labels = self._labels(labels, label_values, 'le="' + bound + '"')
+                        lines.append(f"{name}_bucket{bucket_labels} {count:g}")
+                    lines.append(f"{name}_sum{self._labels(labels, label_values)} {values[-2]:g}")
+                    lines.append(f"{name}_count{self._labels(labels, label_values)} {values[-1]:g}")
+            else:
+                try:
+                    lines.append(f"{name} {float(self._gauges[name]()):g}")
+                except Exception as e:
+                    logger.warning(f"Не удалось вычислить метрику {name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+METRICS.counter('bot_sheets_calls_total', 'Вызовы Google Sheets API', ('method', 'result'))
+METRICS.histogram('bot_sheets_call_seconds', 'Длительность вызовов Google Sheets API', ('method',))
+METRICS.counter('bot_publications_total', 'Публикации событий по исходу', ('result',))
+METRICS.histogram('bot_publish_seconds', 'Длительность публикации события, включая очередь и повторы')
+METRICS.histogram('bot_publish_drift_seconds', 'Опоздание фактической отправки относительно запланированного времени')
+METRICS.histogram('bot_handler_seconds', 'Длительность обработчиков апдейтов', ('handler',))
+METRICS.counter('bot_handler_errors_total', 'Исключения в обработчиках апдейтов', ('handler',))
+METRICS.counter('bot_telegram_calls_total', 'Вызовы Telegram Bot API', ('method',))
+METRICS.histogram('bot_telegram_call_seconds', 'Длительность вызовов Telegram Bot API', ('method',))
+
+# Обработка апдейта дольше стольких секунд попадает в лог медленных апдейтов (0 — отключено)
+SLOW_UPDATE_THRESHOLD = float(os.getenv('BOT_SLOW_UPDATE_SECONDS', '1'))
+
+
+class UpdateTrace:
+    """
+    Сколько вызовов хранилища (Google Sheets или SQLite) и Telegram сделал
+    обработчик одного апдейта и сколько они длились
+    """
+
+    __slots__ = ('handler', 'storage_calls', 'storage_seconds', 'telegram_calls', 'telegram_seconds')
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.storage_calls = 0
+        self.storage_seconds = 0.0
+        self.telegram_calls = 0
+        self.telegram_seconds = 0.0
+
+
+# Трассировка апдейта, который сейчас обрабатывается (задачи, запущенные обработчиком, её наследуют)
+CURRENT_TRACE: contextvars.ContextVar[Optional[UpdateTrace]] = contextvars.ContextVar('current_trace', default=None)
+
+
+def trace_storage_call(elapsed: float):
+    """Учитывает вызов хранилища в трассировке текущего апдейта"""
+    trace = CURRENT_TRACE.get()
+    if trace is not None:
+        trace.storage_calls += 1
+        trace.storage_seconds += elapsed
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который считает вызовы Bot API для метрик и трассировки апдейтов"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            elapsed = loop.time() - started
+            api_method = url.rsplit('/', 1)[-1]
+            METRICS.inc('bot_telegram_calls_total', api_method)
+            METRICS.observe('bot_telegram_call_seconds', elapsed, api_method)
+            trace = CURRENT_TRACE.get()
+            if trace is not None:
+                trace.telegram_calls += 1
+                trace.telegram_seconds += elapsed
+
+
+class MetricsServer:
+    """Минимальный HTTP-сервер: GET /metrics отдаёт METRICS в формате Prometheus"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if self.port and self._server is None:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            logger.info(f"📈 Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Заголовки запроса не нужны, но их нужно дочитать до пустой строки
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class SheetsCallTimeout(asyncio.TimeoutError):
+    """
+    Таймаут вызова Google Sheets. Поток gspread при этом продолжает работу:
+    pending завершится, когда станет известен настоящий результат вызова.
+    """
+
+    def __init__(self, method: str, pending: asyncio.Future):
+        super().__init__(method)
+        self.pending = pending
+
+
+class SheetsGateway:
+    """
+    Асинхронный фасад над gspread.
+
+    Синхронные HTTP-вызовы gspread выполняются в ограниченном пуле потоков,
+    чтобы медленный ответ Google не блокировал цикл событий. Каждый вызов
+    ограничен таймаутом.
+    """
+
+    def __init__(self, max_workers: int = SHEETS_MAX_WORKERS, timeout: float = SHEETS_CALL_TIMEOUT):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sheets')
+
+    async def call(self, func, *args, timeout: float = None, **kwargs):
+        """Выполняет func(*args, **kwargs) вне цикла событий"""
+        loop = asyncio.get_running_loop()
+        method = getattr(func, '__name__', str(func))
+        started = loop.time()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        result = 'error'
+        try:
+            # shield: по таймауту перестаём ждать, но результат вызова остаётся доступен
+            value = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+            result = 'ok'
+            return value
+        except asyncio.TimeoutError:
+            result = 'timeout'
+            logger.error(f"Таймаут вызова Google Sheets {method} ({timeout or self.timeout}с)")
+            raise SheetsCallTimeout(method, future) from None
+        finally:
+            elapsed = loop.time() - started
+            METRICS.inc('bot_sheets_calls_total', method, result)
+            METRICS.observe('bot_sheets_call_seconds', elapsed, method)
+            trace_storage_call(elapsed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class SheetsWriteBehind:
+    """
+    Очередь отложенной записи в Google Sheets.
+
+    Изменения ячеек одного листа объединяются (последнее значение ячейки
+    побеждает) и уходят одним batch_update, новые строки — одним
+    append_rows. Очередь сбрасывается каждые SHEETS_FLUSH_INTERVAL секунд
+    и при остановке бота.
+
+    Если append_rows не уложился в таймаут, строки могли дойти до листа,
+    поэтому они не повторяются вслепую: следующий сброс этого листа сначала
+    дожидается настоящего результата вызова и повторяет строки, только если
+    вызов завершился ошибкой.
+    """
+
+    def __init__(self, gateway: SheetsGateway, interval: float = SHEETS_FLUSH_INTERVAL):
+        self.gateway = gateway
+        self.interval = interval
+        self._cells: Dict[int, Tuple[Any, Dict[Tuple[int, int], Any]]] = {}
+        self._rows: Dict[int, Tuple[Any, List[List]]] = {}
+        # append_rows, прерванные таймаутом: (вызов, лист, строки)
+        self._unconfirmed: Dict[int, Tuple[asyncio.Future, Any, List[List]]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def update_cell(self, worksheet, row: int, col: int, value):
+        self._cells.setdefault(id(worksheet), (worksheet, {}))[1][(row, col)] = value
+
+    def append_row(self, worksheet, row_data: List):
+        self._rows.setdefault(id(worksheet), (worksheet, []))[1].append(list(row_data))
+
+    def pending(self) -> int:
+        return sum(len(cells) for _, cells in self._cells.values()) + sum(len(rows) for _, rows in self._rows.values())
+
+    async def flush(self):
+        """Отправляет накопленные изменения; при ошибке возвращает их в очередь"""
+        async with self._lock:
+            await self._flush_locked()
+
+    async def _flush_locked(self):
+        cells, self._cells = self._cells, {}
+        rows, self._rows = self._rows, {}
+        for key in set(cells) | set(rows) | set(self._unconfirmed):
+            unconfirmed = self._unconfirmed.pop(key, None)
+            worksheet = (rows.get(key) or cells.get(key) or unconfirmed[1:])[0]
+            pending_rows = rows.get(key, (worksheet, []))[1]
+            pending_cells = cells.get(key, (worksheet, {}))[1]
+            if unconfirmed is not None:
+                # Прерванный таймаутом append_rows мог дойти до листа: ждём его настоящий результат
+                try:
+                    await unconfirmed[0]
+                except Exception as e:
+                    logger.error(f"Добавление строк в Google Sheets не удалось, строки будут повторены: {e}")
+                    pending_rows = unconfirmed[2] + pending_rows
+            try:
+                # Сначала строки: обновления ячеек могут относиться к только что добавленным строкам
+                if pending_rows:
+                    try:
+                        await self.gateway.call(worksheet.append_rows, pending_rows)
+                    except SheetsCallTimeout as e:
+                        self._unconfirmed[key] = (e.pending, worksheet, pending_rows)
+                        pending_rows = []
+                        raise
+                    pending_rows = []
+                if pending_cells:
+                    data = [{'range': rowcol_to_a1(row, col), 'values': [[value]]}
+                            for (row, col), value in pending_cells.items()]
+                    await self.gateway.call(worksheet.batch_update, data, value_input_option='RAW')
+            except Exception as e:
+                logger.error(f"Ошибка пакетной записи в Google Sheets, изменения будут повторены: {e}")
+                self._requeue(worksheet, pending_rows, pending_cells)
+
+    def _requeue(self, worksheet, rows: List[List], cells: Dict[Tuple[int, int], Any]):
+        if rows:
+            queued = self._rows.setdefault(id(worksheet), (worksheet, []))[1]
+            queued[:0] = rows
+        if cells:
+            queued_cells = self._cells.setdefault(id(worksheet), (worksheet, {}))[1]
+            for position, value in cells.items():
+                # Более свежие значения, поставленные в очередь во время сброса, не затираем
+                queued_cells.setdefault(position, value)
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        """Сбрасывает очередь и блокирует фоновые сбросы (для операций, сдвигающих строки)"""
+        async with self._lock:
+            await self._flush_locked()
+            yield
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка фонового сброса очереди Google Sheets: {e}")
+
+    async def stop(self):
+        """Останавливает фоновый сброс и отправляет всё, что осталось в очереди"""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+
+# Заголовки листа BotEvents (порядок = номера колонок)
+EVENT_HEADERS = ['ID', 'ChatID', 'Description', 'StartDate', 'EndDate', 'Time', 'PeriodType', 'Text', 'Status']
+
+# Заголовки очереди неотправленных публикаций (лист DeadLetters / таблица dead_letters)
+DEAD_LETTER_HEADERS = ['ID', 'EventID', 'ChatID', 'TopicID', 'Text', 'Error', 'Attempts', 'FailedAt', 'Status']
+
+# Статус логически удалённого события (строка физически удаляется при уплотнении)
+EVENT_TOMBSTONE = 'deleted'
+
+# Заголовки листа Topics (порядок = номера колонок)
+TOPIC_HEADERS = ['ChatID', 'ChatName', 'ChatType', 'TopicName', 'TopicID', 'Status', 'AddedDate']
+
+# Выбор хранилища: 'sqlite' (основное, Google Sheets — зеркало) или 'sheets'
+STORAGE_BACKEND = os.getenv('BOT_STORAGE', 'sqlite').lower()
+SQLITE_PATH = os.getenv('BOT_SQLITE_PATH', 'bot_data.db')
+SHEETS_MIRROR = os.getenv('BOT_SHEETS_MIRROR', '1') not in ('0', 'false', 'no')
+
+# Как часто подхватывать ручные правки листа BotEvents (секунды, 0 — отключено)
+RECONCILE_INTERVAL = int(os.getenv('BOT_RECONCILE_INTERVAL', '60'))
+# Как часто физически удалять строки удалённых событий из листа (секунды, 0 — отключено)
+COMPACT_INTERVAL = int(os.getenv('BOT_COMPACT_INTERVAL', '3600'))
+# Сколько наступивших публикаций диспетчер передаёт за один раз
+DISPATCH_BATCH_SIZE = int(os.getenv('BOT_DISPATCH_BATCH', '100'))
+# Лимиты Telegram на отправку: всего сообщений в секунду и сообщений в минуту на группу
+PUBLISH_GLOBAL_RATE = float(os.getenv('BOT_PUBLISH_GLOBAL_RATE', '30'))
+PUBLISH_GROUP_RATE = float(os.getenv('BOT_PUBLISH_GROUP_RATE', '20'))
+# Сколько сообщений подряд можно отправить в один чат без паузы
+PUBLISH_CHAT_BURST = float(os.getenv('BOT_PUBLISH_CHAT_BURST', '3'))
+# Сколько отправок выполняется одновременно
+PUBLISH_WORKERS = int(os.getenv('BOT_PUBLISH_WORKERS', '8'))
+# Файл SQLite с состоянием диспетчера (следующая и последняя публикация каждого события)
+SCHEDULE_STATE_PATH = os.getenv('BOT_SCHEDULE_STATE_PATH', SQLITE_PATH)
+# Публикация, пропущенная во время простоя не более чем на столько секунд, отправляется после запуска
+MISFIRE_GRACE_TIME = int(os.getenv('BOT_MISFIRE_GRACE', '30'))
+# Сколько чатов проверяется одновременно при фоновой инициализации после запуска
+WARMUP_CONCURRENCY = int(os.getenv('BOT_WARMUP_CONCURRENCY', '10'))
+# Сколько раз пытаться отправить публикацию и максимальная пауза между попытками (секунды)
+PUBLISH_MAX_ATTEMPTS = int(os.getenv('BOT_PUBLISH_ATTEMPTS', '5'))
+PUBLISH_BACKOFF_MAX = float(os.getenv('BOT_PUBLISH_BACKOFF_MAX', '60'))
+# Сколько секунд помнить, является ли пользователь администратором чата, и сколько чатов проверять одновременно
+ADMIN_CACHE_TTL = float(os.getenv('BOT_ADMIN_CACHE_TTL', '300'))
+ADMIN_CHECK_CONCURRENCY = int(os.getenv('BOT_ADMIN_CHECK_CONCURRENCY', '10'))
+# Сколько секунд доверять сведениям о чате из get_chat (название, режим форума)
+CHAT_INFO_CACHE_TTL = float(os.getenv('BOT_CHAT_INFO_CACHE_TTL', '3600'))
+
+# Приём апдейтов: 'polling' (getUpdates) или 'webhook' (встроенный HTTP-сервер)
+UPDATES_MODE = os.getenv('BOT_UPDATES_MODE', 'polling').lower()
+# Публичный адрес вебхука (без пути), адрес и порт, которые слушает сервер, путь вебхука
+WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('BOT_WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH', 'telegram')
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token (пусто — случайный при запуске)
+WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+# Сколько одновременных соединений Telegram открывает к вебхуку
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('BOT_WEBHOOK_MAX_CONNECTIONS', '40'))
+# Сертификат и ключ, если TLS завершается самим ботом, а не прокси перед ним
+WEBHOOK_CERT = os.getenv('BOT_WEBHOOK_CERT') or None
+WEBHOOK_KEY = os.getenv('BOT_WEBHOOK_KEY') or None
+# Отбрасывать ли накопившиеся апдейты при запуске (по умолчанию — только в режиме polling)
+DROP_PENDING_UPDATES = os.getenv('BOT_DROP_PENDING_UPDATES', '1' if UPDATES_MODE == 'polling' else '0') not in ('0', 'false', 'no')
+# Сколько апдейтов обрабатывается одновременно (1 — строго по очереди)
+CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '1'))
+ALLOWED_UPDATES = ["message", "callback_query", "forum_topic_created", "forum_topic_edited", "forum_topic_closed", "forum_topic_reopened"]
+# Поля, изменение которых требует перепланирования публикаций
+SCHEDULE_FIELDS = ('Time', 'StartDate', 'EndDate', 'PeriodType', 'Status', 'Text')
+
+
+class StorageBackend:
+    """
+    Интерфейс постоянного хранилища событий, чатов и топиков.
+
+    События передаются словарями с ключами EVENT_HEADERS. Чаты — словарями
+    {'chat_id', 'title', 'type', 'added_date'}, топики — словарями
+    {'chat_id', 'topic_id', 'name', 'status', 'added_date'}.
+    """
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def flush(self):
+        """Дожидается отправки отложенных записей"""
+        pass
+
+    async def load_events(self) -> List[Dict]:
+        raise NotImplementedError
+
+    async def insert_event(self, record: Dict):
+        raise NotImplementedError
+
+    async def update_event(self, event_id: str, fields: Dict):
+        raise NotImplementedError
+
+    async def delete_event(self, event_id: str):
+        raise NotImplementedError
+
+    async def load_chats(self) -> Tuple[List[Dict], List[Dict]]:
+        """Возвращает (чаты, топики)"""
+        raise NotImplementedError
+
+    async def insert_chat(self, chat: Dict):
+        raise NotImplementedError
+
+    async def update_chat(self, chat_id: str, title: str):
+        raise NotImplementedError
+
+    async def insert_topic(self, topic: Dict):
+        raise NotImplementedError
+
+    async def update_topic(self, chat_id: str, topic_id: int, fields: Dict):
+        """fields: подмножество {'name', 'status'}"""
+        raise NotImplementedError
+
+    async def load_dead_letters(self) -> List[Dict]:
+        """Неотправленные публикации (словари с ключами DEAD_LETTER_HEADERS)"""
+        raise NotImplementedError
+
+    async def insert_dead_letter(self, entry: Dict):
+        raise NotImplementedError
+
+    async def resolve_dead_letter(self, entry_id: str):
+        """Убирает публикацию из очереди после успешной повторной отправки"""
+        raise NotImplementedError
+
+
+class SheetsBackend(StorageBackend):
+    """
+    Хранилище на листах BotEvents и Topics.
+
+    Чтение идёт через SheetsGateway, все изменения — через очередь
+    отложенной записи. Номера строк событий и топиков хранятся в индексах;
+    новые строки получают номер заранее, по порядку добавления. Оператор
+    может вставить или отсортировать строки вручную, поэтому перед точечной
+    записью строка сверяется с ожидаемой записью, а при расхождении индекс
+    перестраивается чтением листа. События удаляются логически
+    (Status = EVENT_TOMBSTONE), а физически строки убирает периодическое
+    уплотнение compact_events().
+    """
+
+    def __init__(self, worksheet, topics_worksheet, gateway: SheetsGateway, writer: SheetsWriteBehind,
+                 dead_letters_worksheet=None):
+        self.worksheet = worksheet
+        self.topics_worksheet = topics_worksheet
+        self.dead_letters_worksheet = dead_letters_worksheet
+        self.gateway = gateway
+        self.writer = writer
+        self._event_rows: Dict[str, int] = {}
+        self._next_event_row = 2
+        self._tombstones = 0
+        # Живые строки последнего чтения и события, удалённые в листе с тех пор (для сверки)
+        self._live_event_ids: set = set()
+        self._deleted_event_ids: set = set()
+        # Загрузка и уплотнение меняют номера строк: остальные операции с событиями их ждут
+        self._rows_lock = asyncio.Lock()
+        self._chat_rows: Dict[str, int] = {}
+        self._topic_rows: Dict[Tuple[str, int], int] = {}
+        self._next_topic_row = 2
+        self._dead_letter_rows: Dict[str, int] = {}
+        self._next_dead_letter_row = 2
+
+    async def start(self):
+        self.writer.start()
+
+    async def close(self):
+        await self.writer.stop()
+
+    async def flush(self):
+        await self.writer.flush()
+
+    def _index_event_rows(self, records: List[Dict]) -> List[Dict]:
+        """Перестраивает индекс ID -> строка; возвращает события без удалённых"""
+        self._event_rows.clear()
+        self._tombstones = 0
+        live = []
+        live_ids = set()
+        for row_index, record in enumerate(records, start=2):
+            event_id = str(record.get('ID', '')).strip()
+            if not event_id:
+                continue
+            self._event_rows[event_id] = row_index
+            if str(record.get('Status', '')).strip() == EVENT_TOMBSTONE:
+                self._tombstones += 1
+                self._deleted_event_ids.add(event_id)
+            else:
+                live.append(record)
+                live_ids.add(event_id)
+        # Строка, которая была в листе при прошлом чтении и пропала, удалена вручную
+        self._deleted_event_ids |= self._live_event_ids - live_ids - set(self._event_rows)
+        self._live_event_ids = live_ids
+        self._next_event_row = len(records) + 2
+        return live
+
+    def take_deleted_event_ids(self) -> set:
+        """
+        ID событий, удалённых в листе с прошлого вызова: помеченных EVENT_TOMBSTONE
+        или пропавших из листа после чтения, в котором они были.
+
+        Строки, которых в листе не было никогда (например, зеркало не успело
+        их записать), сюда не попадают.
+        """
+        deleted, self._deleted_event_ids = self._deleted_event_ids, set()
+        return deleted
+
+    async def load_events(self) -> List[Dict]:
+        async with self._rows_lock:
+            # Отложенные строки должны попасть в лист до чтения, иначе индекс их потеряет
+            await self.writer.flush()
+            records = await self.gateway.call(self.worksheet.get_all_records)
+            return self._index_event_rows(records)
+
+    async def _row_matches(self, worksheet, row: int, expected: Dict[int, str]) -> bool:
+        """Лежит ли в строке row ожидаемая запись (номер колонки -> значение)"""
+        # Отложенные строки должны попасть в лист, иначе только что добавленную строку не найти
+        await self.writer.flush()
+        values = await self.gateway.call(worksheet.row_values, row, value_render_option='UNFORMATTED_VALUE')
+        return all(str(values[col - 1] if col <= len(values) else '').strip() == value
+                   for col, value in expected.items())
+
+    async def _event_row(self, event_id: str) -> Optional[int]:
+        row = self._event_rows.get(event_id)
+        if row is None:
+            # Строка могла появиться в листе вручную после последней загрузки
+            cell = await self.gateway.call(self.worksheet.find, event_id, in_column=1)
+            if cell is not None:
+                row = self._event_rows[event_id] = cell.row
+        elif not await self._row_matches(self.worksheet, row, {1: event_id}):
+            logger.warning(f"В строке {row} листа BotEvents уже не событие {event_id}, перестраиваем индекс строк")
+            self._index_event_rows(await self.gateway.call(self.worksheet.get_all_records))
+            row = self._event_rows.get(event_id)
+        return row
+
+    async def insert_event(self, record: Dict):
+        async with self._rows_lock:
+            # Строки уходят в лист в порядке постановки в очередь, поэтому номер известен заранее
+            self._event_rows[str(record['ID']).strip()] = self._next_event_row
+            self._next_event_row += 1
+            self.writer.append_row(self.worksheet, [record.get(header, '') for header in EVENT_HEADERS])
+
+    async def update_event(self, event_id: str, fields: Dict):
+        async with self._rows_lock:
+            row = await self._event_row(event_id)
+            if row is None:
+                logger.warning(f"Событие {event_id} не найдено в Google Sheets")
+                return
+            for field, value in fields.items():
+                self.writer.update_cell(self.worksheet, row, EVENT_HEADERS.index(field) + 1, value)
+
+    async def delete_event(self, event_id: str):
+        """Логическое удаление: строка остаётся на месте до уплотнения"""
+        async with self._rows_lock:
+            row = await self._event_row(event_id)
+            if row is None:
+                return
+            self.writer.update_cell(self.worksheet, row, EVENT_HEADERS.index('Status') + 1, EVENT_TOMBSTONE)
+            self._tombstones += 1
+
+    async def compact_events(self) -> int:
+        """Физически удаляет строки удалённых событий одним запросом и перестраивает индекс"""
+        if not self._tombstones:
+            return 0
+        async with self._rows_lock, self.writer.exclusive():
+            values = await self.gateway.call(self.worksheet.get_all_values)
+            status_col = EVENT_HEADERS.index('Status')
+            dead_rows = [row_index for row_index, row in enumerate(values[1:], start=2)
+                         if len(row) > status_col and row[status_col].strip() == EVENT_TOMBSTONE]
+            if dead_rows:
+                # Снизу вверх, чтобы удаление не сдвигало ещё не удалённые строки
+                requests = [{'deleteDimension': {'range': {
+                    'sheetId': self.worksheet.id, 'dimension': 'ROWS',
+                    'startIndex': row_index - 1, 'endIndex': row_index}}}
+                    for row_index in sorted(dead_rows, reverse=True)]
+                await self.gateway.call(self.worksheet.spreadsheet.batch_update, {'requests': requests})
+            dead = set(dead_rows)
+            kept = [row for row_index, row in enumerate(values[1:], start=2) if row_index not in dead]
+            self._index_event_rows([{'ID': row[0] if row else '', 'Status': ''} for row in kept])
+            return len(dead_rows)
+
+    async def load_chats(self) -> Tuple[List[Dict], List[Dict]]:
+        chats, topics = [], []
+        self._chat_rows.clear()
+        self._topic_rows.clear()
+        self._next_topic_row = 2
+        if self.topics_worksheet is None:
+            return chats, topics
+        rows = await self.gateway.call(self.topics_worksheet.get_all_records)
+        for row_index, row in enumerate(rows, start=2):
+            self._next_topic_row = row_index + 1
+            chat_id = str(row.get('ChatID', '')).strip()
+            if not chat_id:
+                continue
+            if chat_id not in self._chat_rows:
+                self._chat_rows[chat_id] = row_index
+                chats.append({
+                    'chat_id': chat_id,
+                    'title': row.get('ChatName', ''),
+                    'type': row.get('ChatType', 'SUPERGROUP'),
+                    'added_date': row.get('AddedDate', datetime.now().isoformat()),
+                })
+            try:
+                topic_id = int(row.get('TopicID') or 0)
+            except (ValueError, TypeError):
+                continue
+            if topic_id and (chat_id, topic_id) not in self._topic_rows:
+                self._topic_rows[(chat_id, topic_id)] = row_index
+                topics.append({
+                    'chat_id': chat_id,
+                    'topic_id': topic_id,
+                    'name': row.get('TopicName', ''),
+                    'status': row.get('Status', 'Open'),
+                    'added_date': row.get('AddedDate', ''),
+                })
+        return chats, topics
+
+    def _append_topic_row(self, row_data: List) -> int:
+        # Строки уходят в лист в порядке постановки в очередь, поэтому номер известен заранее
+        row_index = self._next_topic_row
+        self._next_topic_row += 1
+        self.writer.append_row(self.topics_worksheet, row_data)
+        return row_index
+
+    async def insert_chat(self, chat: Dict):
+        if self.topics_worksheet is None:
+            return
+        self._chat_rows[chat['chat_id']] = self._append_topic_row(
+            [chat['chat_id'], chat['title'], chat['type'], "", "", "", chat['added_date']])
+
+    async def _topics_row(self, rows: Dict, key, expected: Dict[int, str]) -> Optional[int]:
+        """Строка чата или топика в листе Topics; при расхождении индекс перестраивается"""
+        row = rows.get(key)
+        if row is not None and not await self._row_matches(self.topics_worksheet, row, expected):
+            logger.warning(f"Строка {row} листа Topics сдвинулась, перестраиваем индекс строк")
+            await self.load_chats()
+            row = rows.get(key)
+        return row
+
+    async def update_chat(self, chat_id: str, title: str):
+        row = await self._topics_row(self._chat_rows, chat_id, {1: chat_id})
+        if row is not None:
+            self.writer.update_cell(self.topics_worksheet, row, 2, title)  # ChatName в колонке 2
+
+    async def insert_topic(self, topic: Dict):
+        if self.topics_worksheet is None:
+            return
+        self._topic_rows[(topic['chat_id'], topic['topic_id'])] = self._append_topic_row(
+            [topic['chat_id'], topic.get('chat_name', ''), topic.get('chat_type', 'SUPERGROUP'),
+             topic['name'], str(topic['topic_id']), topic['status'], topic['added_date']])
+
+    async def update_topic(self, chat_id: str, topic_id: int, fields: Dict):
+        row = await self._topics_row(self._topic_rows, (chat_id, topic_id), {1: chat_id, 5: str(topic_id)})
+        if row is None:
+            return
+        if 'name' in fields:
+            self.writer.update_cell(self.topics_worksheet, row, 4, fields['name'])  # TopicName в колонке 4
+        if 'status' in fields:
+            self.writer.update_cell(self.topics_worksheet, row, 6, fields['status'])  # Status в колонке 6
+
+    async def load_dead_letters(self) -> List[Dict]:
+        self._dead_letter_rows.clear()
+        self._next_dead_letter_row = 2
+        if self.dead_letters_worksheet is None:
+            return []
+        rows = await self.gateway.call(self.dead_letters_worksheet.get_all_records)
+        self._next_dead_letter_row = len(rows) + 2
+        entries = []
+        for row_index, row in enumerate(rows, start=2):
+            entry_id = str(row.get('ID', '')).strip()
+            # Отправленные повторно строки остаются в листе как история
+            if entry_id and str(row.get('Status', '')).strip() == 'failed':
+                self._dead_letter_rows[entry_id] = row_index
+                entries.append(row)
+        return entries
+
+    async def insert_dead_letter(self, entry: Dict):
+        if self.dead_letters_worksheet is None:
+            logger.warning(f"Лист DeadLetters недоступен, публикация {entry['ID']} сохранена только в памяти")
+            return
+        self._dead_letter_rows[entry['ID']] = self._next_dead_letter_row
+        self._next_dead_letter_row += 1
+        self.writer.append_row(self.dead_letters_worksheet, [entry.get(header, '') for header in DEAD_LETTER_HEADERS])
+
+    async def resolve_dead_letter(self, entry_id: str):
+        row = self._dead_letter_rows.get(entry_id)
+        if row is not None and not await self._row_matches(self.dead_letters_worksheet, row, {1: entry_id}):
+            logger.warning(f"Строка {row} листа DeadLetters сдвинулась, перестраиваем индекс строк")
+            await self.load_dead_letters()
+            row = self._dead_letter_rows.get(entry_id)
+        self._dead_letter_rows.pop(entry_id, None)
+        if row is not None:
+            self.writer.update_cell(self.dead_letters_worksheet, row, DEAD_LETTER_HEADERS.index('Status') + 1, 'replayed')
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Локальное хранилище SQLite.
+
+    Все запросы выполняются в отдельном потоке (одно соединение на поток),
+    поэтому цикл событий не блокируется дисковым вводом-выводом.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            ID TEXT PRIMARY KEY, ChatID TEXT, Description TEXT, StartDate TEXT, EndDate TEXT,
+            Time TEXT, PeriodType TEXT, Text TEXT, Status TEXT
+        );
+        CREATE INDEX IF NOT EXISTS events_chat ON events (ChatID);
+        CREATE TABLE IF NOT EXISTS chats (
+            ChatID TEXT PRIMARY KEY, ChatName TEXT, ChatType TEXT, AddedDate TEXT
+        );
+        CREATE TABLE IF NOT EXISTS topics (
+            ChatID TEXT, TopicID INTEGER, TopicName TEXT, Status TEXT, AddedDate TEXT,
+            PRIMARY KEY (ChatID, TopicID)
+        );
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            ID TEXT PRIMARY KEY, EventID TEXT, ChatID TEXT, TopicID TEXT, Text TEXT,
+            Error TEXT, Attempts INTEGER, FailedAt TEXT, Status TEXT
+        );
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._conn = None
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+        finally:
+            trace_storage_call(loop.time() - started)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def _execute(self, sql: str, params=()):
+        conn = self._connect()
+        with conn:
+            conn.execute(sql, params)
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    async def start(self):
+        await self._call(self._connect)
+
+    async def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._call(_close)
+        self._executor.shutdown(wait=False)
+
+    async def load_events(self) -> List[Dict]:
+        return await self._call(self._query, f"SELECT {', '.join(EVENT_HEADERS)} FROM events ORDER BY rowid")
+
+    async def insert_event(self, record: Dict):
+        await self._call(
+            self._execute,
+            f"INSERT OR REPLACE INTO events ({', '.join(EVENT_HEADERS)}) VALUES ({', '.join('?' * len(EVENT_HEADERS))})",
+            [str(record.get(header, '')) for header in EVENT_HEADERS])
+
+    async def update_event(self, event_id: str, fields: Dict):
+        columns = [field for field in fields if field in EVENT_HEADERS]
+        if columns:
+            await self._call(
+                self._execute,
+                f"UPDATE events SET {', '.join(f'{column} = ?' for column in columns)} WHERE ID = ?",
+                [str(fields[column]) for column in columns] + [event_id])
+
+    async def delete_event(self, event_id: str):
+        await self._call(self._execute, "DELETE FROM events WHERE ID = ?", (event_id,))
+
+    async def load_chats(self) -> Tuple[List[Dict], List[Dict]]:
+        chats = await self._call(
+            self._query,
+            "SELECT ChatID AS chat_id, ChatName AS title, ChatType AS type, AddedDate AS added_date "
+            "FROM chats ORDER BY rowid")
+        topics = await self._call(
+            self._query,
+            "SELECT ChatID AS chat_id, TopicID AS topic_id, TopicName AS name, Status AS status, "
+            "AddedDate AS added_date FROM topics ORDER BY rowid")
+        return chats, topics
+
+    async def insert_chat(self, chat: Dict):
+        await self._call(
+            self._execute, "INSERT OR IGNORE INTO chats (ChatID, ChatName, ChatType, AddedDate) VALUES (?, ?, ?, ?)",
+            (chat['chat_id'], chat['title'], chat['type'], chat['added_date']))
+
+    async def update_chat(self, chat_id: str, title: str):
+        await self._call(self._execute, "UPDATE chats SET ChatName = ? WHERE ChatID = ?", (title, chat_id))
+
+    async def insert_topic(self, topic: Dict):
+        await self._call(
+            self._execute,
+            "INSERT OR IGNORE INTO topics (ChatID, TopicID, TopicName, Status, AddedDate) VALUES (?, ?, ?, ?, ?)",
+            (topic['chat_id'], topic['topic_id'], topic['name'], topic['status'], topic['added_date']))
+
+    async def update_topic(self, chat_id: str, topic_id: int, fields: Dict):
+        columns = {'name': 'TopicName', 'status': 'Status'}
+        updates = [(columns[field], value) for field, value in fields.items() if field in columns]
+        if updates:
+            await self._call(
+                self._execute,
+                f"UPDATE topics SET {', '.join(f'{column} = ?' for column, _ in updates)} WHERE ChatID = ? AND TopicID = ?",
+                [value for _, value in updates] + [chat_id, topic_id])
+
+    async def load_dead_letters(self) -> List[Dict]:
+        return await self._call(
+            self._query, f"SELECT {', '.join(DEAD_LETTER_HEADERS)} FROM dead_letters ORDER BY rowid")
+
+    async def insert_dead_letter(self, entry: Dict):
+        await self._call(
+            self._execute,
+            f"INSERT OR REPLACE INTO dead_letters ({', '.join(DEAD_LETTER_HEADERS)}) "
+            f"VALUES ({', '.join('?' * len(DEAD_LETTER_HEADERS))})",
+            [entry.get(header, '') for header in DEAD_LETTER_HEADERS])
+
+    async def resolve_dead_letter(self, entry_id: str):
+        await self._call(self._execute, "DELETE FROM dead_letters WHERE ID = ?", (entry_id,))
+
+    async def is_empty(self) -> bool:
+        rows = await self._call(
+            self._query,
+            "SELECT (SELECT COUNT(*) FROM events) + (SELECT COUNT(*) FROM chats) AS total")
+        return rows[0]['total'] == 0
+
+    async def import_snapshot(self, events: List[Dict], chats: List[Dict], topics: List[Dict]):
+        """Первичное заполнение пустой базы (например, из Google Sheets)"""
+        def _import():
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO events ({', '.join(EVENT_HEADERS)}) VALUES ({', '.join('?' * len(EVENT_HEADERS))})",
+                    [[str(record.get(header, '')) for header in EVENT_HEADERS]
+                     for record in events if str(record.get('ID', '')).strip()])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO chats (ChatID, ChatName, ChatType, AddedDate) VALUES (?, ?, ?, ?)",
+                    [(chat['chat_id'], chat['title'], chat['type'], str(chat['added_date'])) for chat in chats])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO topics (ChatID, TopicID, TopicName, Status, AddedDate) VALUES (?, ?, ?, ?, ?)",
+                    [(topic['chat_id'], topic['topic_id'], topic['name'], topic['status'], str(topic['added_date']))
+                     for topic in topics])
+        await self._call(_import)
+
+
+class MirroredBackend(StorageBackend):
+    """
+    Основное хранилище с асинхронным зеркалом.
+
+    Запись подтверждается основным хранилищем, а в зеркало (Google Sheets)
+    изменения уходят фоновой задачей в порядке поступления — задержки и
+    квоты зеркала не влияют на обработчики. Пустое основное хранилище при
+    первом запуске заполняется из зеркала; если зеркало недоступно, работа
+    начинается на пустой базе, а импорт повторяет фоновая задача и по
+    завершении вызывает on_bootstrap.
+    """
+
+    def __init__(self, primary: SQLiteBackend, mirror: StorageBackend,
+                 on_bootstrap: Optional[Callable[[], Awaitable[None]]] = None):
+        self.primary = primary
+        self.mirror = mirror
+        self.on_bootstrap = on_bootstrap
+        self._queue: asyncio.Queue = None
+        self._task: Optional[asyncio.Task] = None
+        self._mirror_ready = asyncio.Event()
+
+    # Пауза между попытками загрузить недоступное зеркало (секунды)
+    MIRROR_RETRY_DELAY = 30
+
+    async def start(self):
+        await self.primary.start()
+        self._queue = asyncio.Queue()
+        if await self.primary.is_empty():
+            # Первый запуск: основное хранилище заполняется из зеркала до начала работы
+            try:
+                await self._load_mirror(bootstrap=True)
+            except Exception as e:
+                logger.error(f"Не удалось заполнить базу SQLite из Google Sheets, начинаем с пустой базы: {e}")
+                self._task = asyncio.create_task(self._run(load_mirror=True, bootstrap=True))
+                return
+            self._mirror_ready.set()
+            self._task = asyncio.create_task(self._run())
+        else:
+            # Тёплый старт: зеркало загружается в фоне, изменения ждут в очереди
+            self._task = asyncio.create_task(self._run(load_mirror=True))
+
+    async def _load_mirror(self, bootstrap: bool = False):
+        await self.mirror.start()
+        # Зеркало загружаем всегда: SheetsBackend запоминает номера строк событий и Topics
+        mirror_chats, mirror_topics = await self.mirror.load_chats()
+        events = await self.mirror.load_events()
+        if bootstrap and (events or mirror_chats):
+            logger.info(f"📥 База SQLite пуста — импортируем {len(events)} событий и {len(mirror_chats)} чатов из Google Sheets")
+            await self.primary.import_snapshot(events, mirror_chats, mirror_topics)
+
+    async def close(self):
+        if self._queue is not None:
+            if self._mirror_ready.is_set():
+                await self._queue.join()
+            elif self._queue.qsize():
+                logger.warning(f"Зеркало так и не загрузилось: {self._queue.qsize()} изменений не попадут в Google Sheets")
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        await self.mirror.close()
+        await self.primary.close()
+
+    async def flush(self):
+        if self._queue is not None:
+            await self._queue.join()
+        await self.mirror.flush()
+
+    async def _run(self, load_mirror: bool = False, bootstrap: bool = False):
+        # Без номеров строк запись в зеркало невозможна, поэтому загрузку повторяем до успеха
+        while load_mirror:
+            try:
+                await self._load_mirror(bootstrap=bootstrap)
+                load_mirror = False
+                self._mirror_ready.set()
+                logger.info("Зеркало Google Sheets загружено")
+            except Exception as e:
+                logger.error(f"Ошибка загрузки зеркала Google Sheets, повтор через {self.MIRROR_RETRY_DELAY}с: {e}")
+                await asyncio.sleep(self.MIRROR_RETRY_DELAY)
+        if bootstrap and self.on_bootstrap is not None:
+            try:
+                await self.on_bootstrap()
+            except Exception as e:
+                logger.error(f"Ошибка обработки отложенного импорта из Google Sheets: {e}")
+        while True:
+            method, args = await self._queue.get()
+            try:
+                await getattr(self.mirror, method)(*args)
+            except Exception as e:
+                logger.error(f"Ошибка зеркалирования {method} в Google Sheets: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _mirror(self, method: str, *args):
+        if self._queue is not None:
+            self._queue.put_nowait((method, args))
+
+    def remirror_event(self, record: Dict):
+        """Повторно отправляет в зеркало событие, строка которого туда не дошла"""
+        self._mirror('insert_event', dict(record))
+
+    async def load_events(self) -> List[Dict]:
+        return await self.primary.load_events()
+
+    async def load_chats(self) -> Tuple[List[Dict], List[Dict]]:
+        return await self.primary.load_chats()
+
+    async def insert_event(self, record: Dict):
+        await self.primary.insert_event(record)
+        self._mirror('insert_event', dict(record))
+
+    async def update_event(self, event_id: str, fields: Dict):
+        await self.primary.update_event(event_id, fields)
+        self._mirror('update_event', event_id, dict(fields))
+
+    async def delete_event(self, event_id: str):
+        await self.primary.delete_event(event_id)
+        self._mirror('delete_event', event_id)
+
+    async def insert_chat(self, chat: Dict):
+        await self.primary.insert_chat(chat)
+        self._mirror('insert_chat', dict(chat))
+
+    async def update_chat(self, chat_id: str, title: str):
+        await self.primary.update_chat(chat_id, title)
+        self._mirror('update_chat', chat_id, title)
+
+    async def insert_topic(self, topic: Dict):
+        await self.primary.insert_topic(topic)
+        self._mirror('insert_topic', dict(topic))
+
+    async def update_topic(self, chat_id: str, topic_id: int, fields: Dict):
+        await self.primary.update_topic(chat_id, topic_id, fields)
+        self._mirror('update_topic', chat_id, topic_id, dict(fields))
+
+    # Очередь неотправленных публикаций — служебные данные бота, в зеркало не попадает
+    async def load_dead_letters(self) -> List[Dict]:
+        return await self.primary.load_dead_letters()
+
+    async def insert_dead_letter(self, entry: Dict):
+        await self.primary.insert_dead_letter(entry)
+
+    async def resolve_dead_letter(self, entry_id: str):
+        await self.primary.resolve_dead_letter(entry_id)
+
+
+def add_months(start: date, months: int) -> date:
+    """Сдвигает дату на months месяцев; день обрезается до конца месяца (31.01 -> 29.02)"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(period_kind: str, period_value, start_date: date, at_time: time,
+                    after: datetime) -> Optional[datetime]:
+    """
+    Ближайшая публикация серии строго позже after, без учёта даты окончания.
+
+    Считается арифметически от start_date, без перебора дней. Каждый месяц
+    отсчитывается от start_date, поэтому обрезка 31-го числа не накапливается.
+    Для 'once' возвращается сама дата начала; None — если серия не задана.
+    """
+    if period_kind == 'once':
+        return datetime.combine(start_date, at_time)
+    # Первая дата, в которую публикация ещё впереди
+    first = after.date()
+    if datetime.combine(first, at_time) <= after:
+        first += timedelta(days=1)
+    first = max(first, start_date)
+
+    step = {'daily': 1, 'weekly': 7}.get(period_kind)
+    if period_kind == 'custom_days' and period_value:
+        step = int(period_value)
+    if step:
+        periods = -(-(first - start_date).days // step)
+        return datetime.combine(start_date + timedelta(days=periods * step), at_time)
+    if period_kind == 'weekdays' and period_value:
+        shift = min((weekday - first.weekday()) % 7 for weekday in period_value)
+        return datetime.combine(first + timedelta(days=shift), at_time)
+    if period_kind == 'monthly':
+        months = (first.year - start_date.year) * 12 + first.month - start_date.month
+        candidate = add_months(start_date, months)
+        if candidate < first:
+            candidate = add_months(start_date, months + 1)
+        return datetime.combine(candidate, at_time)
+    return None
+
+
+class ScheduleState:
+    """
+    Состояние диспетчера в локальном SQLite: время следующей публикации и
+    последней отправки каждого события.
+
+    Изменения копятся в памяти и записываются пачкой раз в FLUSH_INTERVAL,
+    поэтому публикации не ждут диска. При перезапуске очередь диспетчера
+    восстанавливается из этого состояния без пересчёта расписания.
+    """
+
+    FLUSH_INTERVAL = 1.0
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS schedule (
+            EventID TEXT PRIMARY KEY, NextRun TEXT, Signature TEXT, LastPublishedAt TEXT
+        );
+    """
+
+    def __init__(self, path: str = SCHEDULE_STATE_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='schedule-state')
+        self._conn = None
+        self._rows: Dict[str, Dict] = {}
+        self._dirty: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def _read(self) -> List[Tuple]:
+        return self._connect().execute("SELECT EventID, NextRun, Signature, LastPublishedAt FROM schedule").fetchall()
+
+    def _write(self, upserts: List[Tuple], deletes: List[Tuple]):
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO schedule VALUES (?, ?, ?, ?)", upserts)
+            conn.executemany("DELETE FROM schedule WHERE EventID = ?", deletes)
+
+    async def start(self) -> int:
+        """Загружает сохранённое состояние и запускает фоновую запись"""
+        for event_id, next_run, signature, last_published_at in await self._call(self._read):
+            self._rows[event_id] = {
+                'next_run': datetime.fromisoformat(next_run) if next_run else None,
+                'signature': signature or '',
+                'last_published_at': datetime.fromisoformat(last_published_at) if last_published_at else None,
+            }
+        self._task = asyncio.create_task(self._run())
+        return len(self._rows)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._call(_close)
+        self._executor.shutdown(wait=False)
+
+    def get(self, event_id: str) -> Optional[Dict]:
+        return self._rows.get(event_id)
+
+    def event_ids(self) -> List[str]:
+        return list(self._rows)
+
+    def set_next_run(self, event_id: str, run_at: datetime, signature: str):
+        row = self._rows.setdefault(event_id, {'last_published_at': None})
+        row['next_run'] = run_at
+        row['signature'] = signature
+        self._dirty.add(event_id)
+
+    def mark_published(self, event_id: str, published_at: datetime):
+        row = self._rows.get(event_id)
+        if row is not None:
+            row['last_published_at'] = published_at
+            self._dirty.add(event_id)
+
+    def forget(self, event_id: str):
+        if self._rows.pop(event_id, None) is not None:
+            self._dirty.add(event_id)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for event_id in dirty:
+            row = self._rows.get(event_id)
+            if row is None:
+                deletes.append((event_id,))
+                continue
+            last_published_at = row['last_published_at']
+            upserts.append((event_id, row['next_run'].isoformat(), row['signature'],
+                            last_published_at.isoformat() if last_published_at else None))
+        try:
+            await self._call(self._write, upserts, deletes)
+        except Exception as e:
+            # Не потерять изменения: запишем их при следующей попытке
+            self._dirty |= dirty
+            logger.error(f"Ошибка записи состояния диспетчера: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            await self.flush()
+
+
+class Event:
+    """
+    Событие из листа BotEvents с заранее разобранными полями расписания.
+
+    Исходные строки хранятся для записи и отображения, а даты, время,
+    периодичность и цель публикации разбираются один раз — при создании
+    и при изменении полей. Некорректные значения разбираются в None.
+    """
+
+    # Заголовок листа -> атрибут с исходной строкой
+    FIELDS = {
+        'ID': 'id', 'ChatID': 'chat_ref', 'Description': 'description',
+        'StartDate': 'start_raw', 'EndDate': 'end_raw', 'Time': 'time_raw',
+        'PeriodType': 'period_raw', 'Text': 'text', 'Status': 'status',
+    }
+
+    __slots__ = tuple(FIELDS.values()) + (
+        'start_date', 'end_date', 'forever', 'time',
+        'period_kind', 'period_value', 'chat_id', 'topic_id',
+    )
+
+    def __init__(self, record: Dict):
+        for header, attr in self.FIELDS.items():
+            value = record.get(header)
+            setattr(self, attr, '' if value is None else str(value).strip())
+        self._parse()
+
+    @staticmethod
+    def _parse_date(value: str) -> Optional[date]:
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+    def _parse(self):
+        self.start_date = self._parse_date(self.start_raw)
+        self.forever = self.end_raw == 'FOREVER'
+        self.end_date = None if self.forever or not self.end_raw else self._parse_date(self.end_raw)
+        try:
+            self.time = datetime.strptime(self.time_raw, '%H:%M').time()
+        except ValueError:
+            self.time = None
+
+        # Старый формат хранил TopicID в периодичности: daily|topic:X
+        period = self.period_raw.split('|topic:')[0]
+        self.period_kind, self.period_value = period, None
+        if period.startswith('every_') and period.endswith('_days'):
+            try:
+                self.period_kind, self.period_value = 'custom_days', int(period.split('_')[1])
+            except (IndexError, ValueError):
+                pass
+        elif period.startswith('weekdays_'):
+            try:
+                self.period_kind = 'weekdays'
+                self.period_value = tuple(int(x) for x in period[len('weekdays_'):].split(',') if x.strip())
+            except ValueError:
+                self.period_kind = period
+
+        # ChatID топика превращается в chat_id при первой публикации (см. TelegramBot._event_target)
+        self.chat_id, self.topic_id = None, None
+        try:
+            if self.chat_ref.startswith('topic:'):
+                self.topic_id = int(self.chat_ref.split(':')[1])
+            else:
+                self.chat_id = int(self.chat_ref)
+        except (IndexError, ValueError):
+            pass
+
+    @property
+    def is_active(self) -> bool:
+        return self.status.lower() == 'active'
+
+    def next_occurrence(self, after: datetime) -> Optional[datetime]:
+        """Ближайшая публикация после after (без учёта даты окончания)"""
+        if self.start_date is None or self.time is None:
+            return None
+        return next_occurrence(self.period_kind, self.period_value, self.start_date, self.time, after)
+
+    def next_publication(self, after: datetime) -> Optional[datetime]:
+        """Ближайшая публикация после after с учётом даты окончания; None — серия завершена"""
+        next_datetime = self.next_occurrence(after)
+        if next_datetime is None or next_datetime <= after:
+            return None
+        if self.end_date and not self.forever and next_datetime.date() > self.end_date:
+            return None
+        return next_datetime
+
+    def schedule_signature(self) -> str:
+        """Поля расписания одной строкой: по ней видно, что сохранённое время публикации устарело"""
+        return '|'.join((self.start_raw, self.end_raw, self.time_raw, self.period_raw))
+
+    def field(self, header: str) -> str:
+        return getattr(self, self.FIELDS[header])
+
+    def to_record(self) -> Dict[str, str]:
+        return {header: getattr(self, attr) for header, attr in self.FIELDS.items()}
+
+    def apply(self, fields: Dict):
+        """Меняет поля (имена = заголовки листа) и заново разбирает расписание"""
+        for header, value in fields.items():
+            setattr(self, self.FIELDS[header], '' if value is None else str(value).strip())
+        self._parse()
+
+    def __repr__(self) -> str:
+        return f"Event(id={self.id!r}, chat={self.chat_ref!r}, period={self.period_raw!r}, status={self.status!r})"
+
+
+class EventStore:
+    """
+    Хранилище событий в памяти поверх StorageBackend.
+
+    Загружается один раз при старте, индексирует события по ID и по
+    идентификатору целевого чата (ChatID или topic:X). Чтение идёт из памяти,
+    запись — сквозная: сначала в хранилище, затем в кэш.
+    """
+
+    def __init__(self, backend: Optional[StorageBackend]):
+        self.backend = backend
+        self._events: Dict[str, Event] = {}
+        self._by_chat: Dict[str, set] = {}
+        # Версии локальных изменений: сверка с листом не откатывает правки, сделанные во время чтения
+        self._version = 0
+        self._touched: Dict[str, int] = {}
+
+    @staticmethod
+    def _key(value) -> str:
+        return str(value).strip()
+
+    async def load(self) -> int:
+        """Полностью перечитывает хранилище и перестраивает индексы"""
+        if self.backend is None:
+            return 0
+        records = await self.backend.load_events()
+        self._events.clear()
+        self._by_chat.clear()
+        for record in records:
+            event = Event(record)
+            if event.id:
+                self._index(event)
+        return len(self._events)
+
+    def _index(self, event: Event):
+        self._events[event.id] = event
+        self._by_chat.setdefault(event.chat_ref, set()).add(event.id)
+
+    def _unindex(self, event_id: str) -> Optional[Event]:
+        event = self._events.pop(event_id, None)
+        if event is not None:
+            ids = self._by_chat.get(event.chat_ref)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self._by_chat[event.chat_ref]
+        return event
+
+    def _touch(self, event_id: str):
+        self._version += 1
+        self._touched[event_id] = self._version
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __contains__(self, event_id) -> bool:
+        return self._key(event_id) in self._events
+
+    def get(self, event_id) -> Optional[Event]:
+        return self._events.get(self._key(event_id))
+
+    def all(self) -> List[Event]:
+        """События в порядке добавления"""
+        return list(self._events.values())
+
+    def by_chat(self, chat_identifier) -> List[Event]:
+        ids = self._by_chat.get(self._key(chat_identifier), ())
+        return [self._events[event_id] for event_id in ids]
+
+    async def add(self, record: Dict) -> Event:
+        event = Event(record)
+        self._touch(event.id)
+        await self.backend.insert_event(event.to_record())
+        self._index(event)
+        return event
+
+    def _apply(self, event: Event, fields: Dict):
+        if 'ChatID' in fields:
+            self._unindex(event.id)
+            event.apply(fields)
+            self._index(event)
+        else:
+            event.apply(fields)
+
+    async def update(self, event_id, **fields) -> Optional[Event]:
+        """Обновляет поля события (имена полей = заголовки листа)"""
+        event_id = self._key(event_id)
+        event = self._events.get(event_id)
+        if event is None:
+            return None
+        self._touch(event_id)
+        await self.backend.update_event(event_id, fields)
+        self._apply(event, fields)
+        return event
+
+    async def delete(self, event_id) -> bool:
+        event_id = self._key(event_id)
+        self._touch(event_id)
+        await self.backend.delete_event(event_id)
+        return self._unindex(event_id) is not None
+
+    def version(self) -> int:
+        """Номер последнего локального изменения (снимок перед чтением внешнего источника)"""
+        return self._version
+
+    async def reconcile(self, records: List[Dict], since_version: int, local: Optional[StorageBackend],
+                        deleted: Optional[set] = None) -> Tuple[List[str], List[str], List[str], List[str]]:
+        """
+        Применяет снимок внешнего источника (листа BotEvents) к памяти.
+
+        События, изменённые локально после since_version, пропускаются.
+        Изменения записываются в local (основное хранилище без зеркала), если оно задано.
+        Если задан deleted, источник — лишь зеркало: событие без строки в снимке
+        удаляется, только когда его ID есть в deleted, иначе оно считается
+        недописанным в зеркало. Без deleted удаляется всё, чего нет в снимке.
+        Возвращает ID (добавленных, изменённых в SCHEDULE_FIELDS, удалённых,
+        отсутствующих в зеркале) событий.
+        """
+        added, rescheduled, removed, missing = [], [], [], []
+        seen = set()
+        for row in records:
+            event_id = self._key(row.get('ID', ''))
+            if not event_id:
+                continue
+            seen.add(event_id)
+            if self._touched.get(event_id, 0) > since_version:
+                continue
+            incoming = Event(row)
+            event = self._events.get(event_id)
+            if event is None:
+                if local is not None:
+                    await local.insert_event(incoming.to_record())
+                self._index(incoming)
+                added.append(event_id)
+                continue
+            changes = {header: incoming.field(header) for header in EVENT_HEADERS
+                       if event.field(header) != incoming.field(header)}
+            if not changes:
+                continue
+            if local is not None:
+                await local.update_event(event_id, changes)
+            # Обновляем событие на месте: запланированные задачи ссылаются на этот же объект
+            self._apply(event, changes)
+            if any(field in changes for field in SCHEDULE_FIELDS):
+                rescheduled.append(event_id)
+        for event_id in [event_id for event_id in self._events if event_id not in seen]:
+            if self._touched.get(event_id, 0) > since_version:
+                continue
+            if deleted is not None and event_id not in deleted:
+                missing.append(event_id)
+                continue
+            if local is not None:
+                await local.delete_event(event_id)
+            self._unindex(event_id)
+            removed.append(event_id)
+        # Версии удалённых событий больше не нужны
+        for event_id in [event_id for event_id, version in self._touched.items()
+                         if version <= since_version and event_id not in self._events]:
+            del self._touched[event_id]
+        return added, rescheduled, removed, missing
+
+
+class DeadLetterQueue:
+    """
+    Публикации, которые не удалось отправить после всех повторов.
+
+    Каждая запись — снимок отправки (чат, топик, текст), поэтому повторить
+    её можно, даже если событие уже изменили или удалили. Хранится в
+    StorageBackend, в памяти держится копия для быстрых выборок.
+    """
+
+    def __init__(self, backend: Optional[StorageBackend]):
+        self.backend = backend
+        self._entries: Dict[str, Dict] = {}
+
+    async def load(self) -> int:
+        if self.backend is None:
+            return 0
+        self._entries = {str(entry['ID']): entry for entry in await self.backend.load_dead_letters()}
+        return len(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def for_chats(self, chat_ids) -> List[Dict]:
+        chat_ids = {str(chat_id) for chat_id in chat_ids}
+        return [entry for entry in self._entries.values() if str(entry['ChatID']) in chat_ids]
+
+    async def add(self, event_id: str, chat_id: int, topic_id: Optional[int], text: str,
+                  error: Exception, attempts: int) -> Dict:
+        entry = {
+            'ID': str(uuid.uuid4())[:8],
+            'EventID': event_id,
+            'ChatID': str(chat_id),
+            'TopicID': '' if topic_id is None else str(topic_id),
+            'Text': text,
+            'Error': f"{type(error).__name__}: {error}",
+            'Attempts': attempts,
+            'FailedAt': datetime.now().isoformat(timespec='seconds'),
+            'Status': 'failed',
+        }
+        self._entries[entry['ID']] = entry
+        if self.backend is not None:
+            await self.backend.insert_dead_letter(entry)
+        return entry
+
+    async def resolve(self, entry_id: str):
+        if self._entries.pop(entry_id, None) is not None and self.backend is not None:
+            await self.backend.resolve_dead_letter(entry_id)
+
+
+class ChatRegistry:
+    """
+    Реестр чатов и топиков в памяти поверх StorageBackend.
+
+    Индексы: chat_id -> чат, chat_id -> {topic_id -> топик} (поиск по паре
+    (chat_id, topic_id)) и topic_id -> chat_id. В хранилище уходят только
+    реально изменившиеся поля.
+    """
+
+    def __init__(self, backend: Optional[StorageBackend]):
+        self.backend = backend
+        self._chats: Dict[str, Dict] = {}
+        self._topics: Dict[str, Dict[int, Dict]] = {}
+        self._topic_chat: Dict[int, str] = {}
+
+    async def load(self) -> int:
+        """Полностью перечитывает хранилище и перестраивает индексы"""
+        if self.backend is None:
+            return 0
+        chats, topics = await self.backend.load_chats()
+        self._chats.clear()
+        self._topics.clear()
+        self._topic_chat.clear()
+        for chat in chats:
+            self._chats.setdefault(str(chat['chat_id']), {
+                'title': chat['title'], 'type': chat['type'], 'added_date': chat['added_date']})
+        for topic in topics:
+            chat_id = str(topic['chat_id'])
+            topic_id = int(topic['topic_id'])
+            if topic_id not in self._topics.get(chat_id, {}):
+                self._topics.setdefault(chat_id, {})[topic_id] = {'name': topic['name'], 'status': topic['status']}
+                self._topic_chat.setdefault(topic_id, chat_id)
+        return len(self._chats)
+
+    def has_chat(self, chat_id) -> bool:
+        return str(chat_id) in self._chats
+
+    def chat_name(self, chat_id) -> str:
+        chat = self._chats.get(str(chat_id))
+        return chat['title'] if chat and chat['title'] else str(chat_id)
+
+    def chat_changed(self, chat_id, chat_name: str) -> bool:
+        """True, если чат неизвестен или его название отличается от сохранённого"""
+        chat = self._chats.get(str(chat_id))
+        return chat is None or chat['title'] != chat_name
+
+    def chat_type(self, chat_id, default: str = "SUPERGROUP") -> str:
+        chat = self._chats.get(str(chat_id))
+        return chat['type'] if chat and chat['type'] else default
+
+    def all_chats(self) -> Dict[str, dict]:
+        return {
+            chat_id: {'title': chat['title'], 'type': chat['type'], 'added_date': chat['added_date']}
+            for chat_id, chat in self._chats.items()
+        }
+
+    def has_topic(self, chat_id, topic_id) -> bool:
+        return topic_id in self._topics.get(str(chat_id), {})
+
+    def chat_topics(self, chat_id, include_closed: bool = False) -> Dict[int, str]:
+        """Топики чата {topic_id: отображаемое название}"""
+        topics = {}
+        for topic_id, topic in self._topics.get(str(chat_id), {}).items():
+            if not include_closed and topic['status'] != 'Open':
+                continue
+            if topic['name']:
+                display_name = topic['name']
+                if topic['status'] == 'Closed':
+                    display_name = f"{display_name} [ЗАКРЫТ]"
+                topics[topic_id] = display_name
+        return topics
+
+    def topic_status(self, chat_id, topic_id) -> str:
+        topic = self._topics.get(str(chat_id), {}).get(int(topic_id))
+        return topic['status'] if topic else "Open"
+
+    def chat_id_by_topic(self, topic_id) -> Optional[int]:
+        chat_id = self._topic_chat.get(int(topic_id))
+        try:
+            return int(chat_id) if chat_id else None
+        except (ValueError, TypeError):
+            return None
+
+    def topic_name(self, topic_id, default: str = None) -> Optional[str]:
+        chat_id = self._topic_chat.get(int(topic_id))
+        if chat_id is None:
+            return default
+        return self._topics[chat_id][int(topic_id)]['name'] or default
+
+    async def save_chat(self, chat_id, chat_name: str, chat_type: str) -> bool:
+        """Добавляет чат или обновляет его название. Возвращает True, если была запись в хранилище"""
+        chat_key = str(chat_id)
+        chat = self._chats.get(chat_key)
+        if chat is not None:
+            if chat['title'] == chat_name:
+                return False
+            chat['title'] = chat_name
+            await self.backend.update_chat(chat_key, chat_name)
+            return True
+        chat = {'title': chat_name, 'type': chat_type, 'added_date': datetime.now().isoformat()}
+        self._chats[chat_key] = chat
+        await self.backend.insert_chat(dict(chat, chat_id=chat_key))
+        return True
+
+    async def add_topic(self, chat_id, topic_id: int, topic_name: str, closed: bool = False) -> bool:
+        """Добавляет топик; если он уже есть — обновляет название и статус"""
+        if self.has_topic(chat_id, topic_id):
+            return await self.update_topic(chat_id, topic_id, name=topic_name, closed=closed)
+        chat_key = str(chat_id)
+        status = "Closed" if closed else "Open"
+        self._topics.setdefault(chat_key, {})[topic_id] = {'name': topic_name, 'status': status}
+        self._topic_chat.setdefault(topic_id, chat_key)
+        await self.backend.insert_topic({
+            'chat_id': chat_key, 'topic_id': topic_id, 'name': topic_name, 'status': status,
+            'added_date': datetime.now().isoformat(),
+            'chat_name': self.chat_name(chat_id), 'chat_type': self.chat_type(chat_id),
+        })
+        return True
+
+    async def update_topic(self, chat_id, topic_id: int, name: str = None, closed: bool = None) -> bool:
+        """Обновляет только изменившиеся поля топика"""
+        topic = self._topics.get(str(chat_id), {}).get(topic_id)
+        if topic is None:
+            if name is not None:
+                return await self.add_topic(chat_id, topic_id, name, closed or False)
+            return False
+        fields = {}
+        if name is not None and topic['name'] != name:
+            fields['name'] = name
+        if closed is not None:
+            status = "Closed" if closed else "Open"
+            if topic['status'] != status:
+                fields['status'] = status
+        if not fields:
+            return False
+        topic.update(fields)
+        await self.backend.update_topic(str(chat_id), topic_id, fields)
+        return True
+
+
+class SlotAllocator:
+    """
+    Детерминированное распределение публикаций одной минуты по секундам.
+
+    Стартовая секунда события — crc32 от (чат, ID события), поэтому
+    публикации равномерно расходятся по минуте и при перезапуске получают
+    те же слоты. От неё ищется ближайшая секунда, в которой ещё есть место
+    в общем лимите (PUBLISH_GLOBAL_RATE в секунду) и которая отстоит от
+    других публикаций того же чата минимум на 60 / PUBLISH_GROUP_RATE
+    секунд (в том числе через границу минуты). Если в минуте места нет,
+    слот ищется в следующей минуте и учитывается уже в ней.
+    """
+
+    # Как часто забывать слоты прошедших минут (секунды)
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, per_second: float = PUBLISH_GLOBAL_RATE, group_rate: float = PUBLISH_GROUP_RATE):
+        self.per_second = max(1, int(per_second))
+        self.group_spacing = max(1, math.ceil(60 / group_rate))
+        self._load: Dict[datetime, Dict[int, int]] = {}
+        self._chat_seconds: Dict[Tuple[datetime, str], List[int]] = {}
+        self._slots: Dict[str, Tuple[datetime, str, int]] = {}
+        self._pruned_at = datetime.now()
+
+    def allocate(self, event_id: str, chat_key: str, at: datetime, is_group: bool = True) -> datetime:
+        """Время отправки события внутри минуты at"""
+        minute = at.replace(second=0, microsecond=0)
+        current = self._slots.get(event_id)
+        if current is not None and current[:2] == (minute, chat_key):
+            return minute + timedelta(seconds=current[2])
+        self.release(event_id)
+        self._prune()
+
+        spacing = self.group_spacing if is_group else 1
+        start = zlib.crc32(f"{chat_key}:{event_id}".encode()) % 60
+        while True:
+            load = self._load.get(minute, {})
+            # Секунды отправок в этот чат относительно начала минуты, включая соседние минуты
+            chat_seconds = [used + offset for offset in (-60, 0, 60)
+                            for used in self._chat_seconds.get((minute + timedelta(seconds=offset), chat_key), ())]
+            candidates = itertools.chain(range(start, 60), range(start))
+            second = next((candidate for candidate in candidates
+                           if load.get(candidate, 0) < self.per_second
+                           and all(abs(candidate - used) >= spacing for used in chat_seconds)), None)
+            if second is not None:
+                break
+            # Минута заполнена — слот переносится в следующую и занимает место в ней
+            minute += timedelta(minutes=1)
+        self._occupy(event_id, chat_key, minute, second)
+        return minute + timedelta(seconds=second)
+
+    def restore(self, event_id: str, chat_key: str, run_at: datetime):
+        """Занимает уже выданный слот (восстановление после перезапуска)"""
+        self.release(event_id)
+        minute = run_at.replace(second=0, microsecond=0)
+        self._occupy(event_id, chat_key, minute, int((run_at - minute).total_seconds()))
+
+    def _occupy(self, event_id: str, chat_key: str, minute: datetime, second: int):
+        load = self._load.setdefault(minute, {})
+        load[second] = load.get(second, 0) + 1
+        self._chat_seconds.setdefault((minute, chat_key), []).append(second)
+        self._slots[event_id] = (minute, chat_key, second)
+
+    def release(self, event_id: str):
+        slot = self._slots.pop(event_id, None)
+        if slot is None:
+            return
+        minute, chat_key, second = slot
+        load = self._load.get(minute)
+        if load is not None:
+            load[second] -= 1
+            if not load[second]:
+                del load[second]
+            if not load:
+                del self._load[minute]
+        chat_seconds = self._chat_seconds.get((minute, chat_key))
+        if chat_seconds is not None:
+            chat_seconds.remove(second)
+            if not chat_seconds:
+                del self._chat_seconds[(minute, chat_key)]
+
+    def _prune(self):
+        now = datetime.now()
+        if (now - self._pruned_at).total_seconds() < self.PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        # Слоты уже прошедших минут (например, выполненных разовых событий) больше не нужны
+        horizon = now - timedelta(minutes=1)
+        for event_id in [event_id for event_id, slot in self._slots.items() if slot[0] < horizon]:
+            self.release(event_id)
+
+
+class PublicationDispatcher:
+    """
+    Диспетчер публикаций: одна min-куча (время, ID события) вместо задачи
+    APScheduler на каждую публикацию.
+
+    Фоновая задача спит до ближайшего срока и передаёт наступившие события
+    обработчику пачками. _due — индекс ID события -> (время, номер записи):
+    у события не больше одной актуальной публикации, поиск и отмена стоят
+    O(1), перепланирование — O(log n). Запись кучи действует, только пока её
+    номер совпадает с индексом, остальные отбрасываются при извлечении
+    (ленивое удаление), поэтому одна публикация не может уйти дважды.
+    """
+
+    # Максимальный сон: защищает от переводов системных часов
+    MAX_SLEEP = 60.0
+
+    def __init__(self, handler: Callable[[List[str]], Awaitable[None]], batch_size: int = DISPATCH_BATCH_SIZE):
+        self.handler = handler
+        self.batch_size = batch_size
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._due: Dict[str, Tuple[datetime, int]] = {}
+        self._counter = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._batches: set = set()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, event_id) -> bool:
+        return str(event_id) in self._due
+
+    def scheduled_at(self, event_id) -> Optional[datetime]:
+        due = self._due.get(str(event_id))
+        return due[0] if due else None
+
+    @staticmethod
+    def occurrence_id(event_id, run_at: datetime) -> str:
+        """Канонический идентификатор публикации: одно событие + одно время"""
+        return f"event_{event_id}_{run_at:%Y%m%dT%H%M%S}"
+
+    def schedule(self, event_id, run_at: datetime) -> bool:
+        """Назначает (или переносит) публикацию события. False — эта публикация уже запланирована"""
+        event_id = str(event_id)
+        due = self._due.get(event_id)
+        if due is not None and due[0] == run_at:
+            return False
+        self._counter += 1
+        self._due[event_id] = (run_at, self._counter)
+        heapq.heappush(self._heap, (run_at, self._counter, event_id))
+        if self._heap[0][2] == event_id:
+            self._wakeup.set()
+        # Устаревших записей стало слишком много — пересобираем кучу
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [entry for entry in self._heap if self._is_current(entry)]
+            heapq.heapify(self._heap)
+        return True
+
+    def cancel(self, event_id) -> bool:
+        return self._due.pop(str(event_id), None) is not None
+
+    def _is_current(self, entry: Tuple[datetime, int, str]) -> bool:
+        run_at, number, event_id = entry
+        return self._due.get(event_id) == (run_at, number)
+
+    def _drop_stale(self):
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: datetime) -> List[str]:
+        batch = []
+        while len(batch) < self.batch_size:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, _, event_id = heapq.heappop(self._heap)
+            del self._due[event_id]
+            batch.append(event_id)
+        return batch
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._drop_stale()
+            self._wakeup.clear()
+            if self._heap:
+                delay = (self._heap[0][0] - datetime.now()).total_seconds()
+            else:
+                delay = self.MAX_SLEEP
+            if delay > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, self.MAX_SLEEP))
+                continue
+            batch = self._pop_due(datetime.now())
+            if batch:
+                # Пачка публикуется в отдельной задаче, чтобы медленная отправка не задерживала следующие сроки
+                task = asyncio.create_task(self._dispatch(batch))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+
+    async def _dispatch(self, batch: List[str]):
+        try:
+            await self.handler(batch)
+        except Exception as e:
+            logger.error(f"Ошибка обработки пачки из {len(batch)} публикаций: {e}")
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из ответа Telegram о flood control в секундах"""
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+class TokenBucket:
+    """
+    Корзина маркеров с резервированием.
+
+    reserve() сразу занимает маркер (баланс может уйти в минус) и возвращает,
+    сколько секунд ждать до разрешённой отправки. Так очередь ожидающих
+    получает слоты строго по порядку и ровно с заданной скоростью.
+    """
+
+    __slots__ = ('rate', 'capacity', '_tokens', '_updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = 0.0
+
+    def _refill(self, now: float):
+        if self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, now: float) -> float:
+        self._refill(now)
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, now: float, seconds: float):
+        """Не выдавать маркеры ближайшие seconds секунд"""
+        self._refill(now)
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        """Корзина полна — её можно забыть без изменения поведения"""
+        self._refill(now)
+        return self._tokens >= self.capacity
+
+
+class RateLimitedPublisher:
+    """
+    Очередь отправки публикаций с лимитами Telegram.
+
+    Каждое сообщение сначала получает слот в корзине своего чата (группы —
+    PUBLISH_GROUP_RATE в минуту, личные чаты — одно в секунду) и до него
+    ждёт в таймере, не занимая обработчиков. Затем обработчики забирают
+    сообщения по порядку и отправляют их не быстрее общей корзины
+    (PUBLISH_GLOBAL_RATE в секунду).
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[Any]],
+                 global_rate: float = PUBLISH_GLOBAL_RATE, group_rate: float = PUBLISH_GROUP_RATE,
+                 chat_burst: float = PUBLISH_CHAT_BURST, workers: int = PUBLISH_WORKERS):
+        self.send = send
+        self.group_rate = group_rate / 60
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self._global = TokenBucket(global_rate, 1)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._pending: set = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Отрицательные ID — группы и каналы, положительные — личные чаты
+            rate = self.group_rate if chat_id < 0 else 1.0
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+            if len(self._chats) % 1024 == 0:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+                self._chats[chat_id] = bucket
+        return bucket
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for future in list(self._pending):
+            if not future.done():
+                future.set_exception(RuntimeError("Отправка остановлена при завершении работы"))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._ready = None
+
+    async def publish(self, chat_id: int, **params) -> Any:
+        """Ставит сообщение в очередь и ждёт результата send_message"""
+        if self._ready is None:
+            raise RuntimeError("Очередь отправки не запущена")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        item = (chat_id, params, future)
+        delay = self._chat_bucket(chat_id, loop.time()).reserve(loop.time())
+        if delay > 0:
+            loop.call_later(delay, self._ready.put_nowait, item)
+        else:
+            self._ready.put_nowait(item)
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id, params, future = await self._ready.get()
+            if future.done():
+                continue
+            delay = self._global.reserve(loop.time())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await self.send(chat_id=chat_id, **params)
+            except Exception as e:
+                if isinstance(e, RetryAfter):
+                    # Flood control действует на весь бот: притормаживаем все отправки
+                    self._global.pause(loop.time(), retry_after_seconds(e))
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+
+class TTLCache:
+    """
+    Словарь, записи которого устаревают через ttl секунд.
+
+    Время берётся из часов event loop, устаревшие записи вычищаются
+    при обращении и не реже раза в ttl.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._next_prune = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_running_loop().time()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= self._now():
+            del self._entries[key]
+            return default
+        return entry[1]
+
+    def put(self, key, value):
+        now = self._now()
+        self._entries[key] = (now + self.ttl, value)
+        if now >= self._next_prune:
+            self._entries = {k: entry for k, entry in self._entries.items() if entry[0] > now}
+            self._next_prune = now + self.ttl
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+
 class TelegramBot:
     def _get_period_display_ru(self, period_type, period_value=None):
         mapping = {
@@ -102,23 +2232,59 @@ class TelegramBot:
             reply_markup=reply_markup
         )
         return MAIN_MENU
+    async def _is_chat_admin(self, bot, chat_id, user_id: int, use_cache: bool = True) -> bool:
+        """
+        Является ли пользователь администратором чата.
+        Ответ Telegram запоминается на ADMIN_CACHE_TTL секунд; use_cache=False
+        всегда спрашивает Telegram и обновляет запомненный ответ.
+        """
+        key = (user_id, str(chat_id))
+        if use_cache:
+            is_admin = self.admin_rights.get(key)
+            if is_admin is not None:
+                return is_admin
+        chat_member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        is_admin = chat_member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+        self.admin_rights.put(key, is_admin)
+        return is_admin
+
     async def _get_available_chats(self, user_id: int, bot) -> dict:
         """
         Возвращает словарь {chat_id: chat_name} для чатов, где пользователь является администратором.
         """
-        available_chats = {}
         all_chats = self._get_all_chats_from_sheets()
         
-        for chat_id in all_chats:
-            try:
-                chat_member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-                if chat_member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
-                    chat_name = self._get_chat_name_by_id(chat_id)
-                    available_chats[str(chat_id)] = chat_name
-            except Exception as e:
-                logger.warning(f"Не удалось проверить права пользователя {user_id} в чате {chat_id}: {e}")
-        return available_chats
+        # Права проверяются параллельно, но не больше ADMIN_CHECK_CONCURRENCY запросов одновременно
+        semaphore = asyncio.Semaphore(ADMIN_CHECK_CONCURRENCY)
+        
+        async def check_chat(chat_id):
+            async with semaphore:
+                try:
+                    return chat_id, await self._is_chat_admin(bot, chat_id, user_id)
+                except Exception as e:
+                    logger.warning(f"Не удалось проверить права пользователя {user_id} в чате {chat_id}: {e}")
+                    return chat_id, False
+        
+        results = await asyncio.gather(*(check_chat(chat_id) for chat_id in all_chats))
+        return {
+            str(chat_id): self._get_chat_name_by_id(chat_id)
+            for chat_id, is_admin in results if is_admin
+        }
     
+    async def _get_chat_info(self, bot, chat_id):
+        """Сведения о чате: из кэша, а если их нет или они устарели — через get_chat"""
+        chat = self.chat_info.get(str(chat_id))
+        if chat is None:
+            chat = await bot.get_chat(chat_id)
+            self.chat_info.put(str(chat_id), chat)
+        return chat
+
+    def _remember_chat(self, chat):
+        """Обновляет кэш сведений о чате по объекту чата из входящего сообщения"""
+        if chat is not None and chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
+            self.chat_info.put(str(chat.id), chat)
+        return chat
+
     async def _get_forum_topics(self, bot, chat_id: int) -> dict:
         """
         Получает список реальных топиков форума для супергруппы из Google Sheets.
@@ -126,7 +2292,7 @@ class TelegramBot:
         """
         try:
             # Проверяем, является ли чат супергруппой с форумом
-            chat = await bot.get_chat(chat_id)
+            chat = await self._get_chat_info(bot, chat_id)
             
             if hasattr(chat, 'is_forum') and chat.is_forum:
                 # Для форумов получаем топики из Google Sheets (включая закрытые для отображения)
@@ -152,231 +2318,83 @@ class TelegramBot:
             return {None: "💬 Общий чат"}
     
     def _get_chat_name_by_id(self, chat_id: int) -> str:
-        """Получает название чата по его ID из Google Sheets"""
-        try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                return str(chat_id)
-                
-            # Получаем все записи из Google Sheets
-            all_data = self.topics_worksheet.get_all_records()
-            
-            for row in all_data:
-                if str(row.get('ChatID')) == str(chat_id):
-                    return row.get('ChatName', str(chat_id))
-            
-            # Если не найдено, возвращаем ID как строку
-            return str(chat_id)
-        except Exception as e:
-            logger.error(f"Ошибка получения названия чата {chat_id}: {e}")
-            return str(chat_id)
+        """Получает название чата по его ID из реестра чатов"""
+        return self.chats.chat_name(chat_id)
 
-    def _save_chat_to_sheets(self, chat_id: int, chat_name: str, chat_type: str):
+    async def _save_chat_to_sheets(self, chat_id: int, chat_name: str, chat_type: str):
         """Сохраняет информацию о чате в Google Sheets"""
         try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                logger.error("❌ Topics worksheet не инициализирован")
+            if self.storage is None:
+                logger.error("❌ Хранилище не инициализировано")
                 return
-                
-            # Проверяем, есть ли уже запись о чате
-            all_data = self.topics_worksheet.get_all_records()
-            chat_exists = False
-            
-            for row_index, row in enumerate(all_data, start=2):  # +2 из-за заголовка
-                if str(row.get('ChatID')) == str(chat_id):
-                    # Обновляем существующую запись
-                    if row.get('ChatName') != chat_name:
-                        self.topics_worksheet.update_cell(row_index, 2, chat_name)  # ChatName в колонке 2
-                        logger.info(f"📝 Обновлено название чата {chat_id}: {chat_name}")
-                    chat_exists = True
-                    break
-            
-            if not chat_exists:
-                # Добавляем новую запись о чате (без топика)
-                row_data = [str(chat_id), chat_name, chat_type, "", "", "", datetime.now().isoformat()]
-                self.topics_worksheet.append_row(row_data)
-                logger.info(f"➕ Добавлен новый чат в Google Sheets: {chat_name} (ID: {chat_id})")
+            
+            is_new = not self.chats.has_chat(chat_id)
+            if await self.chats.save_chat(chat_id, chat_name, chat_type):
+                if is_new:
+                    logger.info(f"➕ Добавлен новый чат в Google Sheets: {chat_name} (ID: {chat_id})")
+                else:
+                    logger.info(f"📝 Обновлено название чата {chat_id}: {chat_name}")
                 
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения чата в Google Sheets: {e}")
 
-    def _add_topic_to_sheets(self, chat_id: int, topic_id: int, topic_name: str, closed: bool = False):
+    async def _add_topic_to_sheets(self, chat_id: int, topic_id: int, topic_name: str, closed: bool = False):
         """Добавляет топик в Google Sheets"""
         try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                logger.error("❌ Topics worksheet не инициализирован")
+            if self.storage is None:
+                logger.error("❌ Хранилище не инициализировано")
                 return
-                
-            chat_name = self._get_chat_name_by_id(chat_id)
-            status = "Closed" if closed else "Open"
-            
-            logger.info(f"📝 Попытка добавить топик: ChatID={chat_id}, ChatName='{chat_name}', TopicName='{topic_name}', TopicID={topic_id}, Status={status}")
-            
-            # Проверяем, существует ли уже топик с таким ChatID и TopicID
-            existing_data = self.topics_worksheet.get_all_records()
-            logger.info(f"📊 Получено {len(existing_data)} записей из Google Sheets")
-            
-            for row_index, row in enumerate(existing_data, start=2):  # +2 из-за заголовка
-                if (str(row.get('ChatID')) == str(chat_id) and 
-                    str(row.get('TopicID')) == str(topic_id)):
-                    logger.info(f"⚠️ Топик с ID {topic_id} уже существует, обновляем вместо добавления")
-                    # Обновляем существующий топик
-                    if row.get('TopicName') != topic_name:
-                        self.topics_worksheet.update_cell(row_index, 4, topic_name)  # TopicName в колонке 4
-                        logger.info(f"📝 Обновлено название топика {topic_id} на '{topic_name}'")
-                    
-                    if row.get('Status') != status:
-                        self.topics_worksheet.update_cell(row_index, 6, status)  # Status в колонке 6
-                        logger.info(f"🔄 Обновлен статус топика {topic_id} на '{status}'")
-                    
-                    return
             
-            # Получаем тип чата (попробуем найти в существующих записях или установить по умолчанию)
-            chat_type = "SUPERGROUP"
-            for row in existing_data:
-                if str(row.get('ChatID')) == str(chat_id) and row.get('ChatType'):
-                    chat_type = row.get('ChatType')
-                    break
+            status = "Closed" if closed else "Open"
+            logger.debug("📝 Попытка добавить топик: ChatID=%s, TopicName='%s', TopicID=%s, Status=%s",
+                         chat_id, topic_name, topic_id, status)
             
-            # Добавляем новый топик
-            row_data = [str(chat_id), chat_name, chat_type, topic_name, str(topic_id), status, datetime.now().isoformat()]
-            logger.info(f"➕ Добавляем строку в Google Sheets: {row_data}")
+            if self.chats.has_topic(chat_id, topic_id):
+                logger.info(f"⚠️ Топик с ID {topic_id} уже существует, обновляем вместо добавления")
+                await self.chats.update_topic(chat_id, topic_id, name=topic_name, closed=closed)
+                return
             
-            self.topics_worksheet.append_row(row_data)
-            logger.info(f"✅ Топик успешно добавлен в Google Sheets: {chat_name} -> {topic_name} (ID: {topic_id})")
+            await self.chats.add_topic(chat_id, topic_id, topic_name, closed)
+            logger.info(f"✅ Топик успешно добавлен в Google Sheets: {self.chats.chat_name(chat_id)} -> {topic_name} (ID: {topic_id})")
             
         except Exception as e:
             logger.error(f"❌ Ошибка добавления топика в Google Sheets: {e}")
             logger.exception("Полная трассировка ошибки:")
 
-    def _update_topic_in_sheets(self, chat_id: int, topic_id: int, name: str = None, closed: bool = None):
+    async def _update_topic_in_sheets(self, chat_id: int, topic_id: int, name: str = None, closed: bool = None):
         """Обновляет топик в Google Sheets"""
         try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                logger.error("Topics worksheet не инициализирован")
+            if self.storage is None:
+                logger.error("Хранилище не инициализировано")
                 return
-                
-            # Получаем все данные
-            all_data = self.topics_worksheet.get_all_records()
-            
-            # Ищем строку для обновления
-            for row_index, row in enumerate(all_data, start=2):  # +2 потому что начинаем с 2-й строки (1-я = заголовки)
-                if (str(row.get('ChatID')) == str(chat_id) and 
-                    str(row.get('TopicID')) == str(topic_id)):
-                    
-                    # Обновляем данные
-                    if name is not None:
-                        self.topics_worksheet.update_cell(row_index, 4, name)  # TopicName в колонке 4
-                        logger.info(f"Обновлено название топика {topic_id} на '{name}'")
-                    
-                    if closed is not None:
-                        status = "Closed" if closed else "Open"
-                        self.topics_worksheet.update_cell(row_index, 6, status)  # Status в колонке 6
-                        logger.info(f"Обновлен статус топика {topic_id} на '{status}'")
-                    
-                    return
             
-            # Если топик не найден, добавляем его
-            if name is not None:
-                self._add_topic_to_sheets(chat_id, topic_id, name, closed or False)
+            if await self.chats.update_topic(chat_id, topic_id, name=name, closed=closed):
+                logger.info(f"Обновлен топик {topic_id}: name={name}, closed={closed}")
                 
         except Exception as e:
             logger.error(f"Ошибка обновления топика в Google Sheets: {e}")
 
     def _get_chat_topics_from_sheets(self, chat_id: int, include_closed: bool = False) -> Dict[int, str]:
-        """Получает топики чата из Google Sheets"""
-        try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                logger.error("Topics worksheet не инициализирован")
-                return {}
-                
-            # Получаем все записи
-            all_data = self.topics_worksheet.get_all_records()
-            
-            topics = {}
-            for row in all_data:
-                if (str(row.get('ChatID')) == str(chat_id) and 
-                    row.get('TopicID')):  # Только записи с TopicID (не пустые записи чатов)
-                    
-                    # Фильтруем по статусу только если не включены закрытые
-                    if not include_closed and row.get('Status') != 'Open':
-                        continue
-                        
-                    try:
-                        topic_id = int(row.get('TopicID', 0))
-                        topic_name = row.get('TopicName', '')
-                        topic_status = row.get('Status', 'Open')
-                        
-                        if topic_id and topic_name:
-                            # Добавляем метку для закрытых топиков
-                            display_name = topic_name
-                            if topic_status == 'Closed':
-                                display_name = f"{topic_name} [ЗАКРЫТ]"
-                            topics[topic_id] = display_name
-                    except (ValueError, TypeError):
-                        continue
-            
-            logger.info(f"Получены топики для чата {chat_id}: {topics}")
-            return topics
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения топиков из Google Sheets: {e}")
-            return {}
+        """Получает топики чата из реестра (зеркало листа Topics)"""
+        return self.chats.chat_topics(chat_id, include_closed=include_closed)
     
     def _check_topic_status(self, chat_id: int, topic_id: int) -> str:
         """Проверяет статус топика (Open/Closed)"""
-        try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                return "Open"  # По умолчанию считаем открытым
-                
-            all_data = self.topics_worksheet.get_all_records()
-            
-            for row in all_data:
-                if (str(row.get('ChatID')) == str(chat_id) and 
-                    str(row.get('TopicID')) == str(topic_id)):
-                    return row.get('Status', 'Open')
-            
-            return "Open"  # Если не найден, считаем открытым
-            
-        except Exception as e:
-            logger.error(f"Ошибка проверки статуса топика: {e}")
-            return "Open"
+        return self.chats.topic_status(chat_id, topic_id)
 
     def _get_all_chats_from_sheets(self) -> Dict[str, dict]:
-        """Получает все чаты из Google Sheets"""
-        try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                logger.error("Topics worksheet не инициализирован")
-                return {}
-                
-            # Получаем все записи
-            all_data = self.topics_worksheet.get_all_records()
-            
-            chats = {}
-            for row in all_data:
-                chat_id = str(row.get('ChatID'))
-                if chat_id and chat_id not in chats:
-                    chats[chat_id] = {
-                        'title': row.get('ChatName', ''),
-                        'type': row.get('ChatType', 'SUPERGROUP'),
-                        'added_date': row.get('AddedDate', datetime.now().isoformat())
-                    }
-            
-            logger.info(f"Получено {len(chats)} чатов из Google Sheets")
-            return chats
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения чатов из Google Sheets: {e}")
-            return {}
+        """Получает все чаты из реестра (зеркало листа Topics)"""
+        return self.chats.all_chats()
     
-    def _add_topic_to_chat(self, chat_id: int, topic_id: int, topic_name: str, closed: bool = False):
+    async def _add_topic_to_chat(self, chat_id: int, topic_id: int, topic_name: str, closed: bool = False):
         """Добавляет топик в Google Sheets (новая версия)"""
-        logger.info(f"_add_topic_to_chat вызван: chat_id={chat_id}, topic_id={topic_id}, topic_name={topic_name}")
-        self._add_topic_to_sheets(chat_id, topic_id, topic_name, closed)
+        logger.debug("_add_topic_to_chat вызван: chat_id=%s, topic_id=%s, topic_name=%s", chat_id, topic_id, topic_name)
+        await self._add_topic_to_sheets(chat_id, topic_id, topic_name, closed)
         logger.info(f"Добавлен топик {topic_id} '{topic_name}' в чат {chat_id}")
     
-    def _update_topic_in_chat(self, chat_id: int, topic_id: int, name: str = None, closed: bool = None):
+    async def _update_topic_in_chat(self, chat_id: int, topic_id: int, name: str = None, closed: bool = None):
         """Обновляет данные топика в Google Sheets (новая версия)"""
-        self._update_topic_in_sheets(chat_id, topic_id, name, closed)
+        await self._update_topic_in_sheets(chat_id, topic_id, name, closed)
         logger.info(f"Обновлен топик {topic_id} в чате {chat_id}")
     
     def _remove_topic_from_chat(self, chat_id: int, topic_id: int):
@@ -389,17 +2407,14 @@ class TelegramBot:
     
     async def handle_group_message(self, update, context):
         """Обработка сообщений вне сценария ConversationHandler (например, в группах)"""
-        # Логируем все важные поля update для отладки
+        # Каждое сообщение несёт свежие название и режим форума — обновляем кэш сведений о чате
+        self._remember_chat(update.effective_chat)
+        # Обычное сообщение не должно стоить ни одного обращения к хранилищу:
+        # всё проверяется по реестру чатов в памяти, запись — только при изменениях
         if update.message:
-            logger.info(f"🔍 ПОЛУЧЕНО СООБЩЕНИЕ:")
-            logger.info(f"    Chat ID: {update.effective_chat.id}")
-            logger.info(f"    Chat Type: {update.effective_chat.type}")
-            logger.info(f"    Message Thread ID: {getattr(update.message, 'message_thread_id', 'None')}")
-            logger.info(f"    Text: {getattr(update.message, 'text', 'None')}")
-            logger.info(f"    Forum Topic Created: {getattr(update.message, 'forum_topic_created', 'None')}")
-            logger.info(f"    Forum Topic Edited: {getattr(update.message, 'forum_topic_edited', 'None')}")
-            logger.info(f"    Forum Topic Closed: {getattr(update.message, 'forum_topic_closed', 'None')}")
-            logger.info(f"    Forum Topic Reopened: {getattr(update.message, 'forum_topic_reopened', 'None')}")
+            logger.debug("🔍 Сообщение: chat=%s (%s), thread=%s", update.effective_chat.id,
+                         update.effective_chat.type, getattr(update.message, 'message_thread_id', None),
+                         extra={'sampled': True})
         
         # Проверяем события топиков и обрабатываем их напрямую
         if update.message:
@@ -432,9 +2447,8 @@ class TelegramBot:
             if message_thread_id and update.effective_chat.type.name == 'SUPERGROUP':
                 chat_id = update.effective_chat.id
                 
-                # Проверяем, есть ли уже этот топик в Google Sheets
-                topics = self._get_chat_topics_from_sheets(chat_id)
-                if message_thread_id not in topics:
+                # Проверяем, есть ли уже этот топик в реестре (в том числе закрытый)
+                if not self.chats.has_topic(chat_id, message_thread_id):
                     logger.info(f"🆕 ОБНАРУЖЕН НОВЫЙ ТОПИК: ID {message_thread_id} - возможно создание топика")
                     
                     # Получаем название топика через API (если возможно)
@@ -445,7 +2459,7 @@ class TelegramBot:
                         topic_name = text if text and len(text) < 100 else f"Topic_{message_thread_id}"
                         
                         # Добавляем топик
-                        self._add_topic_to_chat(chat_id, message_thread_id, topic_name)
+                        await self._add_topic_to_chat(chat_id, message_thread_id, topic_name)
                         logger.info(f"✅ ДОБАВЛЕН НОВЫЙ ТОПИК: {message_thread_id} '{topic_name}' в чат {chat_id}")
                     except Exception as e:
                         logger.error(f"❌ Ошибка при добавлении нового топика: {e}")
@@ -456,17 +2470,13 @@ class TelegramBot:
             chat_title = update.effective_chat.title or f"Чат {chat_id}"
             chat_type = update.effective_chat.type.name
             
-            # Сохраняем информацию о чате в Google Sheets
-            await self._save_chat_name_to_sheets(chat_id, chat_title, chat_type)
-            logger.info(f"Обработано сообщение из чата: {chat_title} ({chat_id})")
+            # Сохраняем информацию о чате, только если он новый или сменил название
+            if self.chats.chat_changed(chat_id, chat_title):
+                await self._save_chat_name_to_sheets(chat_id, chat_title, chat_type)
     async def handle_forum_topic_created(self, update, context):
         """Обработка создания нового топика в форуме"""
-        logger.info(f"🔄 handle_forum_topic_created вызван")
-        logger.info(f"📋 Update object: {update}")
-        logger.info(f"📋 Update.message: {update.message if update.message else 'None'}")
-        if update.message:
-            logger.info(f"📋 forum_topic_created: {getattr(update.message, 'forum_topic_created', 'None')}")
-            logger.info(f"📋 message_thread_id: {getattr(update.message, 'message_thread_id', 'None')}")
+        logger.debug("🔄 handle_forum_topic_created вызван")
+        logger.debug("📋 Update: %s", update)
         
         try:
             if update.message and update.message.forum_topic_created:
@@ -481,12 +2491,12 @@ class TelegramBot:
                 await self._save_chat_name_to_sheets(chat_id, chat_title, update.effective_chat.type.name)
                 
                 # Добавляем топик в Google Sheets
-                self._add_topic_to_chat(chat_id, message_thread_id, topic_name)
+                await self._add_topic_to_chat(chat_id, message_thread_id, topic_name)
                 
                 logger.info(f"✅ ТОПИК СОХРАНЕН: '{topic_name}' (ID: {message_thread_id}) успешно добавлен в Google Sheets")
             else:
                 logger.warning(f"❌ Событие создания топика получено, но данные некорректны")
-                logger.warning(f"❌ Update: {update}")
+                logger.debug("❌ Update: %s", update)
                 if update.message:
                     logger.warning(f"❌ Message: {update.message}")
                     logger.warning(f"❌ forum_topic_created: {getattr(update.message, 'forum_topic_created', 'None')}")
@@ -497,12 +2507,8 @@ class TelegramBot:
     
     async def handle_forum_topic_edited(self, update, context):
         """Обработка редактирования топика в форуме"""
-        logger.info(f"🔄 handle_forum_topic_edited вызван")
-        logger.info(f"📋 Update object: {update}")
-        logger.info(f"📋 Update.message: {update.message if update.message else 'None'}")
-        if update.message:
-            logger.info(f"📋 forum_topic_edited: {getattr(update.message, 'forum_topic_edited', 'None')}")
-            logger.info(f"📋 message_thread_id: {getattr(update.message, 'message_thread_id', 'None')}")
+        logger.debug("🔄 handle_forum_topic_edited вызван")
+        logger.debug("📋 Update: %s", update)
         
         try:
             if update.message and update.message.forum_topic_edited:
@@ -528,12 +2534,12 @@ class TelegramBot:
                     if message_thread_id in topics:
                         # Обновляем существующий топик
                         logger.info(f"🔄 ОБНОВЛЯЕМ СУЩЕСТВУЮЩИЙ ТОПИК {message_thread_id}")
-                        self._update_topic_in_chat(chat_id, message_thread_id, name=new_name)
+                        await self._update_topic_in_chat(chat_id, message_thread_id, name=new_name)
                         logger.info(f"✅ ОБНОВЛЕНО название топика {message_thread_id} на '{new_name}' в чате {chat_id}")
                     else:
                         # Добавляем новый топик
                         logger.info(f"➕ ДОБАВЛЯЕМ НОВЫЙ ТОПИК {message_thread_id}")
-                        self._add_topic_to_chat(chat_id, message_thread_id, new_name)
+                        await self._add_topic_to_chat(chat_id, message_thread_id, new_name)
                         logger.info(f"✅ ДОБАВЛЕН новый топик {message_thread_id} '{new_name}' в чат {chat_id}")
                 else:
                     logger.warning(f"⚠️ Название топика не изменилось или пустое")
@@ -541,11 +2547,11 @@ class TelegramBot:
                     topics = self._get_chat_topics_from_sheets(chat_id)
                     if message_thread_id not in topics:
                         logger.info(f"➕ ДОБАВЛЯЕМ ТОПИК БЕЗ НАЗВАНИЯ: ID {message_thread_id}")
-                        self._add_topic_to_chat(chat_id, message_thread_id, f"Topic_{message_thread_id}")
+                        await self._add_topic_to_chat(chat_id, message_thread_id, f"Topic_{message_thread_id}")
                     
             else:
                 logger.warning(f"❌ Событие редактирования топика получено, но данные некорректны")
-                logger.warning(f"❌ Update: {update}")
+                logger.debug("❌ Update: %s", update)
                 if update.message:
                     logger.warning(f"❌ Message: {update.message}")
                     logger.warning(f"❌ forum_topic_edited: {getattr(update.message, 'forum_topic_edited', 'None')}")
@@ -559,8 +2565,8 @@ class TelegramBot:
     async def _save_chat_name_to_sheets(self, chat_id: int, chat_title: str, chat_type: str = "SUPERGROUP"):
         """Сохраняет соответствие ID чата и его названия в Google Sheets"""
         try:
-            self._save_chat_to_sheets(chat_id, chat_title, chat_type)
-            logger.info(f"Сохранено название чата: {chat_title} (ID: {chat_id})")
+            await self._save_chat_to_sheets(chat_id, chat_title, chat_type)
+            logger.debug("Сохранено название чата: %s (ID: %s)", chat_title, chat_id)
         except Exception as e:
             logger.error(f"Ошибка сохранения названия чата: {e}")
 
@@ -575,14 +2581,13 @@ class TelegramBot:
                 return
             
             # Проверяем права администратора
-            user_member = await context.bot.get_chat_member(chat.id, update.effective_user.id)
-            if user_member.status not in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]:
+            if not await self._is_chat_admin(context.bot, chat.id, update.effective_user.id, use_cache=False):
                 await update.message.reply_text(
                     "❌ Только администраторы могут использовать эту команду."
                 )
                 return
             
-            chat_info = await context.bot.get_chat(chat.id)
+            chat_info = self._remember_chat(chat)
             if not (hasattr(chat_info, 'is_forum') and chat_info.is_forum):
                 await update.message.reply_text(
                     "❌ Эта команда работает только в форумах. Включите режим тем в настройках группы."
@@ -625,13 +2630,8 @@ class TelegramBot:
     
     async def handle_forum_topic_closed(self, update, context):
         """Обработка закрытия топика в форуме"""
-        logger.info(f"🔄 handle_forum_topic_closed вызван")
-        logger.info(f"📋 Update object: {update}")
-        logger.info(f"📋 Update.message: {update.message if update.message else 'None'}")
-        if update.message:
-            logger.info(f"📋 forum_topic_closed: {getattr(update.message, 'forum_topic_closed', 'None')}")
-            logger.info(f"📋 message_thread_id: {getattr(update.message, 'message_thread_id', 'None')}")
-            logger.info(f"📋 reply_to_message: {getattr(update.message, 'reply_to_message', 'None')}")
+        logger.debug("🔄 handle_forum_topic_closed вызван")
+        logger.debug("📋 Update: %s", update)
         
         try:
             if update.message and update.message.forum_topic_closed:
@@ -656,11 +2656,11 @@ class TelegramBot:
                 topics = self._get_chat_topics_from_sheets(chat_id, include_closed=True)
                 if message_thread_id in topics:
                     # Обновляем статус существующего топика
-                    self._update_topic_in_chat(chat_id, message_thread_id, name=topic_name, closed=True)
+                    await self._update_topic_in_chat(chat_id, message_thread_id, name=topic_name, closed=True)
                     logger.info(f"✅ ОБНОВЛЕН И ЗАКРЫТ топик {message_thread_id} '{topic_name}' в чате {chat_id}")
                 else:
                     # Добавляем топик с закрытым статусом и правильным названием
-                    self._add_topic_to_chat(chat_id, message_thread_id, topic_name, closed=True)
+                    await self._add_topic_to_chat(chat_id, message_thread_id, topic_name, closed=True)
                     logger.info(f"✅ ДОБАВЛЕН И ЗАКРЫТ топик {message_thread_id} '{topic_name}' в чате {chat_id}")
             else:
                 logger.warning(f"❌ Событие закрытия топика получено, но данные некорректны")
@@ -671,13 +2671,8 @@ class TelegramBot:
     
     async def handle_forum_topic_reopened(self, update, context):
         """Обработка повторного открытия топика в форуме"""
-        logger.info(f"🔄 handle_forum_topic_reopened вызван")
-        logger.info(f"📋 Update object: {update}")
-        logger.info(f"📋 Update.message: {update.message if update.message else 'None'}")
-        if update.message:
-            logger.info(f"📋 forum_topic_reopened: {getattr(update.message, 'forum_topic_reopened', 'None')}")
-            logger.info(f"📋 message_thread_id: {getattr(update.message, 'message_thread_id', 'None')}")
-            logger.info(f"📋 reply_to_message: {getattr(update.message, 'reply_to_message', 'None')}")
+        logger.debug("🔄 handle_forum_topic_reopened вызван")
+        logger.debug("📋 Update: %s", update)
         
         try:
             if update.message and update.message.forum_topic_reopened:
@@ -702,11 +2697,11 @@ class TelegramBot:
                 topics = self._get_chat_topics_from_sheets(chat_id, include_closed=True)
                 if message_thread_id in topics:
                     # Обновляем статус существующего топика
-                    self._update_topic_in_chat(chat_id, message_thread_id, name=topic_name, closed=False)
+                    await self._update_topic_in_chat(chat_id, message_thread_id, name=topic_name, closed=False)
                     logger.info(f"✅ ОБНОВЛЕН И ОТКРЫТ топик {message_thread_id} '{topic_name}' в чате {chat_id}")
                 else:
                     # Добавляем топик с открытым статусом и правильным названием
-                    self._add_topic_to_chat(chat_id, message_thread_id, topic_name, closed=False)
+                    await self._add_topic_to_chat(chat_id, message_thread_id, topic_name, closed=False)
                     logger.info(f"✅ ДОБАВЛЕН И ОТКРЫТ топик {message_thread_id} '{topic_name}' в чате {chat_id}")
             else:
                 logger.warning(f"❌ Событие открытия топика получено, но данные некорректны")
@@ -728,11 +2723,55 @@ class TelegramBot:
             logger.info(f"Показан общий топик в чате {chat_id}")
 
         return
+    @staticmethod
+    def _instrument_handler(handler):
+        """
+        Оборачивает callback обработчика замером длительности (метрика bot_handler_seconds).
+        Апдейт, обработка которого заняла больше SLOW_UPDATE_THRESHOLD секунд,
+        попадает в лог одной записью с вызовами хранилища и Telegram.
+        """
+        callback = handler.callback
+        name = getattr(callback, '__name__', type(handler).__name__)
+
+        @functools.wraps(callback)
+        async def timed_callback(update, context):
+            loop = asyncio.get_running_loop()
+            trace = UpdateTrace(name)
+            token = CURRENT_TRACE.set(trace)
+            started = loop.time()
+            try:
+                return await callback(update, context)
+            except Exception:
+                METRICS.inc('bot_handler_errors_total', name)
+                raise
+            finally:
+                elapsed = loop.time() - started
+                CURRENT_TRACE.reset(token)
+                METRICS.observe('bot_handler_seconds', elapsed, name)
+                if SLOW_UPDATE_THRESHOLD > 0 and elapsed >= SLOW_UPDATE_THRESHOLD:
+                    fields = {
+                        'handler': name,
+                        'update_id': getattr(update, 'update_id', None),
+                        'wall_seconds': round(elapsed, 3),
+                        'storage_calls': trace.storage_calls,
+                        'storage_seconds': round(trace.storage_seconds, 3),
+                        'telegram_calls': trace.telegram_calls,
+                        'telegram_seconds': round(trace.telegram_seconds, 3),
+                    }
+                    logger.warning(
+                        "🐢 Медленный апдейт: handler=%(handler)s update_id=%(update_id)s wall=%(wall_seconds)sс "
+                        "storage=%(storage_calls)s (%(storage_seconds)sс) telegram=%(telegram_calls)s (%(telegram_seconds)sс)",
+                        fields, extra={'fields': fields}
+                    )
+
+        handler.callback = timed_callback
+        return handler
+
     def create_conversation_handler(self):
         """Создаёт ConversationHandler для управления диалогом пользователя"""
         from telegram.ext import ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 
-        return ConversationHandler(
+        conversation = ConversationHandler(
             entry_points=[CommandHandler('start', self.start)],
             states={
                 MAIN_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.main_menu)],
@@ -755,13 +2794,39 @@ class TelegramBot:
             allow_reentry=True,
             per_message=False
         )
+        handlers = list(conversation.entry_points) + list(conversation.fallbacks)
+        for state_handlers in conversation.states.values():
+            handlers.extend(state_handlers)
+        for handler in handlers:
+            self._instrument_handler(handler)
+        return conversation
     def __init__(self):
         self.token = self._load_token()
         self.service_account = self._load_service_account()
         self.user_data = {}
         self.sheets_client = None
         self.worksheet = None
+        self.topics_worksheet = None
+        self.dead_letters_worksheet = None
+        self.sheets = SheetsGateway()
+        self.sheets_writer = SheetsWriteBehind(self.sheets)
+        self.storage: Optional[StorageBackend] = None
+        self.events = EventStore(None)
+        self.chats = ChatRegistry(None)
+        self.dead_letters = DeadLetterQueue(None)
+        self.dispatcher = PublicationDispatcher(self._publish_due)
+        self.publisher = RateLimitedPublisher(self._send_message)
+        self.slots = SlotAllocator()
+        self.schedule_state = ScheduleState()
+        self.admin_rights = TTLCache(ADMIN_CACHE_TTL)
+        self.chat_info = TTLCache(CHAT_INFO_CACHE_TTL)
+        self.metrics_server = MetricsServer(METRICS)
+        METRICS.gauge('bot_dispatcher_scheduled', 'Запланированные публикации в диспетчере', lambda: len(self.dispatcher))
+        METRICS.gauge('bot_publisher_pending', 'Сообщения в очереди отправки', self.publisher.pending)
+        METRICS.gauge('bot_sheets_write_pending', 'Изменения в очереди записи в Google Sheets', self.sheets_writer.pending)
+        METRICS.gauge('bot_dead_letters', 'Неотправленные публикации', lambda: len(self.dead_letters))
         self.scheduler = None
+        self._warmup_task: Optional[asyncio.Task] = None
         self.application = None
         self.timezone = pytz.timezone('Europe/Moscow')
         self.scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
@@ -782,7 +2847,10 @@ class TelegramBot:
                 return json.load(f)
         except FileNotFoundError:
             logger.error("Файл service_account.json не найден")
-            raise
+            if STORAGE_BACKEND == 'sheets':
+                raise
+            # С локальным хранилищем бот работает и без Google Sheets
+            return {}
             
     def _init_google_sheets(self):
         """Инициализация Google Sheets"""
@@ -821,6 +2889,22 @@ class TelegramBot:
             except Exception as topics_error:
                 logger.error(f"Ошибка инициализации worksheet для топиков: {topics_error}")
                 self.topics_worksheet = None
+            
+            # Без SQLite очередь неотправленных публикаций хранится в отдельном листе
+            if STORAGE_BACKEND == 'sheets':
+                try:
+                    try:
+                        self.dead_letters_worksheet = self.gc.open("BotEvents").worksheet("DeadLetters")
+                    except gspread.WorksheetNotFound:
+                        self.dead_letters_worksheet = self.gc.open("BotEvents").add_worksheet(
+                            title="DeadLetters", rows="1000", cols=str(len(DEAD_LETTER_HEADERS)))
+                        logger.info("Создан новый worksheet 'DeadLetters'")
+                    if self.dead_letters_worksheet.row_values(1) != DEAD_LETTER_HEADERS:
+                        self.dead_letters_worksheet.clear()
+                        self.dead_letters_worksheet.append_row(DEAD_LETTER_HEADERS)
+                except Exception as dead_letters_error:
+                    logger.error(f"Ошибка инициализации worksheet 'DeadLetters': {dead_letters_error}")
+                    self.dead_letters_worksheet = None
                 
             # Проверяем заголовки основной таблицы и создаем их при необходимости
             try:
@@ -847,8 +2931,33 @@ class TelegramBot:
             logger.warning("Бот будет работать в ограниченном режиме без Google Sheets")
             self.worksheet = None
             self.topics_worksheet = None
+            self.dead_letters_worksheet = None
             return False
             
+    def _create_storage(self, sheets_available: bool) -> Optional[StorageBackend]:
+        """Создаёт хранилище согласно BOT_STORAGE / BOT_SHEETS_MIRROR"""
+        sheets_backend = None
+        if sheets_available:
+            sheets_backend = SheetsBackend(self.worksheet, self.topics_worksheet, self.sheets, self.sheets_writer,
+                                           self.dead_letters_worksheet)
+        
+        if STORAGE_BACKEND == 'sheets':
+            logger.info("Хранилище: Google Sheets")
+            return sheets_backend
+        
+        sqlite_backend = SQLiteBackend(SQLITE_PATH)
+        if sheets_backend is not None and SHEETS_MIRROR:
+            logger.info(f"Хранилище: SQLite ({SQLITE_PATH}) с зеркалом в Google Sheets")
+            return MirroredBackend(sqlite_backend, sheets_backend, on_bootstrap=self._on_storage_bootstrapped)
+        logger.info(f"Хранилище: SQLite ({SQLITE_PATH}) без зеркала")
+        return sqlite_backend
+            
+    async def _on_storage_bootstrapped(self):
+        """База SQLite заполнена из Google Sheets уже после запуска: перечитываем её и планируем события"""
+        logger.info(f"Загружено {await self.chats.load()} чатов в память")
+        logger.info(f"Загружено {await self.events.load()} событий в память")
+        await self._load_and_schedule_existing_events()
+            
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
         user_id = update.effective_user.id
@@ -868,6 +2977,51 @@ class TelegramBot:
         
         return MAIN_MENU
         
+    async def replay_failed_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /replay_failed: повторная отправка неотправленных публикаций"""
+        try:
+            chat = update.effective_chat
+            user_id = update.effective_user.id
+            if chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
+                # В группе — только публикации этой группы и только для её администраторов
+                if not await self._is_chat_admin(context.bot, chat.id, user_id, use_cache=False):
+                    await update.message.reply_text(
+                        "❌ Только администраторы могут использовать эту команду."
+                    )
+                    return
+                chat_ids = [chat.id]
+            else:
+                # В личном чате — публикации всех групп, где пользователь администратор
+                chat_ids = list((await self._get_available_chats(user_id, context.bot)).keys())
+            
+            entries = self.dead_letters.for_chats(chat_ids)
+            if not entries:
+                await update.message.reply_text("✅ Неотправленных публикаций нет.")
+                return
+            
+            await update.message.reply_text(f"🔁 Повторная отправка публикаций: {len(entries)}...")
+            results = await asyncio.gather(*(self._replay_dead_letter(entry) for entry in entries))
+            sent = sum(results)
+            await update.message.reply_text(
+                f"✅ Отправлено: {sent}\n"
+                f"❌ Не удалось: {len(entries) - sent}"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка повторной отправки публикаций: {e}")
+    
+    async def _replay_dead_letter(self, entry: Dict) -> bool:
+        """Повторно отправляет публикацию из очереди; при успехе убирает её из очереди"""
+        send_params = {'chat_id': int(entry['ChatID']), 'text': entry['Text'], 'parse_mode': None}
+        if str(entry.get('TopicID', '')).strip():
+            send_params['message_thread_id'] = int(entry['TopicID'])
+        attempts, error = await self._send_with_retry(send_params)
+        if error is not None:
+            logger.warning(f"Повторная отправка публикации {entry['ID']} (событие {entry['EventID']}) не удалась: {error}")
+            return False
+        await self.dead_letters.resolve(str(entry['ID']))
+        logger.info(f"Публикация {entry['ID']} (событие {entry['EventID']}) отправлена повторно")
+        return True
+    
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /help"""
         help_text = """
@@ -901,6 +3055,7 @@ class TelegramBot:
 **Команды для групп (только для администраторов):**
 /start_bot - Запустить бота в группе
 /init_topics - Инициализировать топики форума
+/replay\\_failed - Повторить неотправленные публикации
 
 Для начала работы добавьте бота в группу и сделайте его администратором с правами на отправку сообщений.
         """
@@ -936,15 +3091,14 @@ class TelegramBot:
                 return
             
             # Проверяем права администратора
-            user_member = await context.bot.get_chat_member(chat.id, update.effective_user.id)
-            if user_member.status not in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]:
+            if not await self._is_chat_admin(context.bot, chat.id, update.effective_user.id, use_cache=False):
                 await update.message.reply_text(
                     "❌ Только администраторы могут использовать эту команду."
                 )
                 return
             
             # Проверяем, является ли чат форумом
-            chat_info = await context.bot.get_chat(chat.id)
+            chat_info = self._remember_chat(chat)
             is_forum = hasattr(chat_info, 'is_forum') and chat_info.is_forum
             
             welcome_text = f"🤖 **Бот-планировщик запущен в {chat.title}!**\n\n"
@@ -986,17 +3140,17 @@ class TelegramBot:
         text = update.message.text
         
         if text == '📝 Создать событие':
-            if not hasattr(self, 'worksheet') or self.worksheet is None:
+            if self.storage is None:
                 await update.message.reply_text(
-                    "❌ Google Sheets недоступен. Создание событий временно невозможно.\n"
+                    "❌ Хранилище событий недоступно. Создание событий временно невозможно.\n"
                     "Попробуйте позже или обратитесь к администратору."
                 )
                 return MAIN_MENU
             return await self.start_create_event(update, context)
         elif text == '📋 Просмотр событий':
-            if not hasattr(self, 'worksheet') or self.worksheet is None:
+            if self.storage is None:
                 await update.message.reply_text(
-                    "❌ Google Sheets недоступен. Просмотр событий временно невозможен.\n"
+                    "❌ Хранилище событий недоступно. Просмотр событий временно невозможен.\n"
                     "Попробуйте позже или обратитесь к администратору."
                 )
                 return MAIN_MENU
@@ -1333,12 +3487,8 @@ class TelegramBot:
             event_id = self.user_data[user_id]['editing_event_id']
             
             try:
-                # Находим строку события и обновляем название
-                all_values = self.worksheet.get_all_values()
-                for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                    if row[0] == event_id:  # ID в первой колонке
-                        self.worksheet.update_cell(i, 3, text)  # Колонка Description (3-я)
-                        break
+                # Обновляем название события
+                await self.events.update(event_id, Description=text)
                 
                 await update.message.reply_text(f"✅ Название изменено на: {text}")
                 
@@ -1715,25 +3865,9 @@ class TelegramBot:
             event_id = self.user_data[user_id]['editing_event_id']
             
             try:
-                # Находим строку события и обновляем дату начала
-                all_values = self.worksheet.get_all_values()
-                for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                    if row[0] == event_id:  # ID в первой колонке
-                        self.worksheet.update_cell(i, 4, start_date.strftime('%Y-%m-%d'))  # Колонка StartDate (4-я)
-                        
-                        # Получаем данные события для перепланирования
-                        rows = self.worksheet.get_all_records()
-                        event_data = None
-                        for event_row in rows:
-                            if str(event_row.get('ID', '')).strip() == str(event_id).strip():
-                                event_data = event_row
-                                break
-                        
-                        if event_data:
-                            # Перепланируем задачи
-                            await self._reschedule_event_jobs(event_id)
-                        
-                        break
+                # Обновляем дату начала и перепланируем задачи
+                if await self.events.update(event_id, StartDate=start_date.strftime('%Y-%m-%d')):
+                    await self._reschedule_event_jobs(event_id)
                 
                 await update.message.reply_text(f"✅ Дата начала изменена на: {start_date.strftime('%d.%m.%Y')}")
                 
@@ -1816,16 +3950,11 @@ class TelegramBot:
                 try:
                     end_date = datetime.strptime(text, "%d.%m.%Y").date()
                     
-                    # Получаем дату начала события из Google Sheets
-                    all_values = self.worksheet.get_all_values()
-                    start_date_str = None
-                    for row in all_values[1:]:  # Пропускаем заголовки
-                        if row[0] == event_id:  # ID в первой колонке
-                            start_date_str = row[3]  # StartDate в 4-й колонке
-                            break
+                    # Получаем дату начала события
+                    event = self.events.get(event_id)
+                    start_date = event.start_date if event else None
                     
-                    if start_date_str:
-                        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+                    if start_date:
                         if end_date <= start_date:
                             await update.message.reply_text(
                                 "❌ Дата окончания должна быть позже даты начала."
@@ -1842,12 +3971,9 @@ class TelegramBot:
                     return ENTER_END_DATE
             
             try:
-                # Находим строку события и обновляем дату окончания
-                all_values = self.worksheet.get_all_values()
-                for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                    if row[0] == event_id:  # ID в первой колонке
-                        self.worksheet.update_cell(i, 5, end_date_str)  # Колонка EndDate (5-я)
-                        break
+                # Обновляем дату окончания и перепланируем задачи
+                if await self.events.update(event_id, EndDate=end_date_str):
+                    await self._reschedule_event_jobs(event_id)
                 
                 if forever_value:
                     await update.message.reply_text("✅ Событие сделано бессрочным")
@@ -1964,12 +4090,9 @@ class TelegramBot:
             event_id = self.user_data[user_id]['editing_event_id']
             
             try:
-                # Находим строку события и обновляем время
-                all_values = self.worksheet.get_all_values()
-                for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                    if row[0] == event_id:  # ID в первой колонке
-                        self.worksheet.update_cell(i, 7, time_obj.strftime('%H:%M'))  # Колонка Time (7-я)
-                        break
+                # Обновляем время и перепланируем задачи
+                if await self.events.update(event_id, Time=time_obj.strftime('%H:%M')):
+                    await self._reschedule_event_jobs(event_id)
                 
                 await update.message.reply_text(f"✅ Время изменено на: {time_obj.strftime('%H:%M')}")
                 
@@ -2040,14 +4163,8 @@ class TelegramBot:
             event_id = self.user_data[user_id]['editing_event_id']
             
             try:
-                # Находим строку события и обновляем текст
-                all_values = self.worksheet.get_all_values()
-                for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                    if row[0] == event_id:  # ID в первой колонке
-                        self.worksheet.update_cell(i, 10, text)  # Колонка Text (10-я)
-                        break  # ID в первой колонке
-                        self.worksheet.update_cell(i, 10, text)  # Колонка Text (10-я)
-                        break
+                # Обновляем текст
+                await self.events.update(event_id, Text=text)
                 
                 await update.message.reply_text(f"✅ Текст сообщения обновлен!")
                 
@@ -2143,16 +4260,11 @@ class TelegramBot:
                 event_id = await self._save_event_to_sheets(user_id)
                 
                 # Получаем данные события для планирования
-                rows = self.worksheet.get_all_records()
-                event_data = None
-                for row in rows:
-                    if str(row.get('ID', '')).strip() == str(event_id).strip():
-                        event_data = row
-                        break
-                
-                if event_data:
+                event = self.events.get(event_id)
+                
+                if event:
                     # Планируем задачи публикации
-                    await self._schedule_event_jobs(event_data)
+                    await self._schedule_event_jobs(event)
                 
                 keyboard = [
                     ['📝 Создать событие', '📋 Просмотр событий'],
@@ -2195,8 +4307,8 @@ class TelegramBot:
     async def view_events(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Просмотр всех событий"""
         try:
-            # Получаем все записи из таблицы
-            records = self.worksheet.get_all_records()
+            # Получаем все события из памяти
+            records = self.events.all()
             
             if not records:
                 keyboard = [
@@ -2226,72 +4338,31 @@ class TelegramBot:
             
             # Показываем все события, не только активные
             events_text = "📋 **Список событий:**\n\n"
+            now = datetime.now()
             for i, event in enumerate(records, 1):
-                event_id = event.get('ID', 'N/A')
-                chat_identifier = event.get('ChatID', 'N/A')
-                name = str(event.get('Description', 'Без названия'))
-                start_date = event.get('StartDate', 'N/A')
-                end_date = event.get('EndDate', 'N/A')
-                time_val = event.get('Time', 'N/A')
-                period = event.get('PeriodType', 'N/A')
-                status = event.get('Status', 'N/A')
-
                 # Определяем название чата и топика
-                chat_name = ""
-                topic_name = "Общий чат"
-                if str(chat_identifier).startswith('topic:'):
-                    topic_id = str(chat_identifier).split(':')[1]
-                    chat_id = self._get_chat_id_by_topic_id(topic_id)
-                    chat_name = self._get_chat_name_by_id(chat_id) if chat_id else chat_identifier
-                    # Получаем название топика
-                    if hasattr(self, 'topics_worksheet') and self.topics_worksheet:
-                        all_topics = self.topics_worksheet.get_all_records()
-                        for row in all_topics:
-                            if str(row.get('TopicID')) == str(topic_id):
-                                topic_name = row.get('TopicName', topic_name)
-                                break
-                else:
-                    chat_name = self._get_chat_name_by_id(chat_identifier)
+                chat_name, topic_name = self._event_target_names(event)
 
-                # Периодичность на русском
-                period_type = period
-                period_value = None
-                if str(period).startswith('every_') and str(period).endswith('_days'):
-                    try:
-                        period_value = int(str(period).split('_')[1])
-                        period_type = 'custom_days'
-                    except Exception:
-                        pass
-                elif str(period).startswith('weekdays_'):
-                    try:
-                        weekdays_str = str(period).replace('weekdays_', '')
-                        period_value = [int(x) for x in weekdays_str.split(',') if x.strip()]
-                        period_type = 'weekdays'
-                    except Exception:
-                        pass
-                elif period in PERIOD_TYPES:
-                    period_type = period
-
-                period_display = self._get_period_display_ru(period_type, period_value)
-                status_display = self._get_status_display_ru(status)
-
-                events_text += f"{i}. **{name}**\n"
+                # Периодичность и статус на русском
+                period_display = self._get_period_display_ru(event.period_kind, event.period_value)
+                status_display = self._get_status_display_ru(event.status)
+
+                events_text += f"{i}. **{event.description}**\n"
                 events_text += f"   📍 Чат: {chat_name}\n"
                 events_text += f"   🔖 Топик: {topic_name}\n"
-                events_text += f"   📅 Период: {start_date} - {end_date if end_date != 'FOREVER' else 'Бессрочно'}\n"
-                events_text += f"   ⏰ Время: {time_val}\n"
+                events_text += f"   📅 Период: {event.start_raw} - {'Бессрочно' if event.forever else event.end_raw}\n"
+                events_text += f"   ⏰ Время: {event.time_raw}\n"
                 events_text += f"   🔄 Периодичность: {period_display}\n"
-                events_text += f"   🆔 ID: `{event_id}`\n"
+                events_text += self._next_publication_line(event, now, "   ")
+                events_text += f"   🆔 ID: `{event.id}`\n"
                 events_text += f"   📊 Статус: {status_display}\n\n"
 
             # Создаем inline клавиатуру для управления событиями
             keyboard = []
             for event in records[:10]:
-                event_id = event.get('ID', '')
-                name = str(event.get('Description', 'Без названия'))
                 keyboard.append([InlineKeyboardButton(
-                    f"✏️ {name[:20]}...",
-                    callback_data=f"edit_{event_id}"
+                    f"✏️ {event.description[:20]}...",
+                    callback_data=f"edit_{event.id}"
                 )])
             keyboard.append([InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_menu")])
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2393,72 +4464,33 @@ class TelegramBot:
         """Показывает меню редактирования события"""
         try:
             # Получаем данные события
-            records = self.worksheet.get_all_records()
-            event_data = None
-            
-            for record in records:
-                if str(record.get('ID', '')).strip() == str(event_id).strip():
-                    event_data = record
-                    break
+            event = self.events.get(event_id)
             
-            if not event_data:
+            if not event:
                 await update.callback_query.edit_message_text(
                     "❌ Событие не найдено."
                 )
                 return await self.view_events(update, context)
             
             # Определяем название чата и топика
-            chat_identifier = event_data.get('ChatID', 'N/A')
-            chat_name = ""
-            topic_name = "Общий чат"
-            if str(chat_identifier).startswith('topic:'):
-                topic_id = str(chat_identifier).split(':')[1]
-                chat_id = self._get_chat_id_by_topic_id(topic_id)
-                chat_name = self._get_chat_name_by_id(chat_id) if chat_id else chat_identifier
-                # Получаем название топика
-                if hasattr(self, 'topics_worksheet') and self.topics_worksheet:
-                    all_topics = self.topics_worksheet.get_all_records()
-                    for row in all_topics:
-                        if str(row.get('TopicID')) == str(topic_id):
-                            topic_name = row.get('TopicName', topic_name)
-                            break
-            else:
-                chat_name = self._get_chat_name_by_id(chat_identifier)
+            chat_name, topic_name = self._event_target_names(event)
 
             # Периодичность и статус на русском
-            period = event_data.get('PeriodType', 'N/A')
-            period_type = period
-            period_value = None
-            if str(period).startswith('every_') and str(period).endswith('_days'):
-                try:
-                    period_value = int(str(period).split('_')[1])
-                    period_type = 'custom_days'
-                except Exception:
-                    pass
-            elif str(period).startswith('weekdays_'):
-                try:
-                    weekdays_str = str(period).replace('weekdays_', '')
-                    period_value = [int(x) for x in weekdays_str.split(',') if x.strip()]
-                    period_type = 'weekdays'
-                except Exception:
-                    pass
-            elif period in PERIOD_TYPES:
-                period_type = period
-            period_display = self._get_period_display_ru(period_type, period_value)
-            status_display = self._get_status_display_ru(event_data.get('Status', 'N/A'))
+            period_display = self._get_period_display_ru(event.period_kind, event.period_value)
+            status_display = self._get_status_display_ru(event.status)
 
-            event_info = f"📝 **Событие: {event_data.get('Description', 'Без названия')}**\n\n"
+            event_info = f"📝 **Событие: {event.description}**\n\n"
             event_info += f"📍 Чат: {chat_name}\n"
             event_info += f"🔖 Топик: {topic_name}\n"
-            event_info += f"📅 Период: {event_data.get('StartDate', 'N/A')} - {event_data.get('EndDate', 'N/A')}\n"
-            event_info += f"⏰ Время: {event_data.get('Time', 'N/A')}\n"
+            event_info += f"📅 Период: {event.start_raw} - {event.end_raw}\n"
+            event_info += f"⏰ Время: {event.time_raw}\n"
             event_info += f"🔄 Периодичность: {period_display}\n"
+            event_info += self._next_publication_line(event, datetime.now())
             event_info += f"📊 Статус: {status_display}\n"
             event_info += f"🆔 ID: `{event_id}`"
 
             # Кнопка активировать/деактивировать
-            status = event_data.get('Status', 'N/A')
-            if status == 'active':
+            if event.status == 'active':
                 keyboard = [[InlineKeyboardButton("🔴 Деактивировать", callback_data=f"deactivate_{event_id}")]]
             else:
                 keyboard = [[InlineKeyboardButton("🟢 Активировать", callback_data=f"activate_{event_id}")]]
@@ -2483,11 +4515,9 @@ class TelegramBot:
     async def _activate_event(self, update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: str):
         """Активирует событие"""
         try:
-            all_records = self.worksheet.get_all_records()
-            for row_index, record in enumerate(all_records, start=2):
-                if str(record.get('ID', '')).strip() == str(event_id).strip():
-                    self.worksheet.update_cell(row_index, 9, 'active')
-                    break
+            if await self.events.update(event_id, Status='active'):
+                # Возобновляем публикации
+                await self._reschedule_event_jobs(event_id)
             await update.callback_query.edit_message_text(
                 f"✅ Событие {event_id} активировано.\n\nАвтоматические публикации возобновлены.")
             await asyncio.sleep(2)
@@ -2508,20 +4538,10 @@ class TelegramBot:
     async def _deactivate_event(self, update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: str):
         """Деактивирует событие"""
         try:
-            # Обновляем статус события в Google Sheets
-            all_records = self.worksheet.get_all_records()
-            for row_index, record in enumerate(all_records, start=2):  # +2 из-за заголовка
-                if str(record.get('ID', '')).strip() == str(event_id).strip():
-                    # Обновляем статус на inactive (колонка 9 - Status)
-                    self.worksheet.update_cell(row_index, 9, 'inactive')
-                    
-                    # Отменяем запланированные задачи для этого события
-                    job_id = f"event_{event_id}"
-                    if self.scheduler.get_job(job_id):
-                        self.scheduler.remove_job(job_id)
-                        logger.info(f"Задача {job_id} удалена из планировщика")
-                    
-                    break
+            # Обновляем статус события
+            if await self.events.update(event_id, Status='inactive'):
+                # Отменяем запланированную публикацию этого события
+                self._cancel_event_jobs(event_id)
             
             await update.callback_query.edit_message_text(
                 f"✅ Событие {event_id} деактивировано.\n\n"
@@ -2559,12 +4579,10 @@ class TelegramBot:
     async def _confirm_delete_event(self, update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: str):
         """Подтверждает удаление события"""
         try:
-            # Удаляем строку из Google Sheets
-            all_records = self.worksheet.get_all_records()
-            for row_index, record in enumerate(all_records, start=2):  # +2 из-за заголовка
-                if str(record.get('ID', '')).strip() == str(event_id).strip():
-                    self.worksheet.delete_rows(row_index)
-                    break
+            # Удаляем событие из Google Sheets и из памяти
+            await self.events.delete(event_id)
+            # Снимаем публикацию из диспетчера, слот и сохранённое состояние
+            self._cancel_event_jobs(event_id)
             
             await update.callback_query.edit_message_text(
                 f"✅ Событие {event_id} удалено."
@@ -2582,50 +4600,59 @@ class TelegramBot:
             return EDIT_EVENT
     
     def _get_chat_id_by_topic_id(self, topic_id: int) -> Optional[int]:
-        """Получает ChatID по TopicID из таблицы Topics"""
+        """Получает ChatID по TopicID из реестра топиков"""
         try:
-            if not hasattr(self, 'topics_worksheet') or self.topics_worksheet is None:
-                logger.error("Topics worksheet не инициализирован")
-                return None
-                
-            all_data = self.topics_worksheet.get_all_records()
-            
-            for row in all_data:
-                if str(row.get('TopicID')) == str(topic_id):
-                    chat_id = row.get('ChatID')
-                    if chat_id:
-                        try:
-                            return int(chat_id)
-                        except (ValueError, TypeError):
-                            continue
-            
+            chat_id = self.chats.chat_id_by_topic(topic_id)
+        except (ValueError, TypeError):
+            chat_id = None
+        if chat_id is None:
             logger.warning(f"ChatID не найден для TopicID {topic_id}")
-            return None
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения ChatID по TopicID {topic_id}: {e}")
-            return None
+        return chat_id
 
-    def _parse_chat_identifier(self, chat_identifier) -> Tuple[int, Optional[int]]:
-        """Парсит идентификатор чата и возвращает (chat_id, topic_id)"""
+    def _get_topic_name_by_id(self, topic_id, default: str) -> str:
+        """Получает название топика по TopicID из реестра топиков"""
         try:
-            # Конвертируем в строку если передан int
-            chat_str = str(chat_identifier)
-            
-            if chat_str.startswith('topic:'):
-                # Формат: topic:123
-                topic_id = int(chat_str.split(':')[1])
-                chat_id = self._get_chat_id_by_topic_id(topic_id)
-                if chat_id is None:
-                    logger.error(f"Не удалось найти ChatID для TopicID {topic_id}")
-                    return None, None
-                return chat_id, topic_id
-            else:
-                # Обычный ChatID
-                return int(chat_str), None
-        except (ValueError, IndexError) as e:
-            logger.error(f"Ошибка парсинга идентификатора чата '{chat_identifier}': {e}")
-            return None, None
+            return self.chats.topic_name(topic_id, default)
+        except (ValueError, TypeError):
+            return default
+
+    def _event_target(self, event: Event) -> Tuple[Optional[int], Optional[int]]:
+        """Возвращает (chat_id, topic_id) события; chat_id топика ищется в реестре один раз"""
+        if event.chat_id is None and event.topic_id is not None:
+            event.chat_id = self._get_chat_id_by_topic_id(event.topic_id)
+        return event.chat_id, event.topic_id
+
+    def _event_chat_key(self, event: Event) -> str:
+        """Ключ чата для лимитов отправки: топики одного чата делят его лимит"""
+        chat_id, _ = self._event_target(event)
+        return event.chat_ref if chat_id is None else str(chat_id)
+
+    def _event_target_names(self, event: Event) -> Tuple[str, str]:
+        """Названия чата и топика события для отображения"""
+        if event.topic_id is not None:
+            chat_id, topic_id = self._event_target(event)
+            chat_name = self._get_chat_name_by_id(chat_id) if chat_id else event.chat_ref
+            return chat_name, self._get_topic_name_by_id(topic_id, "Общий чат")
+        return self._get_chat_name_by_id(event.chat_ref), "Общий чат"
+
+    def _next_publication_line(self, event: Event, now: datetime, indent: str = "") -> str:
+        """Строка «Следующая публикация» для активного события (пустая, если публикаций не будет)"""
+        if not event.is_active:
+            return ""
+        next_datetime = event.next_publication(now)
+        if next_datetime is None:
+            return ""
+        return f"{indent}⏭ Следующая публикация: {next_datetime.strftime('%d.%m.%Y %H:%M')}\n"
+
+    def _format_period(self, period_type: str, period_value=None) -> str:
+        """Формирует строку периодичности для колонки PeriodType"""
+        if period_value:
+            if period_type == 'custom_days':
+                return f"every_{period_value}_days"
+            if period_type == 'weekdays':
+                weekdays = sorted(period_value) if isinstance(period_value, (list, set, tuple)) else []
+                return f"weekdays_{','.join(map(str, weekdays))}"
+        return period_type
 
     async def _save_event_to_sheets(self, user_id: int) -> str:
         """Сохранение события в Google Sheets"""
@@ -2653,13 +4680,7 @@ class TelegramBot:
             end_date_str = data['end_date'].strftime('%Y-%m-%d')
         
         # Формируем строку периодичности
-        period_str = data['period_type']
-        if data.get('period_value'):
-            if data['period_type'] == 'custom_days':
-                period_str = f"every_{data['period_value']}_days"
-            elif data['period_type'] == 'weekdays':
-                weekdays = data['period_value'] if isinstance(data['period_value'], list) else []
-                period_str = f"weekdays_{','.join(map(str, weekdays))}"
+        period_str = self._format_period(data['period_type'], data.get('period_value'))
         
         # НОВАЯ ЛОГИКА: Формируем идентификатор чата
         topic_id = data.get('selected_topic', None)
@@ -2670,24 +4691,24 @@ class TelegramBot:
             # Если общий чат, сохраняем реальный ChatID
             chat_identifier = str(data['selected_chat'])
         
-        row_data = [
-            event_id,                                    # 1. ID события
-            chat_identifier,                             # 2. ChatID или topic:X
-            data['event_name'],                          # 3. Название/описание события
-            data['start_date'].strftime('%Y-%m-%d'),     # 4. Дата начала
-            end_date_str,                                # 5. Дата окончания
-            data['time'].strftime('%H:%M'),              # 6. Время публикации
-            period_str,                                  # 7. Периодичность (без TopicID)
-            data['text'],                                # 8. Текст сообщения
-            'active'                                     # 9. Статус
-        ]
+        record = {
+            'ID': event_id,                                     # 1. ID события
+            'ChatID': chat_identifier,                          # 2. ChatID или topic:X
+            'Description': data['event_name'],                  # 3. Название/описание события
+            'StartDate': data['start_date'].strftime('%Y-%m-%d'),  # 4. Дата начала
+            'EndDate': end_date_str,                            # 5. Дата окончания
+            'Time': data['time'].strftime('%H:%M'),             # 6. Время публикации
+            'PeriodType': period_str,                           # 7. Периодичность (без TopicID)
+            'Text': data['text'],                               # 8. Текст сообщения
+            'Status': 'active'                                  # 9. Статус
+        }
         
         try:
             logger.info("Сохранение события в Google Sheets началось")
             logger.info(f"Данные события: ChatIdentifier={chat_identifier}, TopicID={topic_id}, Period={period_str}")
             
-            # Добавляем строку в таблицу
-            self.worksheet.append_row(row_data)
+            # Добавляем строку в таблицу и в память
+            await self.events.add(record)
             logger.info("Событие успешно сохранено в Google Sheets")
             
             return event_id
@@ -2695,156 +4716,67 @@ class TelegramBot:
             logger.error(f"Ошибка сохранения события в Google Sheets: {e}")
             raise
             
-    async def _schedule_event_jobs(self, event_data: Dict):
+    async def _schedule_event_jobs(self, event: Event):
         """Планирование задач публикации для события"""
-        if not event_data:
+        if not event:
             return
             
         # Планируем первую публикацию
-        await self._schedule_next_publication(event_data)
+        await self._schedule_next_publication(event)
         
-    async def _schedule_next_publication(self, event_data: Dict, job_queue=None):
+    async def _schedule_next_publication(self, event: Event, job_queue=None):
         """Планирование следующей публикации"""
         try:
-            logger.info(f"🔄 Начинаем планирование следующей публикации для события {event_data.get('ID', 'Unknown')}")
-            
-            start_date = datetime.strptime(event_data['StartDate'], '%Y-%m-%d').date()
-            end_date_str = event_data.get('EndDate', '')
-            end_date = None
-            forever = False
-            
-            if end_date_str == 'FOREVER':
-                forever = True
-            elif end_date_str:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            
-            time_obj = datetime.strptime(event_data['Time'], '%H:%M').time()
-            
-            # ИСПРАВЛЕНИЕ: Правильно парсим period_type, отделяя TopicID
-            period_type_full = event_data['PeriodType']
-            period_type = period_type_full
-            
-            # Отделяем TopicID от периодичности
-            if '|topic:' in period_type_full:
-                period_type = period_type_full.split('|topic:')[0]
-            
-            # Парсим period_type для получения дополнительных параметров
-            period_value = None
-            if period_type.startswith('every_') and period_type.endswith('_days'):
-                try:
-                    period_value = int(period_type.split('_')[1])
-                    period_type = 'custom_days'
-                except (IndexError, ValueError):
-                    period_value = None
-            elif period_type.startswith('weekdays_'):
-                try:
-                    weekdays_str = period_type.replace('weekdays_', '')
-                    period_value = [int(x) for x in weekdays_str.split(',') if x.strip()]
-                    period_type = 'weekdays'
-                except ValueError:
-                    period_value = None
+            logger.debug("🔄 Начинаем планирование следующей публикации для события %s", event.id)
+            
+            start_date = event.start_date
+            end_date = event.end_date
+            forever = event.forever
+            time_obj = event.time
+            if start_date is None or time_obj is None:
+                logger.warning(f"Событие {event.id}: некорректная дата начала '{event.start_raw}' или время '{event.time_raw}'")
+                return
             
-            # Вычисляем время следующей публикации
+            # Вычисляем время следующей публикации (арифметически, без перебора дней)
             now = datetime.now()
-            next_datetime = None
+            next_datetime = event.next_occurrence(now)
             
-            if period_type == 'once':
-                next_datetime = datetime.combine(start_date, time_obj)
+            if event.period_kind == 'once':
                 if next_datetime <= now:
                     # Событие уже прошло - помечаем как выполненное
-                    logger.info(f"Одноразовое событие {event_data['ID']} уже прошло, помечаем как выполненное")
-                    await self._update_event_status(event_data['ID'], 'complete')
+                    logger.info(f"Одноразовое событие {event.id} уже прошло, помечаем как выполненное")
+                    await self._update_event_status(event.id, 'complete')
                     return
                 
                 # Проверяем, что одноразовое событие не превышает дату окончания
                 if end_date and not forever and start_date > end_date:
-                    logger.info(f"Одноразовое событие {event_data['ID']} завершено: дата события ({start_date}) превышает дату окончания ({end_date}) включительно")
-                    await self._update_event_status(event_data['ID'], 'complete')
+                    logger.info(f"Одноразовое событие {event.id} завершено: дата события ({start_date}) превышает дату окончания ({end_date}) включительно")
+                    await self._update_event_status(event.id, 'complete')
                     return
-                    
-            elif period_type == 'daily':
-                # Ежедневная публикация
-                next_date = start_date
-                while next_date <= datetime.now().date():
-                    next_date += timedelta(days=1)
-                next_datetime = datetime.combine(next_date, time_obj)
-                
-            elif period_type == 'weekly':
-                # Еженедельная публикация
-                next_date = start_date
-                while next_date <= datetime.now().date():
-                    next_date += timedelta(weeks=1)
-                next_datetime = datetime.combine(next_date, time_obj)
-                
-            elif period_type == 'monthly':
-                # Ежемесячная публикация
-                next_date = start_date
-                while next_date <= datetime.now().date():
-                    if next_date.month == 12:
-                        next_date = next_date.replace(year=next_date.year + 1, month=1)
-                    else:
-                        next_date = next_date.replace(month=next_date.month + 1)
-                next_datetime = datetime.combine(next_date, time_obj)
-                
-            elif period_type == 'custom_days' and period_value:
-                # Каждые N дней
-                next_date = start_date
-                while next_date <= datetime.now().date():
-                    next_date += timedelta(days=period_value)
-                next_datetime = datetime.combine(next_date, time_obj)
-                
-            elif period_type == 'weekdays' and period_value:
-                # В определённые дни недели
-                next_date = start_date
-                while True:
-                    if next_date.weekday() in period_value and next_date > datetime.now().date():
-                        break
-                    next_date += timedelta(days=1)
-                next_datetime = datetime.combine(next_date, time_obj)
             
             # Проверяем, не превышает ли дата окончания
             if next_datetime is None:
-                logger.warning(f"Не удалось определить время следующей публикации для события {event_data['ID']} с типом периодичности '{period_type}' (исходная строка: '{period_type_full}')")
+                logger.warning(f"Не удалось определить время следующей публикации для события {event.id} с типом периодичности '{event.period_kind}' (исходная строка: '{event.period_raw}')")
                 return
                 
             if end_date and not forever and next_datetime.date() > end_date:
-                logger.info(f"Событие {event_data['ID']} завершено: дата следующей публикации ({next_datetime.date()}) превышает дату окончания ({end_date}) включительно")
+                logger.info("Событие %s завершено: дата следующей публикации (%s) превышает дату окончания (%s) включительно",
+                            event.id, next_datetime.date(), end_date)
                 # Обновляем статус события на 'complete'
-                await self._update_event_status(event_data['ID'], 'complete')
+                await self._update_event_status(event.id, 'complete')
                 return
             
-            if next_datetime:
-                # Планируем задачу
-                if hasattr(self, 'scheduler'):
-                    # Добавляем небольшую случайную задержку (0-5 секунд) для предотвращения коллизий
-                    import random
-                    random_delay = random.randint(0, 5)
-                    next_datetime_with_delay = next_datetime + timedelta(seconds=random_delay)
-                    
-                    # Используем более уникальный job_id, включающий микросекунды для избежания коллизий
-                    timestamp_str = str(next_datetime_with_delay.timestamp()).replace('.', '_')
-                    job_id = f"event_{event_data['ID']}_{timestamp_str}"
-                    
-                    # Проверяем, не существует ли уже такая задача
-                    existing_job = self.scheduler.get_job(job_id)
-                    if existing_job:
-                        logger.warning(f"⚠️ Задача {job_id} уже существует, перезаписываем")
-                    
-                    self.scheduler.add_job(
-                        self._publish_message_async,
-                        'date',
-                        run_date=next_datetime_with_delay,
-                        args=[event_data],
-                        id=job_id,
-                        replace_existing=True
-                    )
-                    
-                    if random_delay > 0:
-                        logger.info(f"✅ Запланирована публикация события {event_data['ID']} на {next_datetime_with_delay} (задержка: {random_delay}с, job_id: {job_id})")
-                    else:
-                        logger.info(f"✅ Запланирована публикация события {event_data['ID']} на {next_datetime_with_delay} (job_id: {job_id})")
-                else:
-                    logger.error(f"❌ Scheduler не найден для события {event_data['ID']}")
+            # Ставим публикацию в очередь диспетчера (заменяет ранее назначенную)
+            # Секунда внутри минуты выдаётся детерминированно с учётом лимитов Telegram
+            chat_id, _ = self._event_target(event)
+            run_at = self.slots.allocate(event.id, self._event_chat_key(event), next_datetime,
+                                         is_group=chat_id is None or chat_id < 0)
+            occurrence_id = self.dispatcher.occurrence_id(event.id, run_at)
+            if not self.dispatcher.schedule(event.id, run_at):
+                logger.debug("Публикация %s уже запланирована", occurrence_id)
+                return
+            self.schedule_state.set_next_run(event.id, run_at, event.schedule_signature())
+            logger.debug("✅ Запланирована публикация %s на %s", occurrence_id, run_at)
         except Exception as e:
             logger.error(f"Ошибка планирования публикации: {e}")
             logger.exception("Полная трассировка ошибки:")
@@ -2852,32 +4784,27 @@ class TelegramBot:
     async def _update_event_status(self, event_id: str, status: str):
         """Обновление статуса события в Google Sheets"""
         try:
-            all_values = self.worksheet.get_all_values()
-            for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                if row[0] == event_id:  # ID в первой колонке
-                    self.worksheet.update_cell(i, 9, status)  # Колонка Status (9-я в новой структуре)
-                    break
-            logger.info(f"Статус события {event_id} обновлен на {status}")
+            await self.events.update(event_id, Status=status)
+            logger.info("Статус события %s обновлен на %s", event_id, status)
         except Exception as e:
             logger.error(f"Ошибка обновления статуса события {event_id}: {e}")
     
-    async def _publish_message_async(self, event_data: Dict):
+    async def _publish_message_async(self, event: Event):
         """Асинхронная публикация сообщения"""
+        sent = False
+        started = asyncio.get_running_loop().time()
         try:
-            logger.info(f"Начинается публикация для события {event_data['ID']}")
+            logger.debug("Начинается публикация для события %s", event.id)
             
-            # Используем новую логику парсинга идентификатора чата
-            chat_identifier = event_data['ChatID']
-            logger.info(f"ChatIdentifier: {chat_identifier}")
-            
-            chat_id, topic_id = self._parse_chat_identifier(chat_identifier)
-            logger.info(f"Результат парсинга: chat_id={chat_id}, topic_id={topic_id}")
+            # Цель публикации разобрана в Event, chat_id топика берётся из реестра
+            chat_id, topic_id = self._event_target(event)
+            logger.debug("ChatIdentifier: %s, chat_id=%s, topic_id=%s", event.chat_ref, chat_id, topic_id)
             
             if chat_id is None:
-                logger.error(f"Не удалось определить chat_id для события {event_data['ID']}")
+                logger.error(f"Не удалось определить chat_id для события {event.id}")
                 return
             
-            text = event_data['Text']
+            text = event.text
             
             # Подготавливаем параметры для отправки сообщения
             send_params = {
@@ -2889,80 +4816,188 @@ class TelegramBot:
             # Добавляем ID топика если он указан
             if topic_id is not None:
                 send_params['message_thread_id'] = topic_id
-                logger.info(f"Публикация в топик {topic_id} чата {chat_id}")
-            else:
-                logger.info(f"Публикация в общий чат {chat_id}")
             
-            # Отправляем сообщение
+            # Отправляем сообщение через очередь с лимитами Telegram
             if hasattr(self, 'application') and self.application:
-                await self.application.bot.send_message(**send_params)
-                
-                topic_info = f" в топик {topic_id}" if topic_id else ""
-                logger.info(f"Сообщение опубликовано в чат {chat_id}{topic_info} для события {event_data['ID']}")
-                
-                # Планируем следующую публикацию если нужно
-                if event_data['PeriodType'] != 'once':
-                    logger.info(f"📅 Планируем следующую публикацию для повторяющегося события {event_data['ID']}")
-                    await self._schedule_next_publication(event_data)
+                attempts, error = await self._send_with_retry(send_params)
+                if error is None:
+                    sent = True
+                    published_at = datetime.now()
+                    state = self.schedule_state.get(event.id)
+                    if state is not None and state['next_run'] is not None:
+                        METRICS.observe('bot_publish_drift_seconds', (published_at - state['next_run']).total_seconds())
+                    self.schedule_state.mark_published(event.id, published_at)
+                    logger.info("Сообщение опубликовано в чат %s (топик %s) для события %s", chat_id, topic_id, event.id)
                 else:
-                    logger.info(f"📅 Событие {event_data['ID']} одноразовое, помечаем как выполненное")
-                    await self._update_event_status(event_data['ID'], 'complete')
+                    logger.error(f"❌ Публикация события {event.id} не отправлена после {attempts} попыток: {error}")
+                    await self.dead_letters.add(event.id, chat_id, topic_id, text, error, attempts)
             else:
                 logger.error("Application не найден - невозможно отправить сообщение")
                 
         except Exception as e:
-            logger.error(f"Ошибка публикации сообщения для события {event_data.get('ID', 'unknown')}: {e}")
+            logger.error(f"Ошибка публикации сообщения для события {event.id}: {e}")
             logger.exception("Полная трассировка ошибки:")
+        finally:
+            METRICS.inc('bot_publications_total', 'sent' if sent else 'failed')
+            METRICS.observe('bot_publish_seconds', asyncio.get_running_loop().time() - started)
+            # Следующую публикацию планируем при любом исходе отправки, если событие
+            # не удалили и не деактивировали, пока шли повторы
+            current = self.events.get(event.id)
+            if current is None or not current.is_active:
+                logger.debug("Событие %s удалено или неактивно, следующая публикация не планируется", event.id)
+            elif current.period_kind != 'once':
+                logger.debug("📅 Планируем следующую публикацию для повторяющегося события %s", event.id)
+                await self._schedule_next_publication(current)
+            elif sent:
+                logger.info(f"📅 Событие {event.id} одноразовое, помечаем как выполненное")
+                await self._update_event_status(event.id, 'complete')
+            else:
+                await self._update_event_status(event.id, 'error')
+    
+    @staticmethod
+    def _is_retryable_send_error(error: BaseException) -> bool:
+        """
+        Повторяем flood control и сетевые сбои; BadRequest, Forbidden и т.п. не исправятся повтором.
+        TimedOut не повторяем: Telegram мог уже доставить сообщение, и повтор продублирует пост.
+        """
+        return isinstance(error, RetryAfter) or (
+            isinstance(error, NetworkError) and not isinstance(error, (BadRequest, TimedOut)))
+    
+    @staticmethod
+    def _send_retry_wait(retry_state) -> float:
+        """Пауза перед повтором: столько, сколько просит Telegram, иначе экспоненциально"""
+        error = retry_state.outcome.exception()
+        if isinstance(error, RetryAfter):
+            return retry_after_seconds(error) + 1
+        return wait_exponential(multiplier=1, min=1, max=PUBLISH_BACKOFF_MAX)(retry_state)
     
-    def _publish_message_sync(self, event_data: Dict):
+    @staticmethod
+    def _log_send_retry(retry_state):
+        logger.warning(f"⚠️ Попытка отправки {retry_state.attempt_number} не удалась "
+                       f"({retry_state.outcome.exception()}), повтор через {retry_state.next_action.sleep:.0f}с")
+    
+    async def _send_with_retry(self, send_params: Dict) -> Tuple[int, Optional[Exception]]:
+        """Отправляет сообщение с повторами; возвращает (число попыток, последняя ошибка или None)"""
+        retrying = AsyncRetrying(
+            retry=retry_if_exception(self._is_retryable_send_error),
+            wait=self._send_retry_wait,
+            stop=stop_after_attempt(PUBLISH_MAX_ATTEMPTS),
+            before_sleep=self._log_send_retry,
+            reraise=True,
+        )
+        try:
+            await retrying(self.publisher.publish, **send_params)
+        except Exception as e:
+            return retrying.statistics.get('attempt_number', 1), e
+        return retrying.statistics.get('attempt_number', 1), None
+    
+    def _publish_message_sync(self, event: Event):
         """Синхронная обёртка для публикации сообщения"""
-        asyncio.create_task(self._publish_message_async(event_data))
+        asyncio.create_task(self._publish_message_async(event))
+    
+    async def _send_message(self, **params):
+        """Отправка сообщения (вызывается очередью публикаций)"""
+        return await self.application.bot.send_message(**params)
+    
+    async def _publish_due(self, event_ids: List[str]):
+        """Публикует пачку событий, срок которых наступил (вызывается диспетчером)"""
+        events = []
+        for event_id in event_ids:
+            event = self.events.get(event_id)
+            # Событие могли удалить или выключить после планирования
+            if event is not None and event.is_active:
+                events.append(event)
+        if events:
+            await asyncio.gather(*(self._publish_message_async(event) for event in events))
+    
+    def _cancel_event_jobs(self, event_id: str):
+        """Снимает запланированную публикацию события"""
+        self.slots.release(event_id)
+        self.schedule_state.forget(event_id)
+        if self.dispatcher.cancel(event_id):
+            logger.debug("🗑️ Снята запланированная публикация события %s", event_id)
     
     async def _reschedule_event_jobs(self, event_id: str):
         """Перепланирование задач события после изменения"""
         try:
             # Удаляем старые задачи для этого события
-            if hasattr(self, 'scheduler'):
-                jobs_to_remove = []
-                for job in self.scheduler.get_jobs():
-                    # Проверяем и старый, и новый формат job_id
-                    if job.id.startswith(f"event_{event_id}_"):
-                        jobs_to_remove.append(job.id)
-                
-                logger.info(f"🗑️ Удаляем {len(jobs_to_remove)} старых задач для события {event_id}")
-                for job_id in jobs_to_remove:
-                    self.scheduler.remove_job(job_id)
-                    logger.info(f"   - Удалена задача: {job_id}")
+            self._cancel_event_jobs(event_id)
             
             # Получаем обновленные данные события
-            rows = self.worksheet.get_all_records()
-            event_data = None
-            for row in rows:
-                if str(row.get('ID', '')).strip() == str(event_id).strip():
-                    event_data = row
-                    break
-            
-            if event_data:
+            event = self.events.get(event_id)
+            
+            if event and not event.is_active:
+                logger.debug("⏸️ Событие %s не активно, публикации не планируются", event_id)
+            elif event:
                 # Планируем новые задачи
-                logger.info(f"📅 Планируем новые задачи для события {event_id}")
-                await self._schedule_event_jobs(event_data)
-                logger.info(f"✅ Задачи для события {event_id} перепланированы")
+                logger.debug("📅 Планируем новые задачи для события %s", event_id)
+                await self._schedule_event_jobs(event)
+                logger.debug("✅ Задачи для события %s перепланированы", event_id)
             else:
-                logger.warning(f"⚠️ Событие {event_id} не найдено для перепланирования")
+                logger.warning("⚠️ Событие %s не найдено для перепланирования", event_id)
             
         except Exception as e:
             logger.error(f"Ошибка перепланирования задач для события {event_id}: {e}")
     
+    def _sheets_source(self) -> Optional[SheetsBackend]:
+        """Лист Google Sheets, который могут править операторы (основное хранилище или зеркало)"""
+        if isinstance(self.storage, SheetsBackend):
+            return self.storage
+        if isinstance(self.storage, MirroredBackend) and isinstance(self.storage.mirror, SheetsBackend):
+            return self.storage.mirror
+        return None
+    
+    async def _reconcile_events_from_sheets(self):
+        """Подхватывает ручные правки листа BotEvents без перезапуска"""
+        source = self._sheets_source()
+        if source is None:
+            return
+        try:
+            # Сначала отправляем свои отложенные записи, чтобы лист отражал текущее состояние
+            await self.storage.flush()
+            since_version = self.events.version()
+            records = await source.load_events()
+            deleted = source.take_deleted_event_ids()
+            if isinstance(self.storage, MirroredBackend):
+                # Основное хранилище — SQLite: отсутствие строки в листе ещё не удаление
+                added, rescheduled, removed, missing = await self.events.reconcile(
+                    records, since_version, self.storage.primary, deleted)
+            else:
+                added, rescheduled, removed, missing = await self.events.reconcile(records, since_version, None)
+            
+            for event_id in removed:
+                self._cancel_event_jobs(event_id)
+            for event_id in added + rescheduled:
+                await self._reschedule_event_jobs(event_id)
+            if missing:
+                # Строки, не дошедшие до листа (Sheets был недоступен), дописываем заново
+                logger.warning(f"В Google Sheets нет {len(missing)} событий из SQLite, дописываем их в зеркало")
+                for event_id in missing:
+                    self.storage.remirror_event(self.events.get(event_id).to_record())
+            
+            if added or rescheduled or removed:
+                logger.info(f"🔁 Сверка с Google Sheets: добавлено {len(added)}, изменено {len(rescheduled)}, удалено {len(removed)}")
+        except Exception as e:
+            logger.error(f"Ошибка сверки событий с Google Sheets: {e}")
+    
+    async def _compact_events_sheet(self):
+        """Физически удаляет из листа BotEvents строки удалённых событий"""
+        source = self._sheets_source()
+        if source is None:
+            return
+        try:
+            # Удаления из основного хранилища должны дойти до зеркала раньше уплотнения
+            await self.storage.flush()
+            removed = await source.compact_events()
+            if removed:
+                logger.info(f"🧹 Уплотнение листа BotEvents: удалено {removed} строк")
+        except Exception as e:
+            logger.error(f"Ошибка уплотнения листа BotEvents: {e}")
+    
     async def _update_event_period(self, event_id: str, period_type: str, period_value):
         """Обновление периодичности события"""
         try:
-            all_values = self.worksheet.get_all_values()
-            for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2, так как 1 - заголовки
-                if row[0] == event_id:  # ID в первой колонке
-                    self.worksheet.update_cell(i, 8, period_type)  # Колонка PeriodType (8-я)
-                    period_value_str = json.dumps(period_value) if period_value else ''
-                    self.worksheet.update_cell(i, 9, period_value_str)  # Колонка PeriodValue (9-я)
-                    break
+            await self.events.update(event_id, PeriodType=self._format_period(period_type, period_value))
             
             # Перепланируем задачи
             await self._reschedule_event_jobs(event_id)
@@ -2971,148 +5006,124 @@ class TelegramBot:
             logger.error(f"Ошибка обновления периодичности события {event_id}: {e}")
             raise
     
-    async def _init_existing_topics_for_chat(self, chat_id: int, bot):
-        """Инициализирует существующие топики для форума"""
+    async def _init_existing_topics_for_chat(self, chat_id: int, bot) -> Optional[str]:
+        """Проверяет форум; возвращает актуальное название чата или None, если чат не форум"""
+        chat = await self._get_chat_info(bot, chat_id)
+        chat_title = chat.title or f"Чат {chat_id}"
+        
+        # Проверяем, является ли чат форумом
+        if not (hasattr(chat, 'is_forum') and chat.is_forum):
+            logger.debug(f"Чат '{chat_title}' не является форумом")
+            return None
+        
+        # Примечание: В Telegram Bot API нет прямого способа получить список всех топиков форума
+        # Топики будут добавляться автоматически при их создании или изменении
+        logger.debug(f"Чат '{chat_title}' готов к отслеживанию топиков")
+        return chat_title
+
+    async def _init_all_known_chats(self, bot):
+        """Инициализирует топики для всех известных чатов (фоновая задача после запуска)"""
         try:
-            chat = await bot.get_chat(chat_id)
-            chat_title = chat.title or f"Чат {chat_id}"
-            
-            logger.info(f"🔍 Проверяем чат '{chat_title}' на наличие форума")
-            
-            # Проверяем, является ли чат форумом
-            if not (hasattr(chat, 'is_forum') and chat.is_forum):
-                logger.info(f"⚠️ Чат '{chat_title}' не является форумом")
-                return
-                
-            logger.info(f"📌 Начинаем инициализацию топиков для форума '{chat_title}'")
+            all_chats = self._get_all_chats_from_sheets()
+            logger.info(f"🔄 Инициализация топиков для {len(all_chats)} известных чатов")
             
-            # Сохраняем информацию о чате
-            await self._save_chat_name_to_sheets(chat_id, chat_title)
+            # Запросы к Telegram идут параллельно, но не больше WARMUP_CONCURRENCY одновременно
+            semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
             
-            # Примечание: В Telegram Bot API нет прямого способа получить список всех топиков форума
-            # Топики будут добавляться автоматически при их создании или изменении
-            logger.info(f"✅ Чат '{chat_title}' готов к отслеживанию топиков")
+            async def check_chat(chat_id):
+                async with semaphore:
+                    try:
+                        return chat_id, await self._init_existing_topics_for_chat(chat_id, bot)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Не удалось инициализировать топики для чата {chat_id}: {e}")
+                        return chat_id, None
             
-        except Exception as e:
-            logger.error(f"❌ Ошибка инициализации топиков для чата {chat_id}: {e}")
-
-    async def _init_all_known_chats(self, bot):
-        """Инициализирует топики для всех известных чатов из Google Sheets"""
-        try:
-            logger.info("🔄 Инициализация топиков для всех известных чатов из Google Sheets")
+            results = await asyncio.gather(*(check_chat(chat_id) for chat_id in all_chats))
+            forums = [(chat_id, chat_title) for chat_id, chat_title in results if chat_title]
             
-            # Получаем все чаты из Google Sheets
-            all_chats = self._get_all_chats_from_sheets()
-            logger.info(f"📊 Найдено {len(all_chats)} чатов в Google Sheets")
+            # Результаты применяем разом: изменившиеся названия уходят в хранилище одной пачкой
+            for chat_id, chat_title in forums:
+                await self._save_chat_to_sheets(chat_id, chat_title, self.chats.chat_type(chat_id))
+            if self.storage is not None:
+                await self.storage.flush()
             
-            for chat_id in all_chats:
-                try:
-                    await self._init_existing_topics_for_chat(chat_id, bot)
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось инициализировать топики для чата {chat_id}: {e}")
-                    
-            logger.info("✅ Инициализация топиков завершена")
+            logger.info(f"✅ Инициализация топиков завершена: форумов {len(forums)} из {len(all_chats)} чатов")
             
         except Exception as e:
             logger.error(f"❌ Ошибка при инициализации всех чатов: {e}")
 
+    def _restore_event_schedule(self, event: Event, now: datetime) -> bool:
+        """Возвращает в диспетчер сохранённую публикацию события, если она ещё актуальна"""
+        state = self.schedule_state.get(event.id)
+        if state is None or state['next_run'] is None or state['signature'] != event.schedule_signature():
+            return False
+        next_run, last_published_at = state['next_run'], state['last_published_at']
+        if next_run <= now:
+            # Пропущенную во время простоя публикацию отправляем, только если опоздание невелико
+            already_sent = last_published_at is not None and last_published_at >= next_run
+            if already_sent or (now - next_run).total_seconds() > MISFIRE_GRACE_TIME:
+                return False
+        self.slots.restore(event.id, self._event_chat_key(event), next_run)
+        self.dispatcher.schedule(event.id, next_run)
+        return True
+    
     async def _load_and_schedule_existing_events(self):
         """Загружает и планирует существующие события из Google Sheets"""
         try:
             logger.info("🔄 Загрузка существующих событий из Google Sheets")
             
-            if not hasattr(self, 'worksheet') or self.worksheet is None:
-                logger.error("❌ Worksheet не инициализирован")
+            if self.storage is None:
+                logger.error("❌ Хранилище не инициализировано")
                 return
             
-            # Получаем все записи из Google Sheets
-            records = self.worksheet.get_all_records()
+            # События уже загружены в память в post_init
+            records = self.events.all()
             logger.info(f"📊 Получено {len(records)} записей из Google Sheets")
             
-            active_events = []
-            for record in records:
-                status = record.get('Status', '').lower()
-                if status == 'active':
-                    active_events.append(record)
+            active_events = [event for event in records if event.is_active]
             
             logger.info(f"📅 Найдено {len(active_events)} активных событий")
             
-            # Планируем каждое активное событие
-            scheduled_count = 0
-            events_by_time = {}
+            now = datetime.now()
             
-            # Группируем события по времени выполнения для предотвращения коллизий
+            # Тёплый старт: публикации с сохранённым временем возвращаются в диспетчер без пересчёта
+            restored_count = 0
+            cold_events = []
             for event in active_events:
+                if self._restore_event_schedule(event, now):
+                    restored_count += 1
+                else:
+                    cold_events.append(event)
+            active_ids = {event.id for event in active_events}
+            for event_id in self.schedule_state.event_ids():
+                if event_id not in active_ids:
+                    self.schedule_state.forget(event_id)
+            if restored_count:
+                logger.info(f"♻️ Восстановлено из сохранённого состояния: {restored_count} публикаций")
+            
+            # Остальные планируем в порядке (время, чат, ID): слоты внутри минуты не зависят от порядка строк в хранилище
+            schedule_order = []
+            for event in cold_events:
+                next_datetime = event.next_occurrence(now)
+                if next_datetime is None:
+                    logger.error(f"❌ Ошибка анализа времени события {event.id}: некорректные дата '{event.start_raw}', "
+                                 f"время '{event.time_raw}' или периодичность '{event.period_raw}'")
+                    continue
+                schedule_order.append((next_datetime, event.chat_ref, event.id, event))
+            schedule_order.sort(key=lambda item: item[:3])
+            
+            scheduled_count = 0
+            for _, _, event_id, event in schedule_order:
                 try:
-                    start_date = datetime.strptime(event['StartDate'], '%Y-%m-%d').date()
-                    time_obj = datetime.strptime(event['Time'], '%H:%M').time()
-                    
-                    # Вычисляем время следующей публикации
-                    now = datetime.now()
-                    if event['PeriodType'] == 'once':
-                        next_datetime = datetime.combine(start_date, time_obj)
-                    else:
-                        # Для повторяющихся событий берем завтрашний день, если дата уже прошла
-                        next_date = start_date
-                        while next_date <= now.date():
-                            next_date += timedelta(days=1)
-                        next_datetime = datetime.combine(next_date, time_obj)
-                    
-                    # Группируем по времени (округляем до минуты)
-                    time_key = next_datetime.replace(second=0, microsecond=0)
-                    if time_key not in events_by_time:
-                        events_by_time[time_key] = []
-                    events_by_time[time_key].append(event)
-                    
+                    logger.debug("🔄 Планирование события: %s - %s", event_id, event.description)
+                    await self._schedule_event_jobs(event)
+                    scheduled_count += 1
                 except Exception as e:
-                    logger.error(f"❌ Ошибка анализа времени события {event.get('ID', 'Unknown')}: {e}")
-            
-            # Планируем события с небольшими задержками для одновременных публикаций
-            for time_key, events_at_time in events_by_time.items():
-                for idx, event in enumerate(events_at_time):
-                    try:
-                        event_id = event.get('ID', 'Unknown')
-                        event_desc = event.get('Description', 'Без названия')
-                        logger.info(f"🔄 Планирование события: {event_id} - {event_desc}")
-                        
-                        # Добавляем небольшую задержку (2 секунды) для событий, которые должны выполняться одновременно
-                        if idx > 0:
-                            delay_seconds = idx * 2
-                            logger.info(f"⏱️ Добавляем задержку {delay_seconds} сек для события {event_id} во избежание конфликтов")
-                            # Временно изменяем время события для планирования
-                            original_time = event['Time']
-                            delayed_time_obj = (datetime.strptime(original_time, '%H:%M') + timedelta(seconds=delay_seconds)).time()
-                            event['Time'] = delayed_time_obj.strftime('%H:%M')
-                        
-                        # Проверяем запланированные задачи перед добавлением
-                        if hasattr(self, 'scheduler'):
-                            existing_jobs = [job.id for job in self.scheduler.get_jobs() if job.id.startswith(f"event_{event_id}")]
-                            if existing_jobs:
-                                logger.info(f"⚠️ Найдены существующие задачи для события {event_id}: {existing_jobs}")
-                        
-                        await self._schedule_event_jobs(event)
-                        
-                        # Восстанавливаем оригинальное время
-                        if idx > 0:
-                            event['Time'] = original_time
-                        
-                        # Проверяем запланированные задачи после добавления
-                        if hasattr(self, 'scheduler'):
-                            new_jobs = [job.id for job in self.scheduler.get_jobs() if job.id.startswith(f"event_{event_id}")]
-                            logger.info(f"📝 Задачи для события {event_id}: {new_jobs}")
-                        
-                        scheduled_count += 1
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка планирования события {event.get('ID', 'Unknown')}: {e}")
-                        logger.exception("Полная трассировка ошибки планирования:")
+                    logger.error(f"❌ Ошибка планирования события {event_id}: {e}")
+                    logger.exception("Полная трассировка ошибки планирования:")
             
-            # Выводим общую статистику запланированных задач
-            if hasattr(self, 'scheduler'):
-                all_jobs = self.scheduler.get_jobs()
-                event_jobs = [job for job in all_jobs if job.id.startswith("event_")]
-                logger.info(f"📊 Общее количество запланированных задач событий: {len(event_jobs)}")
-                for job in event_jobs:
-                    logger.info(f"   - {job.id}: {job.next_run_time}")
+            # Выводим общую статистику запланированных публикаций
+            logger.info(f"📊 Общее количество запланированных публикаций: {len(self.dispatcher)}")
             
             logger.info(f"✅ Загружено и запланировано {scheduled_count} из {len(active_events)} активных событий")
             
@@ -3120,6 +5131,77 @@ class TelegramBot:
             logger.error(f"❌ Ошибка загрузки событий: {e}")
             logger.error(f"❌ Ошибка загрузки событий: {e}")
 
+    def _register_handlers(self, application: Application):
+        """Регистрирует все обработчики апдейтов (общие для polling и бенчмарков)"""
+        conv_handler = self.create_conversation_handler()
+        application.add_handler(conv_handler)
+        
+        # Добавляем обработчик для сообщений в группах (вне диалогов)
+        group_handler = MessageHandler(
+            filters.ALL & ~filters.COMMAND & ~filters.UpdateType.EDITED_MESSAGE,
+            self.handle_group_message
+        )
+        application.add_handler(group_handler)
+        
+        # Добавляем обработчики событий форума
+        forum_handlers = [
+            MessageHandler(filters.StatusUpdate.FORUM_TOPIC_CREATED, self.handle_forum_topic_created),
+            MessageHandler(filters.StatusUpdate.FORUM_TOPIC_EDITED, self.handle_forum_topic_edited),
+            MessageHandler(filters.StatusUpdate.FORUM_TOPIC_CLOSED, self.handle_forum_topic_closed),
+            MessageHandler(filters.StatusUpdate.FORUM_TOPIC_REOPENED, self.handle_forum_topic_reopened),
+            MessageHandler(filters.StatusUpdate.GENERAL_FORUM_TOPIC_HIDDEN, self.handle_general_forum_topic_hidden),
+            MessageHandler(filters.StatusUpdate.GENERAL_FORUM_TOPIC_UNHIDDEN, self.handle_general_forum_topic_unhidden),
+        ]
+        
+        for handler in forum_handlers:
+            application.add_handler(handler)
+        
+        # Команды
+        application.add_handler(CommandHandler("help", self.help_command))
+        application.add_handler(CommandHandler("start_bot", self.start_bot_command))
+        application.add_handler(CommandHandler("init_topics", self.init_topics_command))
+        application.add_handler(CommandHandler("replay_failed", self.replay_failed_command))
+        
+        # Замеряем все обработчики (обработчики диалога обёрнуты в create_conversation_handler)
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if not isinstance(handler, ConversationHandler):
+                    self._instrument_handler(handler)
+        
+        # Добавляем обработчик ошибок
+        async def error_handler(update, context):
+            """Обработчик ошибок приложения"""
+            logger.error(f"Произошла ошибка: {context.error}")
+            if "Conflict" in str(context.error):
+                logger.error("⚠️ Обнаружен конфликт - возможно запущен другой экземпляр бота")
+                return
+            logger.exception("Полная трассировка ошибки:")
+        
+        application.add_error_handler(error_handler)
+
+    def _run_webhook(self):
+        """Приём апдейтов через вебхук: встроенный HTTP-сервер вместо getUpdates"""
+        if not WEBHOOK_URL:
+            raise ValueError("Для режима webhook нужен BOT_WEBHOOK_URL")
+        url_path = WEBHOOK_PATH.strip('/')
+        webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{url_path}"
+        # Без секрета любой, кто знает адрес, мог бы присылать боту поддельные апдейты
+        secret_token = WEBHOOK_SECRET or uuid.uuid4().hex
+        logger.info(f"🌐 Вебхук: {webhook_url}, слушаем {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, "
+                    f"соединений до {WEBHOOK_MAX_CONNECTIONS}, одновременных апдейтов {CONCURRENT_UPDATES}")
+        self.application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=url_path,
+            webhook_url=webhook_url,
+            secret_token=secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            cert=WEBHOOK_CERT,
+            key=WEBHOOK_KEY,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=DROP_PENDING_UPDATES
+        )
+
     def run(self):
         """Основной метод запуска бота"""
         try:
@@ -3150,49 +5232,23 @@ class TelegramBot:
             
             # Пытаемся инициализировать Google Sheets
             sheets_available = self._init_google_sheets()
+            self.storage = self._create_storage(sheets_available)
+            self.events = EventStore(self.storage)
+            self.chats = ChatRegistry(self.storage)
+            self.dead_letters = DeadLetterQueue(self.storage)
             
             # Создаем приложение
-            self.application = Application.builder().token(self.token).build()
-            
-            # Добавляем обработчики
-            conv_handler = self.create_conversation_handler()
-            self.application.add_handler(conv_handler)
-            
-            # Добавляем обработчик для сообщений в группах (вне диалогов)
-            group_handler = MessageHandler(
-                filters.ALL & ~filters.COMMAND & ~filters.UpdateType.EDITED_MESSAGE,
-                self.handle_group_message
+            # Вызовы Bot API считаются для метрик и лога медленных апдейтов
+            self.application = (
+                Application.builder()
+                .token(self.token)
+                .request(InstrumentedRequest(connection_pool_size=256))
+                .concurrent_updates(CONCURRENT_UPDATES if CONCURRENT_UPDATES > 1 else False)
+                .build()
             )
-            self.application.add_handler(group_handler)
-            
-            # Добавляем обработчики событий форума
-            forum_handlers = [
-                MessageHandler(filters.StatusUpdate.FORUM_TOPIC_CREATED, self.handle_forum_topic_created),
-                MessageHandler(filters.StatusUpdate.FORUM_TOPIC_EDITED, self.handle_forum_topic_edited),
-                MessageHandler(filters.StatusUpdate.FORUM_TOPIC_CLOSED, self.handle_forum_topic_closed),
-                MessageHandler(filters.StatusUpdate.FORUM_TOPIC_REOPENED, self.handle_forum_topic_reopened),
-                MessageHandler(filters.StatusUpdate.GENERAL_FORUM_TOPIC_HIDDEN, self.handle_general_forum_topic_hidden),
-                MessageHandler(filters.StatusUpdate.GENERAL_FORUM_TOPIC_UNHIDDEN, self.handle_general_forum_topic_unhidden),
-            ]
-            
-            for handler in forum_handlers:
-                self.application.add_handler(handler)
             
-            # Команды
-            self.application.add_handler(CommandHandler("help", self.help_command))
-            self.application.add_handler(CommandHandler("start_bot", self.start_bot_command))
-            self.application.add_handler(CommandHandler("init_topics", self.init_topics_command))
-            
-            # Добавляем обработчик ошибок
-            async def error_handler(update, context):
-                """Обработчик ошибок приложения"""
-                logger.error(f"Произошла ошибка: {context.error}")
-                if "Conflict" in str(context.error):
-                    logger.error("⚠️ Обнаружен конфликт - возможно запущен другой экземпляр бота")
-                    return
-                logger.exception("Полная трассировка ошибки:")
-            
-            self.application.add_error_handler(error_handler)
+            # Добавляем обработчики
+            self._register_handlers(self.application)
             
             # Добавляем задачу для установки команд и загрузки событий
             async def post_init(application):
@@ -3206,30 +5262,81 @@ class TelegramBot:
                 #]
                 #await application.bot.set_my_commands(commands)
                 
-                # Загружаем и планируем существующие события только если Google Sheets доступен
-                if sheets_available:
+                # Загружаем и планируем существующие события только если хранилище доступно
+                # Очередь отправки и диспетчер публикаций работают в цикле событий приложения
+                self.publisher.start()
+                self.dispatcher.start()
+                await self.metrics_server.start()
+                logger.info(f"Сохранённое состояние диспетчера: {await self.schedule_state.start()} событий")
+                
+                if self.storage is not None:
+                    await self.storage.start()
+                    # Загружаем чаты и события в память (ввод-вывод идёт вне цикла событий)
+                    logger.info(f"Загружено {await self.chats.load()} чатов в память")
+                    logger.info(f"Загружено {await self.events.load()} событий в память")
+                    logger.info(f"Неотправленных публикаций в очереди: {await self.dead_letters.load()}")
                     await self._load_and_schedule_existing_events()
-                    # Инициализируем топики для всех известных чатов
-                    await self._init_all_known_chats(application.bot)
+                    # Периодически подхватываем ручные правки листа BotEvents
+                    if RECONCILE_INTERVAL > 0 and self._sheets_source() is not None:
+                        self.scheduler.add_job(
+                            self._reconcile_events_from_sheets,
+                            'interval',
+                            seconds=RECONCILE_INTERVAL,
+                            id='reconcile_events',
+                            replace_existing=True,
+                            max_instances=1,
+                            coalesce=True
+                        )
+                    # Периодически убираем из листа строки удалённых событий
+                    if COMPACT_INTERVAL > 0 and self._sheets_source() is not None:
+                        self.scheduler.add_job(
+                            self._compact_events_sheet,
+                            'interval',
+                            seconds=COMPACT_INTERVAL,
+                            id='compact_events',
+                            replace_existing=True,
+                            max_instances=1,
+                            coalesce=True
+                        )
+                    # Топики известных чатов проверяем в фоне, чтобы не задерживать polling и публикации
+                    self._warmup_task = asyncio.create_task(self._init_all_known_chats(application.bot))
                 else:
-                    logger.warning("Google Sheets недоступен - работаем в ограниченном режиме")
+                    logger.warning("Хранилище недоступно - работаем в ограниченном режиме")
                 
                 logger.info("Бот успешно запущен и готов к работе!")
             
             self.application.post_init = post_init
             
-            # Запускаем polling (блокирующий вызов)
+            async def post_shutdown(application):
+                if self._warmup_task is not None and not self._warmup_task.done():
+                    self._warmup_task.cancel()
+                # Новые публикации не запускаем, неотправленные сообщения снимаем с очереди
+                await self.publisher.stop()
+                await self.dispatcher.stop()
+                await self.metrics_server.stop()
+                await self.schedule_state.close()
+                # Отправляем отложенные изменения (в том числе в Google Sheets) перед выходом
+                if self.storage is not None:
+                    await self.storage.close()
+                    logger.info("Хранилище закрыто, очередь записи сброшена")
+            
+            self.application.post_shutdown = post_shutdown
+            
+            # Запускаем приём апдейтов (блокирующий вызов)
             try:
-                self.application.run_polling(
-                    allowed_updates=["message", "callback_query", "forum_topic_created", "forum_topic_edited", "forum_topic_closed", "forum_topic_reopened"],
-                    drop_pending_updates=True
-                )
+                if UPDATES_MODE == 'webhook':
+                    self._run_webhook()
+                else:
+                    self.application.run_polling(
+                        allowed_updates=ALLOWED_UPDATES,
+                        drop_pending_updates=DROP_PENDING_UPDATES
+                    )
             except Exception as polling_error:
                 if "Conflict" in str(polling_error):
                     logger.error("❌ Конфликт: обнаружен другой запущенный экземпляр бота")
                     logger.error("Убедитесь, что запущен только один экземпляр бота")
                 else:
-                    logger.error(f"Ошибка polling: {polling_error}")
+                    logger.error(f"Ошибка приёма апдейтов: {polling_error}")
                 raise
             
         except KeyboardInterrupt:
@@ -3241,6 +5348,7 @@ class TelegramBot:
             if hasattr(self, 'scheduler') and self.scheduler:
                 self.scheduler.shutdown()
                 logger.info("Планировщик остановлен")
+            self.sheets.shutdown()
 
 # Точка входа для запуска бота
 def main():
@@ -0,0 +1,647 @@
+"""
+Регрессионные тесты bot_py на фейковых листах Google Sheets, SQLite во
+временном каталоге и виртуальных часах цикла событий.
+
+    python -m pytest -q test_bot_py.py
+"""
+import asyncio
+import itertools
+import os
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+import gspread
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+import bot_py
+from bot_py import (
+    DEAD_LETTER_HEADERS, EVENT_HEADERS, EVENT_TOMBSTONE, TOPIC_HEADERS, Event, EventStore, MirroredBackend,
+    PublicationDispatcher, RateLimitedPublisher, ScheduleState, SheetsBackend, SheetsGateway,
+    SheetsWriteBehind, SlotAllocator, SQLiteBackend, TelegramBot, TokenBucket, UpdateTrace, add_months,
+    next_occurrence,
+)
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.worksheets = []
+
+    def batch_update(self, body):
+        for request in body.get('requests', []):
+            target = request['deleteDimension']['range']
+            for worksheet in self.worksheets:
+                if worksheet.id == target['sheetId']:
+                    del worksheet.rows[target['startIndex'] - 1:target['endIndex'] - 1]
+
+
+class FakeWorksheet:
+    """Лист gspread в памяти: строка 1 — заголовки, rows — строки данных начиная со второй"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, spreadsheet: FakeSpreadsheet, headers, rows=()):
+        self.id = next(self._ids)
+        self.spreadsheet = spreadsheet
+        self.headers = list(headers)
+        self.rows = [list(row) for row in rows]
+        spreadsheet.worksheets.append(self)
+
+    def get_all_records(self):
+        return [dict(zip(self.headers, row)) for row in self.rows]
+
+    def get_all_values(self):
+        return [list(self.headers)] + [[str(value) for value in row] for row in self.rows]
+
+    def row_values(self, row, **kwargs):
+        return list(self.headers) if row == 1 else list(self.rows[row - 2])
+
+    def find(self, value, in_column=None):
+        for row_index, row in enumerate(self.rows, start=2):
+            if in_column is not None and len(row) >= in_column and str(row[in_column - 1]) == str(value):
+                return SimpleNamespace(row=row_index, col=in_column, value=str(value))
+        return None
+
+    def append_row(self, row_data, **kwargs):
+        self.append_rows([row_data])
+
+    def append_rows(self, rows, **kwargs):
+        self.rows.extend(list(row) for row in rows)
+
+    def update_cell(self, row, col, value):
+        self.rows[row - 2][col - 1] = value
+
+    def batch_update(self, data, **kwargs):
+        for change in data:
+            row, col = gspread.utils.a1_to_rowcol(change['range'])
+            self.rows[row - 2][col - 1] = change['values'][0][0]
+
+    def column(self, header):
+        index = self.headers.index(header)
+        return [row[index] for row in self.rows]
+
+
+class OfflineTelegramBot(TelegramBot):
+    """TelegramBot без файлов с токеном и ключом сервисного аккаунта"""
+
+    def _load_token(self) -> str:
+        return '0:test'
+
+    def _load_service_account(self):
+        return {}
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Цикл событий с виртуальными часами: ожидание таймеров не занимает реального времени"""
+
+    def __init__(self):
+        super().__init__()
+        self._now = 0.0
+        select = self._selector.select
+
+        def virtual_select(timeout=None):
+            ready = select(0)
+            if not ready and timeout:
+                self._now += timeout
+            return ready
+
+        self._selector.select = virtual_select
+
+    def time(self) -> float:
+        return self._now
+
+
+def run_virtual(coroutine):
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def run_in_tempdir(scenario):
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def event_row(event_id: str, status: str = 'active') -> list:
+    return [event_id, '-1001000000000', f"Событие {event_id}", '2024-01-01', 'FOREVER',
+            '10:00', 'daily', f"Текст {event_id}", status]
+
+
+def event_record(event_id: str, **fields) -> dict:
+    record = dict(zip(EVENT_HEADERS, event_row(event_id)))
+    record.update(fields)
+    return record
+
+
+def make_sheets(event_rows=()):
+    spreadsheet = FakeSpreadsheet()
+    return (FakeWorksheet(spreadsheet, EVENT_HEADERS, event_rows), FakeWorksheet(spreadsheet, TOPIC_HEADERS),
+            FakeWorksheet(spreadsheet, DEAD_LETTER_HEADERS))
+
+
+class MirroredBot:
+    """TelegramBot с SQLite в качестве основного хранилища и фейковым листом-зеркалом"""
+
+    def __init__(self, directory: str, sheet_rows=()):
+        self.events_sheet, topics_sheet, dead_letters_sheet = make_sheets(sheet_rows)
+        self.bot = OfflineTelegramBot()
+        self.bot.schedule_state = ScheduleState(os.path.join(directory, 'state.db'))
+        self.bot.application = SimpleNamespace()
+        self.sqlite = SQLiteBackend(os.path.join(directory, 'bot.db'))
+        mirror = SheetsBackend(self.events_sheet, topics_sheet, self.bot.sheets, self.bot.sheets_writer,
+                               dead_letters_sheet)
+        self.bot.storage = MirroredBackend(self.sqlite, mirror, on_bootstrap=self.bot._on_storage_bootstrapped)
+        self.bot.events = EventStore(self.bot.storage)
+        self.bot.chats = bot_py.ChatRegistry(self.bot.storage)
+
+    async def seed_sqlite(self, event_ids):
+        await self.sqlite.start()
+        for event_id in event_ids:
+            await self.sqlite.insert_event(event_record(event_id))
+
+    async def start(self):
+        await self.bot.schedule_state.start()
+        await self.bot.storage.start()
+        await self.bot.storage._mirror_ready.wait()
+        await self.bot.events.load()
+
+    async def stop(self):
+        await self.bot.schedule_state.close()
+        await self.bot.storage.close()
+        self.bot.sheets.shutdown()
+
+    async def sqlite_ids(self):
+        return [record['ID'] for record in await self.sqlite.load_events()]
+
+    def sheet_ids(self, status: str = 'active'):
+        return [row[0] for row in self.events_sheet.rows if row[-1] == status]
+
+
+# --- SheetsWriteBehind -------------------------------------------------------
+
+class BlockingAppendWorksheet(FakeWorksheet):
+    """append_rows ждёт release и завершается успехом или ошибкой fail"""
+
+    def __init__(self, *args, fail: bool = False):
+        super().__init__(*args)
+        self.release = threading.Event()
+        self.finished = threading.Event()
+        self.fail = fail
+        self.appends = 0
+
+    def append_rows(self, rows, **kwargs):
+        self.appends += 1
+        if self.appends == 1:
+            try:
+                self.release.wait(5)
+                if self.fail:
+                    raise ConnectionError('соединение сброшено')
+                super().append_rows(rows, **kwargs)
+            finally:
+                self.finished.set()
+        else:
+            super().append_rows(rows, **kwargs)
+
+
+def test_write_behind_does_not_repeat_timed_out_append():
+    async def scenario():
+        gateway = SheetsGateway(timeout=0.05)
+        writer = SheetsWriteBehind(gateway)
+        worksheet = BlockingAppendWorksheet(FakeSpreadsheet(), EVENT_HEADERS)
+        writer.append_row(worksheet, event_row('A'))
+        await writer.flush()
+        # Таймаут: поток gspread продолжает работу и всё-таки добавляет строку
+        worksheet.release.set()
+        writer.append_row(worksheet, event_row('B'))
+        await writer.flush()
+        assert worksheet.finished.wait(5)
+        gateway.shutdown()
+        assert worksheet.column('ID') == ['A', 'B']
+
+    asyncio.run(scenario())
+
+
+def test_write_behind_retries_timed_out_append_that_failed():
+    async def scenario():
+        gateway = SheetsGateway(timeout=0.05)
+        writer = SheetsWriteBehind(gateway)
+        worksheet = BlockingAppendWorksheet(FakeSpreadsheet(), EVENT_HEADERS, fail=True)
+        writer.append_row(worksheet, event_row('A'))
+        await writer.flush()
+        worksheet.release.set()
+        await writer.flush()
+        assert worksheet.finished.wait(5)
+        gateway.shutdown()
+        assert worksheet.column('ID') == ['A']
+
+    asyncio.run(scenario())
+
+
+# --- MirroredBackend ---------------------------------------------------------
+
+def test_bootstrap_survives_unavailable_mirror():
+    async def scenario(directory):
+        events_sheet, topics_sheet, dead_letters_sheet = make_sheets([event_row('A'), event_row('B')])
+        topics_sheet.rows.append(['-1001000000000', 'Группа', 'supergroup', '', '', '', '2024-01-01'])
+        gateway = SheetsGateway()
+        mirror = SheetsBackend(events_sheet, topics_sheet, gateway, SheetsWriteBehind(gateway), dead_letters_sheet)
+        sqlite = SQLiteBackend(os.path.join(directory, 'bot.db'))
+        bootstrapped = asyncio.Event()
+
+        async def on_bootstrap():
+            bootstrapped.set()
+
+        storage = MirroredBackend(sqlite, mirror, on_bootstrap=on_bootstrap)
+        storage.MIRROR_RETRY_DELAY = 0.01
+        get_all_records = events_sheet.get_all_records
+        failures = iter([ConnectionError('Sheets недоступен')])
+
+        def flaky_get_all_records():
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            return get_all_records()
+
+        events_sheet.get_all_records = flaky_get_all_records
+        # Пустая база и недоступный лист: старт не падает, работа идёт на пустой базе
+        await storage.start()
+        try:
+            assert await storage.load_events() == []
+            # Фоновая задача повторяет импорт и сообщает о нём
+            await asyncio.wait_for(bootstrapped.wait(), 5)
+            assert [record['ID'] for record in await storage.load_events()] == ['A', 'B']
+        finally:
+            await storage.close()
+            gateway.shutdown()
+
+    run_in_tempdir(scenario)
+
+
+# --- Сверка с листом BotEvents -----------------------------------------------
+
+def test_reconcile_keeps_sqlite_events_missing_from_mirror():
+    async def scenario(directory):
+        env = MirroredBot(directory, [event_row('A')])
+        # B создано, пока Google Sheets был недоступен: в SQLite есть, в листе нет
+        await env.seed_sqlite(['A', 'B'])
+        await env.start()
+        try:
+            await env.bot._reconcile_events_from_sheets()
+            assert await env.sqlite_ids() == ['A', 'B']
+            assert 'B' in env.bot.events
+            # Недостающая строка дописывается в зеркало
+            await env.bot.storage.flush()
+            assert env.sheet_ids() == ['A', 'B']
+        finally:
+            await env.stop()
+
+    run_in_tempdir(scenario)
+
+
+def test_reconcile_applies_deletions_made_in_mirror():
+    async def scenario(directory):
+        env = MirroredBot(directory, [event_row('A'), event_row('B'), event_row('C')])
+        await env.seed_sqlite(['A', 'B', 'C'])
+        await env.start()
+        try:
+            # B помечено удалённым, строку C оператор удалил из листа
+            env.events_sheet.rows[1][-1] = EVENT_TOMBSTONE
+            del env.events_sheet.rows[2]
+            await env.bot._reconcile_events_from_sheets()
+            assert await env.sqlite_ids() == ['A']
+            assert 'B' not in env.bot.events and 'C' not in env.bot.events
+        finally:
+            await env.stop()
+
+    run_in_tempdir(scenario)
+
+
+# --- Индекс строк SheetsBackend ----------------------------------------------
+
+def test_sheets_backend_rechecks_rows_moved_by_hand():
+    async def scenario():
+        events_sheet, topics_sheet, dead_letters_sheet = make_sheets([event_row('A'), event_row('B')])
+        gateway = SheetsGateway()
+        backend = SheetsBackend(events_sheet, topics_sheet, gateway, SheetsWriteBehind(gateway), dead_letters_sheet)
+        await backend.load_events()
+        await backend.insert_event(event_record('C'))
+        # Оператор вставил строку вверху листа: все номера строк сдвинулись
+        events_sheet.rows.insert(0, event_row('X'))
+        await backend.update_event('B', {'Text': 'новый текст'})
+        await backend.update_event('C', {'Text': 'текст C'})
+        await backend.delete_event('A')
+        await backend.flush()
+        gateway.shutdown()
+
+        rows = {row[0]: row for row in events_sheet.rows}
+        assert events_sheet.column('ID') == ['X', 'A', 'B', 'C']
+        assert rows['X'] == event_row('X')
+        assert rows['A'][-1] == EVENT_TOMBSTONE
+        assert rows['B'][EVENT_HEADERS.index('Text')] == 'новый текст'
+        assert rows['C'][EVENT_HEADERS.index('Text')] == 'текст C'
+
+    asyncio.run(scenario())
+
+
+# --- Расписание --------------------------------------------------------------
+
+def test_add_months_clamps_to_month_end():
+    assert add_months(date(2024, 1, 31), 1) == date(2024, 2, 29)
+    assert add_months(date(2023, 1, 31), 1) == date(2023, 2, 28)
+    assert add_months(date(2024, 1, 31), 3) == date(2024, 4, 30)
+    assert add_months(date(2024, 11, 30), 2) == date(2025, 1, 30)
+
+
+def test_monthly_occurrence_does_not_drift_after_short_month():
+    start, at = date(2023, 1, 31), time(9, 0)
+    assert next_occurrence('monthly', None, start, at, datetime(2023, 2, 1)) == datetime(2023, 2, 28, 9, 0)
+    # Март снова 31-го: обрезка февраля не накапливается
+    assert next_occurrence('monthly', None, start, at, datetime(2023, 2, 28, 10, 0)) == datetime(2023, 3, 31, 9, 0)
+
+
+def test_every_n_days_is_aligned_to_start_date():
+    start, at = date(2024, 1, 1), time(12, 0)
+    assert next_occurrence('custom_days', 3, start, at, datetime(2024, 1, 2)) == datetime(2024, 1, 4, 12, 0)
+    assert next_occurrence('custom_days', 3, start, at, datetime(2024, 1, 4, 12, 0)) == datetime(2024, 1, 7, 12, 0)
+    # До даты начала первая публикация — сама дата начала
+    assert next_occurrence('custom_days', 3, start, at, datetime(2023, 12, 1)) == datetime(2024, 1, 1, 12, 0)
+
+
+def test_weekdays_occurrence():
+    start, at = date(2024, 1, 1), time(8, 30)  # понедельник
+    # Пн, Ср, Пт; после понедельника 08:30 следующая — среда
+    assert next_occurrence('weekdays', [0, 2, 4], start, at, datetime(2024, 1, 1, 8, 30)) == datetime(2024, 1, 3, 8, 30)
+    # После пятницы — понедельник следующей недели
+    assert next_occurrence('weekdays', [0, 2, 4], start, at, datetime(2024, 1, 5, 9, 0)) == datetime(2024, 1, 8, 8, 30)
+
+
+def test_time_later_today_counts_as_today():
+    start, at = date(2024, 1, 1), time(18, 0)
+    assert next_occurrence('daily', None, start, at, datetime(2024, 3, 10, 17, 59)) == datetime(2024, 3, 10, 18, 0)
+    # Время уже прошло (в том числе ровно сейчас) — следующий день
+    assert next_occurrence('daily', None, start, at, datetime(2024, 3, 10, 18, 0)) == datetime(2024, 3, 11, 18, 0)
+    assert next_occurrence('weekly', None, start, at, datetime(2024, 1, 8, 17, 0)) == datetime(2024, 1, 8, 18, 0)
+
+
+def test_event_with_past_end_date_has_no_next_publication():
+    event = Event(event_record('A', StartDate='2024-01-01', EndDate='2024-01-10', Time='10:00'))
+    assert event.next_publication(datetime(2024, 1, 9, 11, 0)) == datetime(2024, 1, 10, 10, 0)
+    assert event.next_publication(datetime(2024, 1, 10, 10, 0)) is None
+    assert event.next_publication(datetime(2024, 6, 1)) is None
+
+
+# --- Диспетчер публикаций ----------------------------------------------------
+
+async def _no_handler(batch):
+    pass
+
+
+def test_dispatcher_cancel_then_reschedule_fires_once_at_new_time():
+    dispatcher = PublicationDispatcher(_no_handler)
+    first, second = datetime(2030, 1, 1, 10, 0), datetime(2030, 1, 1, 11, 0)
+    assert dispatcher.schedule('A', first)
+    assert dispatcher.cancel('A')
+    assert dispatcher.schedule('A', second)
+    assert dispatcher._pop_due(first) == []
+    assert dispatcher._pop_due(second) == ['A']
+    assert dispatcher._pop_due(second + timedelta(hours=1)) == []
+
+
+def test_dispatcher_cancelled_entry_does_not_fire():
+    dispatcher = PublicationDispatcher(_no_handler)
+    run_at = datetime(2030, 1, 1, 10, 0)
+    dispatcher.schedule('A', run_at)
+    dispatcher.schedule('B', run_at)
+    dispatcher.cancel('A')
+    assert 'A' not in dispatcher and len(dispatcher) == 1
+    assert dispatcher._pop_due(run_at + timedelta(minutes=1)) == ['B']
+    assert dispatcher._heap == []
+
+
+def test_edit_time_reschedules_publication():
+    async def reply_text(*args, **kwargs):
+        pass
+
+    async def view_events(update, context):
+        return bot_py.VIEW_EVENTS
+
+    async def scenario(directory):
+        bot = OfflineTelegramBot()
+        bot.storage = SQLiteBackend(os.path.join(directory, 'bot.db'))
+        bot.events = EventStore(bot.storage)
+        bot.schedule_state = ScheduleState(os.path.join(directory, 'state.db'))
+        bot.view_events = view_events
+        await bot.storage.start()
+        await bot.schedule_state.start()
+        try:
+            event = await bot.events.add(event_record('A', Time='10:00'))
+            await bot._schedule_event_jobs(event)
+            assert bot.dispatcher.scheduled_at('A').time() < time(10, 1)
+
+            bot.user_data[1] = {'editing_event_id': 'A', 'editing_field': 'time'}
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=1),
+                                     message=SimpleNamespace(text='21:15', reply_text=reply_text))
+            await bot.enter_time(update, SimpleNamespace())
+            assert bot.dispatcher.scheduled_at('A').time() >= time(21, 15)
+        finally:
+            await bot.schedule_state.close()
+            await bot.storage.close()
+
+    run_in_tempdir(scenario)
+
+
+# --- Очередь отправки --------------------------------------------------------
+
+def test_token_bucket_reserves_slots_in_order():
+    bucket = TokenBucket(rate=2, capacity=1)
+    assert bucket.reserve(100.0) == 0.0
+    assert bucket.reserve(100.0) == 0.5
+    assert bucket.reserve(100.0) == 1.0
+    # Через секунду долг погашен наполовину
+    assert bucket.reserve(101.0) == 0.5
+    bucket.pause(101.0, 10)
+    assert bucket.reserve(101.0) == 10.5
+    assert not bucket.is_idle(105.0)
+    assert bucket.is_idle(200.0)
+
+
+def _recording_publisher(fail_first_with=None, **limits):
+    sent = []
+
+    async def send(chat_id, **params):
+        if fail_first_with is not None and not sent:
+            sent.append((None, chat_id))
+            raise fail_first_with
+        sent.append((asyncio.get_running_loop().time(), chat_id))
+        return chat_id
+
+    return RateLimitedPublisher(send, **limits), sent
+
+
+def test_publisher_respects_global_rate():
+    async def scenario():
+        publisher, sent = _recording_publisher(global_rate=5, group_rate=600, chat_burst=1, workers=4)
+        publisher.start()
+        await asyncio.gather(*(publisher.publish(chat_id) for chat_id in range(1, 11)))
+        await publisher.stop()
+        times = [at for at, _ in sent]
+        assert sorted(chat_id for _, chat_id in sent) == list(range(1, 11))
+        assert all(later - earlier >= 0.2 - 1e-9 for earlier, later in zip(times, times[1:]))
+        assert times[-1] - times[0] >= 1.8 - 1e-9
+
+    run_virtual(scenario())
+
+
+def test_publisher_respects_group_rate():
+    async def scenario():
+        publisher, sent = _recording_publisher(global_rate=30, group_rate=20, chat_burst=1, workers=4)
+        publisher.start()
+        # Пять сообщений в одну группу и одно в другую
+        await asyncio.gather(*(publisher.publish(-100) for _ in range(5)), publisher.publish(-200))
+        await publisher.stop()
+        group_times = [at for at, chat_id in sent if chat_id == -100]
+        other_time = next(at for at, chat_id in sent if chat_id == -200)
+        # 20 сообщений в минуту: i-е сообщение группы уходит не раньше 3·i секунд; другая группа не ждёт
+        assert all(at >= 3 * index - 1e-9 for index, at in enumerate(group_times))
+        assert group_times[-1] < 13
+        assert other_time < 1
+
+    run_virtual(scenario())
+
+
+def test_publisher_pauses_all_chats_after_retry_after():
+    async def scenario():
+        publisher, sent = _recording_publisher(RetryAfter(5), global_rate=30, group_rate=600, chat_burst=1,
+                                               workers=1)
+        publisher.start()
+        first = asyncio.ensure_future(publisher.publish(1))
+        await asyncio.sleep(0)
+        others = [asyncio.ensure_future(publisher.publish(chat_id)) for chat_id in (2, 3)]
+        results = await asyncio.gather(first, *others, return_exceptions=True)
+        await publisher.stop()
+        assert isinstance(results[0], RetryAfter)
+        assert results[1:] == [2, 3]
+        # Flood control действует на весь бот: следующие чаты ждут 5 секунд
+        assert min(at for at, chat_id in sent if chat_id in (2, 3)) >= 5
+
+    run_virtual(scenario())
+
+
+# --- Публикация и повторы ----------------------------------------------------
+
+def test_timed_out_send_is_not_retried():
+    assert TelegramBot._is_retryable_send_error(RetryAfter(1))
+    assert TelegramBot._is_retryable_send_error(NetworkError('сеть'))
+    assert not TelegramBot._is_retryable_send_error(TimedOut())
+
+
+def test_event_deleted_during_send_is_not_rescheduled():
+    async def scenario(directory):
+        bot = OfflineTelegramBot()
+        bot.storage = SQLiteBackend(os.path.join(directory, 'bot.db'))
+        bot.events = EventStore(bot.storage)
+        bot.schedule_state = ScheduleState(os.path.join(directory, 'state.db'))
+        bot.application = SimpleNamespace()
+        await bot.storage.start()
+        await bot.schedule_state.start()
+
+        async def send_with_retry(send_params):
+            # Пока шли повторы, событие удалили
+            await bot.events.delete('A')
+            bot._cancel_event_jobs('A')
+            return 1, None
+
+        bot._send_with_retry = send_with_retry
+        try:
+            event = await bot.events.add(event_record('A'))
+            await bot._publish_message_async(event)
+            assert 'A' not in bot.dispatcher
+            assert 'A' not in bot.slots._slots
+            assert bot.schedule_state.get('A') is None
+        finally:
+            await bot.schedule_state.close()
+            await bot.storage.close()
+
+    run_in_tempdir(scenario)
+
+
+# --- Слоты отправки ----------------------------------------------------------
+
+def test_slot_allocator_spill_is_visible_to_next_minute():
+    slots = SlotAllocator(per_second=1, group_rate=60)
+    minute = datetime(2030, 1, 1, 10, 0)
+    first = [slots.allocate(f"a{index}", f"chat{index}", minute) for index in range(61)]
+    assert len(set(first)) == 61
+    # 61-я публикация не помещается в заполненную минуту и уходит в следующую
+    spilled = [run_at for run_at in first if run_at.minute == 1]
+    assert len(spilled) == 1
+
+    second = [slots.allocate(f"b{index}", f"chat{index}", minute + timedelta(minutes=1)) for index in range(60)]
+    assert spilled[0] not in second
+    assert len(set(first + second)) == 121
+    # Вторая минута тоже заполнилась: последняя публикация — в третьей минуте
+    assert sum(run_at.minute == 1 for run_at in first + second) == 60
+    assert sum(run_at.minute == 2 for run_at in second) == 1
+
+
+# --- Удаление события --------------------------------------------------------
+
+def test_confirm_delete_event_clears_schedule():
+    async def edit_message_text(*args, **kwargs):
+        pass
+
+    async def view_events(update, context):
+        return bot_py.EDIT_EVENT
+
+    async def scenario(directory):
+        env = MirroredBot(directory, [event_row('A'), event_row('B')])
+        await env.start()
+        bot = env.bot
+        bot.view_events = view_events
+        try:
+            for event in bot.events.all():
+                await bot._schedule_event_jobs(event)
+            assert 'A' in bot.dispatcher and 'A' in bot.slots._slots and bot.schedule_state.get('A')
+
+            update = SimpleNamespace(callback_query=SimpleNamespace(edit_message_text=edit_message_text))
+            await bot._confirm_delete_event(update, SimpleNamespace(), 'A')
+
+            assert 'A' not in bot.events
+            assert 'A' not in bot.dispatcher
+            assert 'A' not in bot.slots._slots
+            assert bot.schedule_state.get('A') is None
+            assert 'B' in bot.dispatcher
+        finally:
+            await env.stop()
+        # После перезапуска удалённое событие не возвращается из сохранённого состояния
+        state = ScheduleState(os.path.join(directory, 'state.db'))
+        await state.start()
+        try:
+            assert state.event_ids() == ['B']
+        finally:
+            await state.close()
+
+    run_in_tempdir(scenario)
+
+
+# --- Трассировка апдейтов ----------------------------------------------------
+
+def test_update_trace_counts_sqlite_calls():
+    async def scenario(directory):
+        storage = SQLiteBackend(os.path.join(directory, 'bot.db'))
+        await storage.start()
+        trace = UpdateTrace('test')
+        token = bot_py.CURRENT_TRACE.set(trace)
+        try:
+            await storage.insert_event(event_record('A'))
+            await storage.load_events()
+        finally:
+            bot_py.CURRENT_TRACE.reset(token)
+            await storage.close()
+        assert trace.storage_calls == 2
+        assert trace.storage_seconds > 0
+
+    run_in_tempdir(scenario)